@@ -16,7 +16,7 @@ sys.path.append(os.path.join(project_root, "utils"))
 sys.path.append(os.path.join(project_root, "phase1_clone_and_detect"))
 sys.path.append(os.path.join(project_root, "phase3_build_and_compile"))
 sys.path.append(os.path.join(project_root, "phase4_sonar_scan"))
-# Later we'll add phase5_autofix path here
+sys.path.append(os.path.join(project_root, "phase5_autofix"))
 
 # Import modules
 from config_manager import ConfigManager
@@ -24,6 +24,8 @@ import clone_repo
 import detect_tech_stack
 import build_project
 import sonar_scanner
+import scan_scheduler
+import ollama_session
 
 # Setup logger
 logging.basicConfig(
@@ -31,58 +33,131 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
-if __name__ == "__main__":
-    config = ConfigManager()
+def prepare_repo(config, repo):
+    """Phases 1-3 (clone, tech stack detection, build); returns the local repo path or None."""
+    state = config.state
+    repo_url = repo['repo_url']
+    clone_path = repo['local_clone_path']
+    api_token = repo.get('api_token', '')
 
-    for repo in config.get_enabled_repos():
-        repo_url = repo['repo_url']
-        clone_path = repo['local_clone_path']
-        api_token = repo.get('api_token', '')
+    repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
+    full_repo_path = os.path.join(clone_path, repo_name)
 
-        repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
-        full_repo_path = os.path.join(clone_path, repo_name)
+    logging.info(f"\n===== Processing Repo: {repo_url} =====")
 
-        logging.info(f"\n===== Processing Repo: {repo_url} =====")
-
-        # PHASE 1 — Clone
-        try:
+    # PHASE 1 — Clone
+    try:
+        with state.phase(repo_url, 'clone'):
             if not os.path.exists(clone_path):
                 os.makedirs(clone_path)
             clone_repo.clone_repo(repo_url, clone_path)
-        except Exception as e:
-            logging.error(f"Skipping repo due to clone failure: {e}")
-            continue
+    except Exception as e:
+        logging.error(f"Skipping repo due to clone failure: {e}")
+        return None
 
-        # PHASE 2 — Tech stack detection
-        try:
+    # PHASE 2 — Tech stack detection
+    try:
+        with state.phase(repo_url, 'detect'):
             final_stack = detect_tech_stack.detect_tech_stack(
                 repo_url, full_repo_path, api_token
             )
-            logging.info(f"Detected Tech Stack: {final_stack}")
-            config.update_repo_entry(repo_url, 'detected_tech_stack', final_stack)
-        except Exception as e:
-            logging.error(f"Skipping repo due to detection failure: {e}")
-            continue
+        logging.info(f"Detected Tech Stack: {final_stack}")
+        config.update_repo_entry(repo_url, 'detected_tech_stack', final_stack)
+    except Exception as e:
+        logging.error(f"Skipping repo due to detection failure: {e}")
+        return None
 
-        # PHASE 3 — Build
-        try:
+    # PHASE 3 — Build
+    try:
+        with state.phase(repo_url, 'build'):
             build_project.run_build_for_repo(repo)
+    except Exception as e:
+        logging.error(f"Build failed for {repo_url}: {e}")
+        return None  # optional: allow sonar scan even if build failed
+    return full_repo_path
+
+
+if __name__ == "__main__":
+    config = ConfigManager()
+    # Phase results and timings go to the run-state store, config.yaml is only read
+    state = config.state
+
+    # Warm the local model while phases 1-4 run; keep_alive keeps it loaded for the analyzer run
+    session = ollama_session.start_preload(config.config)
+
+    # Pipelined mode: each scanned repo is handed to the autofix stage while later repos are cloned and scanned
+    import sonar_summary_reporter
+    pipeline = None
+    if (config.config.get('pipeline') or {}).get('enabled', False):
+        import autofix_pipeline
+        pipeline = autofix_pipeline.AutofixPipeline(config.config)
+        pipeline.start()
+
+    def hand_off(repo, full_repo_path):
+        """Record the scanned commit and, in pipelined mode, pass the repo on to autofix."""
+        config.update_repo_entry(repo['repo_url'], 'last_commit_scanned', clone_repo.get_head_commit(full_repo_path))
+        if not pipeline:
+            return
+        try:
+            normalized_file = sonar_summary_reporter.normalize_repo_snapshot(repo, config.config)
         except Exception as e:
-            logging.error(f"Build failed for {repo_url}: {e}")
-            continue  # optional: allow sonar scan even if build failed
+            logging.error(f"Normalization failed for {repo['repo_url']}: {e}")
+            return
+        if normalized_file:
+            pipeline.submit(repo, normalized_file)
+
+    # Parallel scans: scanners overlap with the server processing earlier reports, results arrive as each finishes
+    scheduler = None
+    if scan_scheduler.scheduler_enabled(config.config):
+        scanned = {}
+
+        def on_scanned(repo_name, error, timings):
+            repo, full_repo_path = scanned[repo_name]
+            state.record_phase(repo['repo_url'], 'sonar_scan', 'failed' if error else 'ok',
+                               sum(timings.values()) - timings.get('ce_execution', 0),
+                               stages={k: round(v, 3) for k, v in timings.items()},
+                               **({'error': str(error)} if error else {}))
+            if not error:
+                hand_off(repo, full_repo_path)
+
+        scheduler = scan_scheduler.ScanScheduler(config.config, on_done=on_scanned)
+
+    for repo in config.get_enabled_repos():
+        repo_url = repo['repo_url']
+        repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
+        full_repo_path = prepare_repo(config, repo)
+        if not full_repo_path:
+            continue
 
         # PHASE 4 — Initial Sonar Scan
+        if scheduler:
+            scanned[repo_name] = (repo, full_repo_path)
+            scheduler.submit(full_repo_path, repo_name)
+            continue
         try:
-            sonar_scanner.run_full_sonar_pipeline(
-                full_repo_path, repo_name, config.config
-            )
+            with state.phase(repo_url, 'sonar_scan'):
+                sonar_scanner.run_full_sonar_pipeline(
+                    full_repo_path, repo_name, config.config
+                )
         except Exception as e:
             logging.error(f"Sonar phase failed for {repo_url}: {e}")
             continue
+
+        # PHASE 5 — Hand off to autofix (pipelined mode only)
+        hand_off(repo, full_repo_path)
         
     
     # After all repos processed:
-    sys.path.append(os.path.join(project_root, "phase4_sonar_scan"))
-    import sonar_summary_reporter
-    sonar_summary_reporter.run_summary()
+    if scheduler:
+        scheduler.close()
+    if pipeline:
+        # Repos were normalized as they finished scanning
+        sonar_summary_reporter.print_console_summary()
+        sonar_summary_reporter.write_excel_report(config.config)
+        pipeline.close()
+    else:
+        sonar_summary_reporter.run_summary()
+    if session:
+        session.wait_ready()
+        logging.info(f"🧠 Local model preload: {session.stats()}")
     logging.info("✅ Full Orchestration Run Completed.")
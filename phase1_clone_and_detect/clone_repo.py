@@ -33,6 +33,13 @@ def clone_repo(repo_url, clone_path):
         sys.exit(1)
 
 
+def get_head_commit(repo_path):
+    try:
+        return git.Repo(repo_path).head.commit.hexsha
+    except Exception as e:
+        logging.warning(f"Could not read HEAD commit of {repo_path}: {e}")
+        return None
+
 
 # should only be used for testing as standalone, else use master script
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs several sonar-scanner processes at once, sized to the CPU and memory
+available for their JVMs. A scanner slot is freed as soon as its report is
+uploaded, so the next repo is scanned while the server processes the last one.
+"""
+
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+import requests
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(project_root, "../utils"))
+from config_manager import ConfigManager
+
+sys.path.append(project_root)
+import sonar_scanner
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+DEFAULT_SLOTS_DIR = os.path.join("results", "sonar_scanner_slots")
+
+# ==== RESOURCE SIZING ====
+
+def available_memory_mb():
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        # No MemAvailable (macOS): assume half of physical memory is free
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024) // 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def scanner_slots(settings):
+    """Number of scanner JVMs that fit in the configured cap, CPU count and free memory."""
+    slots = settings.get('max_parallel_scans', 2)
+    slots = min(slots, max(1, (os.cpu_count() or 1) // settings.get('cpus_per_scan', 2)))
+    memory = available_memory_mb()
+    if memory:
+        slots = min(slots, max(1, memory // settings.get('jvm_memory_mb', 2048)))
+    return max(1, slots)
+
+# ==== SCHEDULER ====
+
+class ScanScheduler:
+    """Scan -> server processing -> snapshot fetch, with the scan stage on a bounded pool.
+
+    `submit` returns immediately. `on_done(repo_name, error, timings)` is
+    called from a worker thread as each repo's snapshot is stored (error is
+    None) or its scan fails.
+    """
+
+    def __init__(self, config, on_done=None):
+        self.config = config
+        self.settings = config['sonarqube'].get('scheduler', {}) or {}
+        self.on_done = on_done
+        self.slots = scanner_slots(self.settings)
+        self.slot_ids = queue.Queue()
+        for slot in range(self.slots):
+            self.slot_ids.put(slot)
+        self.scan_pool = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="sonar-scan")
+        # Waiting on the server is cheap, so reports are never held back behind scans
+        self.post_pool = ThreadPoolExecutor(max_workers=self.slots * 2, thread_name_prefix="sonar-ce")
+        self.lock = threading.Lock()
+        self.counts = {'queued': 0, 'scanning': 0, 'processing': 0, 'fetching': 0, 'done': 0, 'failed': 0}
+        self.timings = defaultdict(list)
+        self.pending = []
+        logging.info(f"🧮 Sonar scan scheduler: {self.slots} parallel scanner(s)")
+
+    def _move(self, before, after):
+        with self.lock:
+            if before:
+                self.counts[before] -= 1
+            self.counts[after] += 1
+
+    def _slot_env(self, slot):
+        env = dict(os.environ)
+        env['SONAR_SCANNER_OPTS'] = f"-Xmx{self.settings.get('jvm_memory_mb', 2048)}m"
+        # Each slot gets its own scanner cache, because forceCleanCache would wipe a shared one mid-scan
+        env['SONAR_USER_HOME'] = os.path.abspath(os.path.join(
+            self.settings.get('slots_dir') or DEFAULT_SLOTS_DIR, f"slot-{slot}"))
+        return env
+
+    def submit(self, repo_path, repo_name):
+        self._move(None, 'queued')
+        future = self.scan_pool.submit(self._scan, repo_path, repo_name, time.monotonic())
+        with self.lock:
+            self.pending.append(future)
+        return future
+
+    def _finish(self, repo_name, error, timings):
+        self._move(None, 'failed' if error else 'done')
+        with self.lock:
+            for stage, seconds in timings.items():
+                self.timings[stage].append(seconds)
+        if error:
+            logging.error(f"❌ Sonar phase failed for {repo_name}: {error}")
+        else:
+            logging.info(f"✅ {repo_name} scanned: " + ", ".join(f"{k} {v:.1f}s" for k, v in timings.items()))
+        if self.on_done:
+            try:
+                self.on_done(repo_name, error, timings)
+            except Exception as e:
+                logging.error(f"Scan completion handler failed for {repo_name}: {e}")
+
+    def _scan(self, repo_path, repo_name, submitted):
+        timings = {'queued': time.monotonic() - submitted}
+        self._move('queued', 'scanning')
+        slot = self.slot_ids.get()
+        start = time.monotonic()
+        try:
+            sonar_scanner.run_scanner(repo_path, repo_name, self.config, env=self._slot_env(slot))
+        except Exception as e:
+            with self.lock:
+                self.counts['scanning'] -= 1
+            self._finish(repo_name, e, timings)
+            return
+        finally:
+            self.slot_ids.put(slot)
+        timings['scan'] = time.monotonic() - start
+        self._move('scanning', 'processing')
+        future = self.post_pool.submit(self._collect, repo_path, repo_name, timings)
+        with self.lock:
+            self.pending.append(future)
+
+    def _collect(self, repo_path, repo_name, timings):
+        stage = 'processing'
+        try:
+            start = time.monotonic()
+            task = sonar_scanner.wait_for_ce_task(repo_path, repo_name, self.config)
+            timings['ce'] = time.monotonic() - start
+            if task and task.get('executionTimeMs') is not None:
+                timings['ce_execution'] = task['executionTimeMs'] / 1000.0
+            self._move(stage, 'fetching')
+            stage = 'fetching'
+            start = time.monotonic()
+            sonar_scanner.fetch_and_store_raw_sonar_report(repo_name, self.config)
+            timings['fetch'] = time.monotonic() - start
+        except Exception as e:
+            with self.lock:
+                self.counts[stage] -= 1
+            self._finish(repo_name, e, timings)
+            return
+        with self.lock:
+            self.counts['fetching'] -= 1
+        self._finish(repo_name, None, timings)
+
+    def server_queue(self):
+        """Pending and in-progress background tasks on the Sonar server."""
+        sonar_config = self.config['sonarqube']
+        try:
+            response = requests.get(f"{sonar_config['server_url']}/api/ce/activity_status",
+                                    auth=(sonar_config['auth_token'], ''))
+            if response.status_code == 200:
+                data = response.json()
+                return {'pending': data.get('pending', 0), 'in_progress': data.get('inProgress', 0)}
+        except requests.RequestException:
+            pass
+        return {}
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            timings = {stage: list(values) for stage, values in self.timings.items() if values}
+        stages = {stage: {'avg_sec': round(sum(values) / len(values), 1), 'max_sec': round(max(values), 1)}
+                  for stage, values in timings.items()}
+        return dict(counts, slots=self.slots, server_queue=self.server_queue(), stages=stages)
+
+    def close(self):
+        """Wait until every submitted repo has been scanned and fetched."""
+        while True:
+            with self.lock:
+                pending = [f for f in self.pending if not f.done()]
+            if not pending:
+                break
+            for future in pending:
+                future.result()
+        self.scan_pool.shutdown()
+        self.post_pool.shutdown()
+        logging.info(f"📊 Sonar scan scheduler: {self.stats()}")
+
+
+def scheduler_enabled(config):
+    return (config['sonarqube'].get('scheduler', {}) or {}).get('enabled', False)
+
+
+if __name__ == "__main__":
+    config_mgr = ConfigManager()
+    config = config_mgr.config
+
+    scheduler = ScanScheduler(config)
+    for repo in config_mgr.get_enabled_repos():
+        repo_name = repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
+        scheduler.submit(os.path.join(repo['local_clone_path'], repo_name), repo_name)
+    scheduler.close()
+
+    import sonar_summary_reporter
+    sonar_summary_reporter.run_summary()
@@ -22,7 +22,8 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 
 shell_script = os.path.join(os.path.dirname(project_root), "run_sonar_scan.sh")
 
-def run_full_sonar_pipeline(repo_path, repo_name, config):
+def run_scanner(repo_path, repo_name, config, env=None):
+    """Create the project and run sonar-scanner; the report is then queued on the server."""
     sonar_config = config['sonarqube']
     server_url = sonar_config['server_url']
     auth_token = sonar_config['auth_token']
@@ -30,16 +31,68 @@ def run_full_sonar_pipeline(repo_path, repo_name, config):
 
     sonar_project_creator.create_sonar_project(server_url, auth_token, repo_name, repo_name)
 
+    # A report-task.txt left by an earlier run would point at an old task
+    report_task = report_task_path(repo_path)
+    if os.path.exists(report_task):
+        os.remove(report_task)
+
     user_shell = os.environ.get("SHELL", "/bin/bash")
     command = f"'{shell_script}' '{repo_path}' '{repo_name}' '{server_url}' '{auth_token}' '{scanner_path}'"
 
     try:
-        subprocess.run([user_shell, "-l", "-c", command], check=True)
+        subprocess.run([user_shell, "-l", "-c", command], check=True, env=env)
     except subprocess.CalledProcessError as e:
         logging.error(f"Sonar scan failed: {e}")
         raise
-    print("Sleeping 10 seconds to let sonar porject populated for repo - ", repo_name)
-    time.sleep(10)
+
+def report_task_path(repo_path):
+    return os.path.join(repo_path, ".scannerwork", "report-task.txt")
+
+def read_report_task(repo_path):
+    """Properties written by the scanner (ceTaskId, ceTaskUrl, dashboardUrl, ...)."""
+    task = {}
+    path = report_task_path(repo_path)
+    if not os.path.exists(path):
+        return task
+    with open(path, 'r') as f:
+        for line in f:
+            if '=' in line:
+                key, value = line.strip().split('=', 1)
+                task[key] = value
+    return task
+
+def wait_for_ce_task(repo_path, repo_name, config):
+    """Poll the server's background task for this scan until it has been processed.
+
+    Returns the task from /api/ce/task, or None when the scanner left no task id.
+    """
+    sonar_config = config['sonarqube']
+    task_id = read_report_task(repo_path).get('ceTaskId')
+    if not task_id:
+        logging.warning(f"⚠️ No report-task.txt for {repo_name}, waiting 10 seconds instead")
+        time.sleep(10)
+        return None
+
+    poll_sec = sonar_config.get('ce_poll_sec', 2)
+    deadline = time.monotonic() + sonar_config.get('ce_timeout_sec', 900)
+    auth = (sonar_config['auth_token'], '')
+    while True:
+        response = requests.get(f"{sonar_config['server_url']}/api/ce/task", auth=auth, params={'id': task_id})
+        if response.status_code != 200:
+            raise Exception(f"CE task lookup failed: {response.status_code} - {response.text}")
+        task = response.json()['task']
+        if task['status'] == 'SUCCESS':
+            return task
+        if task['status'] in ('FAILED', 'CANCELED'):
+            raise Exception(f"Sonar background task {task_id} {task['status']}: {task.get('errorMessage', '')}")
+        if time.monotonic() > deadline:
+            raise Exception(f"Sonar background task {task_id} still {task['status']} after timeout")
+        time.sleep(poll_sec)
+
+def run_full_sonar_pipeline(repo_path, repo_name, config):
+    run_scanner(repo_path, repo_name, config)
+    logging.info(f"⏳ Waiting for Sonar to process the report for repo - {repo_name}")
+    wait_for_ce_task(repo_path, repo_name, config)
     fetch_and_store_raw_sonar_report(repo_name, config)
 
 def fetch_and_store_raw_sonar_report(repo_name, config):
@@ -5,6 +5,7 @@ import os
 import sys
 import json
 import logging
+import requests
 from datetime import datetime
 from collections import defaultdict
 from openpyxl import Workbook
@@ -18,101 +19,223 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 
 global_stats = {}
 
-def process_full_snapshot_files(config):
-    sonar_config = config['sonarqube']
-    results_path = sonar_config['results_path']
-    repos = config['github']['repos']
+# Same filters as the full snapshot download, so both modes count the same issues
+ISSUE_FILTERS = {
+    'statuses': 'OPEN,CONFIRMED,REOPENED,RESOLVED,CLOSED',
+    'severities': 'INFO,MINOR,MAJOR,CRITICAL,BLOCKER',
+    'types': 'CODE_SMELL,BUG,VULNERABILITY',
+}
+ISSUE_TYPES = ['CODE_SMELL', 'BUG', 'VULNERABILITY']
+SUMMARY_MEASURES = ['bugs', 'vulnerabilities', 'code_smells', 'reliability_rating', 'sqale_rating',
+                    'security_rating', 'sqale_index', 'duplicated_lines_density', 'ncloc']
+# Sonar returns at most this many values per facet
+FACET_LIMIT = 100
 
-    for repo in repos:
+def process_full_snapshot_files(config):
+    for repo in config['github']['repos']:
         if not repo.get('enabled', False): continue
+        normalize_repo_snapshot(repo, config)
 
+def normalize_stale_snapshots(config):
+    """Normalize only repos whose latest full snapshot is newer than their latest normalized issues."""
+    for repo in config['github']['repos']:
+        if not repo.get('enabled', False): continue
         repo_name = repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
-        repo_results_dir = os.path.join(results_path, repo_name)
+        repo_results_dir = os.path.join(config['sonarqube']['results_path'], repo_name)
+        if not os.path.isdir(repo_results_dir): continue
+        snapshots = sorted(f for f in os.listdir(repo_results_dir) if f.endswith("_full_snapshot.json"))
+        normalized = sorted(f for f in os.listdir(repo_results_dir) if f.endswith("_normalized_issues.json"))
+        if snapshots and (not normalized or os.path.getmtime(os.path.join(repo_results_dir, snapshots[-1])) >
+                          os.path.getmtime(os.path.join(repo_results_dir, normalized[-1]))):
+            normalize_repo_snapshot(repo, config)
+
+def normalize_repo_snapshot(repo, config):
+    """Normalize the latest full snapshot of one repo; returns the normalized file path or None."""
+    sonar_config = config['sonarqube']
+    results_path = sonar_config['results_path']
 
-        latest_file = None
-        files = [f for f in os.listdir(repo_results_dir) if f.endswith("_full_snapshot.json")]
-        files.sort(reverse=True)
-        if files: latest_file = files[0]
+    repo_name = repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
+    repo_results_dir = os.path.join(results_path, repo_name)
+
+    latest_file = None
+    files = [f for f in os.listdir(repo_results_dir) if f.endswith("_full_snapshot.json")] \
+        if os.path.isdir(repo_results_dir) else []
+    files.sort(reverse=True)
+    if files: latest_file = files[0]
+
+    if not latest_file:
+        logging.warning(f"No full_snapshot found for repo {repo_name}")
+        return None
+
+    file_path = os.path.join(repo_results_dir, latest_file)
+    with open(file_path, 'r') as f:
+        raw_data = json.load(f)
+
+    issues = raw_data.get("issues", [])
+    hotspots = raw_data.get("hotspots", [])
+
+    # For normalization output
+    normalized_issues = []
+    file_issue_map = defaultdict(lambda: defaultdict(int))
+    maintainability = reliability = security = other = 0
+    issues_count = 0
+
+    # Normalize Issues
+    for issue in issues:
+        component = issue.get("component", "")
+        file_path_str = component.split(":", 1)[-1]
+        issue_type = issue.get('type')
+
+        norm_issue = {
+            "file": file_path_str,
+            "line": issue.get("line"),
+            "rule": issue.get("rule"),
+            "severity": issue.get("severity"),
+            "message": issue.get("message"),
+            "type": issue_type,
+            "source": "issues",
+            "impacts": issue.get("impacts", [])
+        }
+        normalized_issues.append(norm_issue)
+
+        file_issue_map[file_path_str][issue_type] += 1
+        issues_count += 1
+
+        for impact in issue.get("impacts", []):
+            quality = impact.get("softwareQuality", "")
+            if quality == "MAINTAINABILITY": maintainability += 1
+            elif quality == "RELIABILITY": reliability += 1
+            elif quality == "SECURITY": security += 1
+            else: other += 1
+
+    # Normalize Hotspots
+    for hotspot in hotspots:
+        component = hotspot.get("component", "")
+        file_path_str = component.split(":", 1)[-1]
+
+        norm_hotspot = {
+            "file": file_path_str,
+            "line": hotspot.get("line"),
+            "rule": hotspot.get("ruleKey"),
+            "severity": hotspot.get("vulnerabilityProbability"),
+            "message": hotspot.get("message"),
+            "type": "SECURITY_HOTSPOT",
+            "source": "hotspots"
+        }
+        normalized_issues.append(norm_hotspot)
+        file_issue_map[file_path_str]["SECURITY_HOTSPOT"] += 1
 
-        if not latest_file:
-            logging.warning(f"No full_snapshot found for repo {repo_name}")
-            continue
+    # Store normalized issues file
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    normalized_file_path = os.path.join(repo_results_dir, f"{timestamp}_normalized_issues.json")
+    with open(normalized_file_path, 'w') as f_out:
+        json.dump(normalized_issues, f_out, indent=2)
+    logging.info(f"✅ Normalized issues stored at: {normalized_file_path}")
+
+    # Store aggregated stats for console & excel
+    global_stats[repo_name] = {
+        "total_issues": issues_count,
+        "maintainability": maintainability,
+        "reliability": reliability,
+        "security": security,
+        "other": other,
+        "hotspots": len(hotspots),
+        "files": file_issue_map
+    }
+    return normalized_file_path
+
+# ==== FACET SUMMARY MODE ====
+
+def sonar_get(session, server_url, endpoint, params):
+    response = session.get(f"{server_url}{endpoint}", params=params)
+    if response.status_code != 200:
+        raise Exception(f"{endpoint} failed: {response.status_code} - {response.text}")
+    return response.json()
+
+def facet_values(data, name):
+    for facet in data.get('facets', []):
+        if facet.get('property') == name:
+            return {v['val']: v['count'] for v in facet.get('values', [])}
+    return {}
+
+def fetch_facet_stats(session, sonar_config, repo_name):
+    """Aggregates for one repo from issue facets, with page size 1 so no issues are downloaded.
+
+    One call for the type/severity/quality/directory facets and one `files`
+    facet call per issue type, plus one call for the hotspot count.
+    """
+    server_url = sonar_config['server_url']
+    base = dict(ISSUE_FILTERS, componentKeys=repo_name, ps=1)
+    data = sonar_get(session, server_url, "/api/issues/search",
+                     dict(base, facets='types,severities,impactSoftwareQualities,directories'))
+    qualities = facet_values(data, 'impactSoftwareQualities')
+
+    files = defaultdict(lambda: defaultdict(int))
+    for issue_type in ISSUE_TYPES:
+        by_file = facet_values(sonar_get(session, server_url, "/api/issues/search",
+                                         dict(base, types=issue_type, facets='files')), 'files')
+        if len(by_file) >= FACET_LIMIT:
+            logging.warning(f"{repo_name}: {issue_type} file breakdown limited to the top {FACET_LIMIT} files")
+        for file_key, count in by_file.items():
+            files[file_key.split(":", 1)[-1]][issue_type] += count
+
+    # Hotspots have no facets; the paging total is all we need
+    hotspots = session.get(f"{server_url}/api/hotspots/search", params={'projectKey': repo_name, 'ps': 1},
+                           auth=(sonar_config['admin_username'], sonar_config['admin_password']))
+    hotspot_total = hotspots.json()['paging']['total'] if hotspots.status_code == 200 else 0
+
+    return {
+        "total_issues": data['paging']['total'],
+        "maintainability": qualities.get('MAINTAINABILITY', 0),
+        "reliability": qualities.get('RELIABILITY', 0),
+        "security": qualities.get('SECURITY', 0),
+        "other": 0,
+        "hotspots": hotspot_total,
+        "files": files,
+        "types": facet_values(data, 'types'),
+        "severities": facet_values(data, 'severities'),
+        "directories": facet_values(data, 'directories'),
+    }
+
+def fetch_measures(session, sonar_config, repo_names):
+    """Project measures for every repo in one call per 100 projects."""
+    measures = defaultdict(dict)
+    for i in range(0, len(repo_names), 100):
+        data = sonar_get(session, sonar_config['server_url'], "/api/measures/search",
+                         {'projectKeys': ",".join(repo_names[i:i + 100]), 'metricKeys': ",".join(SUMMARY_MEASURES)})
+        for measure in data.get('measures', []):
+            measures[measure['component']][measure['metric']] = measure.get('value')
+    return measures
+
+def process_facet_summaries(config, repo_names=None):
+    """Fill global_stats from Sonar's server-side aggregation instead of full snapshots."""
+    sonar_config = config['sonarqube']
+    repo_names = repo_names or [repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
+                                for repo in config['github']['repos'] if repo.get('enabled', False)]
+    session = requests.Session()
+    session.auth = (sonar_config['auth_token'], '')
 
-        file_path = os.path.join(repo_results_dir, latest_file)
-        with open(file_path, 'r') as f:
-            raw_data = json.load(f)
-
-        issues = raw_data.get("issues", [])
-        hotspots = raw_data.get("hotspots", [])
-
-        # For normalization output
-        normalized_issues = []
-        file_issue_map = defaultdict(lambda: defaultdict(int))
-        maintainability = reliability = security = other = 0
-        issues_count = 0
-
-        # Normalize Issues
-        for issue in issues:
-            component = issue.get("component", "")
-            file_path_str = component.split(":", 1)[-1]
-            issue_type = issue.get('type')
-
-            norm_issue = {
-                "file": file_path_str,
-                "line": issue.get("line"),
-                "rule": issue.get("rule"),
-                "severity": issue.get("severity"),
-                "message": issue.get("message"),
-                "type": issue_type,
-                "source": "issues",
-                "impacts": issue.get("impacts", [])
-            }
-            normalized_issues.append(norm_issue)
-
-            file_issue_map[file_path_str][issue_type] += 1
-            issues_count += 1
-
-            for impact in issue.get("impacts", []):
-                quality = impact.get("softwareQuality", "")
-                if quality == "MAINTAINABILITY": maintainability += 1
-                elif quality == "RELIABILITY": reliability += 1
-                elif quality == "SECURITY": security += 1
-                else: other += 1
-
-        # Normalize Hotspots
-        for hotspot in hotspots:
-            component = hotspot.get("component", "")
-            file_path_str = component.split(":", 1)[-1]
-
-            norm_hotspot = {
-                "file": file_path_str,
-                "line": hotspot.get("line"),
-                "rule": hotspot.get("ruleKey"),
-                "severity": hotspot.get("vulnerabilityProbability"),
-                "message": hotspot.get("message"),
-                "type": "SECURITY_HOTSPOT",
-                "source": "hotspots"
-            }
-            normalized_issues.append(norm_hotspot)
-            file_issue_map[file_path_str]["SECURITY_HOTSPOT"] += 1
-
-        # Store normalized issues file
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        normalized_file_path = os.path.join(repo_results_dir, f"{timestamp}_normalized_issues.json")
-        with open(normalized_file_path, 'w') as f_out:
-            json.dump(normalized_issues, f_out, indent=2)
-        logging.info(f"✅ Normalized issues stored at: {normalized_file_path}")
-
-        # Store aggregated stats for console & excel
-        global_stats[repo_name] = {
-            "total_issues": issues_count,
-            "maintainability": maintainability,
-            "reliability": reliability,
-            "security": security,
-            "other": other,
-            "hotspots": len(hotspots),
-            "files": file_issue_map
-        }
+    measures = fetch_measures(session, sonar_config, repo_names)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    for repo_name in repo_names:
+        try:
+            stats = fetch_facet_stats(session, sonar_config, repo_name)
+        except Exception as e:
+            logging.error(f"Facet summary failed for {repo_name}: {e}")
+            continue
+        stats['measures'] = measures.get(repo_name, {})
+        global_stats[repo_name] = stats
+
+        # Kept next to the snapshots so later runs can diff against it
+        repo_results_dir = os.path.join(sonar_config['results_path'], repo_name)
+        os.makedirs(repo_results_dir, exist_ok=True)
+        previous = sorted(f for f in os.listdir(repo_results_dir) if f.endswith("_facet_summary.json"))
+        summary_path = os.path.join(repo_results_dir, f"{timestamp}_facet_summary.json")
+        with open(summary_path, 'w') as f_out:
+            json.dump({k: v for k, v in stats.items() if k != 'files'}, f_out, indent=2)
+        if previous:
+            with open(os.path.join(repo_results_dir, previous[-1]), 'r') as f:
+                stats['previous'] = json.load(f)
 
 def print_console_summary():
     logging.info("\n=========== SONAR SUMMARY ===========")
@@ -125,6 +248,12 @@ def print_console_summary():
         logging.info(f"  Other impacts: {stats['other']}")
         logging.info(f"  Security Hotspots: {stats['hotspots']}")
         logging.info(f"  Unique Files with Issues: {len(stats['files'])}")
+        if stats.get('measures'):
+            logging.info(f"  Measures: {stats['measures']}")
+        if stats.get('previous'):
+            before = stats['previous']
+            logging.info(f"  Change since last summary: issues {stats['total_issues'] - before['total_issues']:+d}, "
+                         f"hotspots {stats['hotspots'] - before['hotspots']:+d}")
     logging.info("\n=====================================")
 
 def write_excel_report(config):
@@ -146,6 +275,8 @@ def write_excel_report(config):
         ws_overview.append(["Other impacts", stats['other']])
         ws_overview.append(["Security Hotspots", stats['hotspots']])
         ws_overview.append(["Unique Files with Issues", len(stats['files'])])
+        for metric, value in sorted(stats.get('measures', {}).items()):
+            ws_overview.append([metric, value])
 
         ws_details = wb.create_sheet(title=f"{repo}-D")
         headers = ["File Path", "File Name", "CODE_SMELL", "BUG", "VULNERABILITY", "SECURITY_HOTSPOT", "TOTAL"]
@@ -177,13 +308,21 @@ def write_excel_report(config):
     wb.save(excel_path)
     logging.info(f"\n✅ Excel report generated: {excel_path}")
 
-def run_summary():
+def run_summary(mode=None):
     config_mgr = ConfigManager()
     config = config_mgr.config
 
-    process_full_snapshot_files(config)
+    # 'facets' reads the dashboard and Excel figures from the server's aggregates and only
+    # normalizes snapshots that changed since their last normalization, since Phase 5 reads those
+    mode = mode or config['sonarqube'].get('summary_mode', 'full')
+    if mode == 'facets':
+        normalize_stale_snapshots(config)
+        process_facet_summaries(config)
+    else:
+        process_full_snapshot_files(config)
     print_console_summary()
     write_excel_report(config)
 
+# Usage: python sonar_summary_reporter.py [--facets]
 if __name__ == "__main__":
-    run_summary()
+    run_summary('facets' if '--facets' in sys.argv else None)
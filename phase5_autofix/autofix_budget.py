@@ -0,0 +1,150 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import usage_ledger
+from llm_dispatcher import estimate_tokens
+
+# ==== ISSUE WEIGHTS ====
+
+DEFAULT_SEVERITY_WEIGHTS = {'BLOCKER': 16, 'CRITICAL': 8, 'MAJOR': 4, 'MINOR': 2, 'INFO': 1}
+DEFAULT_TYPE_WEIGHTS = {'BUG': 3, 'VULNERABILITY': 3, 'CODE_SMELL': 1}
+
+# Marks work items refused by the budget, as opposed to files skipped for size
+DEFERRED = object()
+
+
+def budget_settings(config):
+    return config['autofix'].get('budget', {}) or {}
+
+
+def issue_weight(issue, severity_weights, type_weights):
+    return severity_weights.get(issue.get('severity'), 1) * type_weights.get(issue.get('type'), 1)
+
+
+def file_debt(issues, config):
+    settings = budget_settings(config)
+    severity_weights = dict(DEFAULT_SEVERITY_WEIGHTS, **(settings.get('severity_weights') or {}))
+    type_weights = dict(DEFAULT_TYPE_WEIGHTS, **(settings.get('type_weights') or {}))
+    return sum(issue_weight(i, severity_weights, type_weights) for i in issues)
+
+
+def unit_score(items, config):
+    """Weighted debt per estimated prompt token for a list of (path, full_path, content, issues)."""
+    debt = sum(file_debt(item[3], config) for item in items)
+    tokens = sum(estimate_tokens(item[2]) for item in items)
+    return debt / max(tokens, 1)
+
+
+def prioritize(units, config):
+    """Order (label, items) units by value per token, highest first."""
+    return sorted(units, key=lambda unit: unit_score(unit[1], config), reverse=True)
+
+# ==== RUN BUDGET ====
+
+class RunBudget:
+    """Token, cost and wall-clock limits for one analyzer run.
+
+    Spend is read from the usage ledger, counting only `repo`'s calls when
+    the budget is scoped to one repo. Estimated tokens of in-flight
+    requests are reserved so concurrent workers cannot overshoot together.
+    Once a request is refused the budget stays closed, so lower-priority
+    files are not squeezed in after higher-priority ones were dropped.
+    """
+
+    def __init__(self, max_tokens=None, max_cost=None, max_minutes=None, repo=None):
+        self.repo = repo
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.max_seconds = max_minutes * 60 if max_minutes else None
+        self.start = time.monotonic()
+        self.base_tokens, self.base_cost = usage_ledger.totals(repo)
+        self.reserved = 0
+        self.closed_reason = None
+        self.lock = threading.Lock()
+        self.repos = []
+
+    def spent(self):
+        tokens, cost = usage_ledger.totals(self.repo)
+        return tokens - self.base_tokens, cost - self.base_cost
+
+    def try_reserve(self, estimated_tokens):
+        """Reserve room for a request; returns None when allowed, else the reason it is not."""
+        with self.lock:
+            if self.closed_reason:
+                return self.closed_reason
+            tokens, cost = self.spent()
+            if self.max_tokens and tokens + self.reserved + estimated_tokens > self.max_tokens:
+                self.closed_reason = f"token budget {self.max_tokens} reached ({tokens} spent)"
+            elif self.max_cost and cost >= self.max_cost:
+                self.closed_reason = f"cost budget ${self.max_cost} reached (${cost:.2f} spent)"
+            elif self.max_seconds and time.monotonic() - self.start >= self.max_seconds:
+                self.closed_reason = f"time budget {self.max_seconds / 60:.0f} min reached"
+            if self.closed_reason:
+                logging.warning(f"🛑 Budget exhausted: {self.closed_reason}, remaining files are deferred")
+                return self.closed_reason
+            self.reserved += estimated_tokens
+            return None
+
+    def release(self, estimated_tokens):
+        with self.lock:
+            self.reserved -= estimated_tokens
+
+    def record_repo(self, repo_name, total_debt, addressed_debt, previous_debt, deferred_files):
+        tokens, cost = self.spent()
+        row = {
+            'Repo': repo_name,
+            'Total Debt': total_debt,
+            'Addressed This Run': addressed_debt,
+            'Addressed Earlier': previous_debt,
+            'Addressed %': round(100.0 * (addressed_debt + previous_debt) / total_debt, 1) if total_debt else 100.0,
+            'Deferred Files': deferred_files,
+            'Run Tokens So Far': tokens,
+            'Run Cost So Far': round(cost, 4),
+        }
+        self.repos.append(row)
+        logging.info(f"🎯 {repo_name}: addressed {row['Addressed %']}% of weighted debt "
+                     f"({addressed_debt} this run + {previous_debt} earlier of {total_debt}), "
+                     f"{deferred_files} file(s) deferred by budget")
+        return row
+
+
+_budget = None
+_budget_lock = threading.Lock()
+_scope = threading.local()
+
+
+def new_run_budget(config, repo=None):
+    settings = budget_settings(config)
+    if not settings.get('enabled', False):
+        return None
+    return RunBudget(settings.get('max_tokens'), settings.get('max_cost'), settings.get('max_minutes'), repo)
+
+
+@contextmanager
+def budget_scope(config, repo=None):
+    """Give this thread a fresh budget until the block exits, e.g. for one service job.
+
+    Without a scope, get_run_budget returns one budget shared by the whole process.
+    """
+    previous = getattr(_scope, 'budget', None)
+    _scope.budget = new_run_budget(config, repo)
+    try:
+        yield _scope.budget
+    finally:
+        _scope.budget = previous
+
+
+def get_run_budget(config):
+    """This thread's scoped budget if any, else the run-wide one; None when budgeted mode is off."""
+    global _budget
+    if not budget_settings(config).get('enabled', False):
+        return None
+    scoped = getattr(_scope, 'budget', None)
+    if scoped is not None:
+        return scoped
+    with _budget_lock:
+        if _budget is None:
+            _budget = new_run_budget(config)
+        return _budget
@@ -0,0 +1,105 @@
+import time
+import queue
+import logging
+import threading
+
+import sonar_ai_analyzer
+from result_store import open_result_store
+from ollama_session import start_preload
+
+# ==== SCAN -> AUTOFIX HAND-OFF ====
+
+DEFAULT_MAX_PENDING_REPOS = 2
+# How often a blocked hand-off checks that the autofix thread is still alive
+PUT_POLL_SEC = 1.0
+
+_STOP = object()
+
+
+def pipeline_settings(config):
+    return config.get('pipeline', {}) or {}
+
+
+def pipeline_enabled(config):
+    return pipeline_settings(config).get('enabled', False)
+
+
+class AutofixPipeline:
+    """Runs Phase 5 on a background thread, fed one repo at a time as its scan finishes.
+
+    The hand-off queue is bounded: once `max_pending_repos` scanned repos are
+    waiting, `submit` blocks so scanning cannot run far ahead of the LLM stage.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.max_pending = int(pipeline_settings(config).get('max_pending_repos', DEFAULT_MAX_PENDING_REPOS))
+        self.queue = queue.Queue(maxsize=max(1, self.max_pending))
+        self.summaries = {}
+        self.timings = {'submit_wait_sec': 0.0, 'idle_sec': 0.0, 'repos_fixed': 0, 'repos_failed': 0}
+        self.thread = None
+
+    def start(self):
+        # Preload on the config Phase 5 reads (ConfigManager shares one dict per config path),
+        # so its session is the one reused
+        self.session = start_preload(sonar_ai_analyzer.config)
+        self.thread = threading.Thread(target=self._run, name="autofix-pipeline")
+        self.thread.start()
+        logging.info(f"🔗 Autofix pipeline started (max {self.max_pending} scanned repo(s) waiting)")
+
+    def _put(self, item):
+        """Queue an item; False once the autofix thread is gone, instead of blocking forever."""
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=PUT_POLL_SEC)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def submit(self, repo, normalized_file):
+        start = time.monotonic()
+        if self.queue.full():
+            logging.info(f"⏸️ Autofix stage is behind, waiting to hand off {normalized_file}")
+        handed_off = self._put((repo, normalized_file))
+        self.timings['submit_wait_sec'] += time.monotonic() - start
+        if not handed_off:
+            logging.error(f"❌ Autofix pipeline has stopped, {normalized_file} was not handed off")
+        return handed_off
+
+    def _run(self):
+        analyzer_config = sonar_ai_analyzer.config
+        store = None
+        try:
+            backend = analyzer_config['backend']['type']
+            variants = sonar_ai_analyzer.get_compare_variants(analyzer_config)
+            store = open_result_store(analyzer_config['database'])
+            while True:
+                start = time.monotonic()
+                job = self.queue.get()
+                self.timings['idle_sec'] += time.monotonic() - start
+                if job is _STOP:
+                    break
+                repo, normalized_file = job
+                logging.info(f"🔗 Autofix picked up {normalized_file} ({self.queue.qsize()} waiting)")
+                try:
+                    repo_name, summaries = sonar_ai_analyzer.analyze_repository(repo, store, backend, variants)
+                    if summaries:
+                        self.summaries[repo_name] = summaries
+                    self.timings['repos_fixed'] += 1
+                except Exception as e:
+                    # Keep consuming, otherwise the scan side would block on a full queue forever
+                    self.timings['repos_failed'] += 1
+                    logging.error(f"❌ Autofix failed for {repo['repo_url']}: {e}")
+        except Exception as e:
+            # submit and close notice the thread is gone and stop waiting on the queue
+            logging.error(f"❌ Autofix pipeline stopped: {e}")
+        finally:
+            if store is not None:
+                sonar_ai_analyzer.finish_analysis(self.summaries, store, self.session)
+
+    def close(self):
+        """Wait for every submitted repo to be fixed, then write the combined summary."""
+        self._put(_STOP)
+        self.thread.join()
+        logging.info(f"🔗 Autofix pipeline finished: {self.timings}")
@@ -0,0 +1,217 @@
+import os
+import copy
+import socket
+import logging
+import argparse
+import threading
+
+import sonar_ai_analyzer
+from sonar_ai_analyzer import (calculate_repo_summary, get_latest_normalized_file, load_issues_by_file,
+                               run_llm_for_file, insert_or_update_record, save_fixed_file)
+from result_store import open_result_store
+from job_queue import open_job_queue, LeaseKeeper, DEFAULT_LEASE_SEC, DEFAULT_MAX_ATTEMPTS
+from rule_prefixers import apply_prefixers
+from llm_dispatcher import get_backend_concurrency
+
+# ==== DISTRIBUTED AUTOFIX WORKERS ====
+
+DEFAULT_POLL_SEC = 10
+
+
+def queue_settings(config):
+    return config.get('work_queue', {}) or {}
+
+
+def repo_name_of(repo):
+    return repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
+
+
+def enqueue_repository(repo, store, queue, backend, config):
+    """Queue one job per file that still needs a fix; returns how many were added or re-queued."""
+    repo_name = repo_name_of(repo)
+    records = store.load_repo_records(repo_name, [backend])
+    _, issues_by_file, summary = calculate_repo_summary(repo, store, config, backend, records)
+    if issues_by_file is None:
+        logging.error(f"❌ No normalized file found for {repo_name}, nothing queued")
+        return 0
+    jobs = [{'repo_name': repo_name, 'repo_url': repo['repo_url'], 'file_path': row['File Path'], 'backend': backend}
+            for row in summary if row['Action'] == 'Process']
+    added = queue.enqueue(jobs)
+    logging.info(f"📬 {repo_name}: {added} job(s) queued or re-queued ({len(jobs)} file(s) need fixing)")
+    return added
+
+
+class AutofixWorker:
+    """Claims leased file jobs and fixes them; results are written only while the lease is held."""
+
+    def __init__(self, config, backend, owner, store, queue):
+        settings = queue_settings(config)
+        self.config = config
+        self.backend = backend
+        self.owner = owner
+        self.store = store
+        self.queue = queue
+        self.lease_sec = settings.get('lease_sec', DEFAULT_LEASE_SEC)
+        self.max_attempts = settings.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+        self.poll_sec = settings.get('poll_sec', DEFAULT_POLL_SEC)
+        self.repos = {repo_name_of(r): r for r in config['github']['repos']}
+        self.issues = {}
+        self.issues_lock = threading.Lock()
+        self.stats = {'done': 0, 'failed': 0, 'stale': 0}
+
+    def repo_issues(self, repo):
+        repo_name = repo_name_of(repo)
+        with self.issues_lock:
+            if repo_name not in self.issues:
+                normalized = get_latest_normalized_file(
+                    os.path.join(self.config['sonarqube']['results_path'], repo_name))
+                self.issues[repo_name] = load_issues_by_file(normalized) if normalized else {}
+            return self.issues[repo_name]
+
+    def fix(self, job):
+        """Return (code, raw_output, model_details, original_content) or None when there is nothing to send."""
+        repo = self.repos[job['repo_name']]
+        full_path = os.path.join(repo['local_clone_path'], job['repo_name'], job['file_path'])
+        issues = self.repo_issues(repo).get(job['file_path'])
+        if not issues or not os.path.exists(full_path):
+            return None
+        with open(full_path, 'r') as f:
+            original = f.read()
+
+        prefix_config = self.config['autofix'].get('prefixers', {}) or {}
+        content, remaining = original, issues
+        if prefix_config.get('enabled', True):
+            content, remaining, handled = apply_prefixers(job['file_path'], original, issues, prefix_config.get('rules'))
+            if handled and not remaining:
+                rules_fixed = sorted({i['rule'] for i in handled})
+                return (content, f"[rule prefixers] fixed {len(handled)} issue(s): {', '.join(rules_fixed)}",
+                        {"model": "rule-prefixers", "source": "rules", "output_mode": "rules",
+                         "rules_fixed": rules_fixed}, original)
+
+        result = run_llm_for_file(content, job['file_path'], remaining, self.backend, self.config)
+        if result is None:
+            return None
+        code, raw_output, model_details = result
+        return code, raw_output, dict(model_details, worker=self.owner), original
+
+    def write(self, job, outcome):
+        code, raw_output, model_details, original = outcome
+        repo = self.repos[job['repo_name']]
+        issues = self.repo_issues(repo)[job['file_path']]
+        writer = self.store.writer(batch_size=1)
+        insert_or_update_record(writer, job['repo_name'], job['file_path'], issues, self.backend,
+                                code, raw_output, model_details, original)
+        writer.flush()
+        if code:
+            save_fixed_file(os.path.join(repo['local_clone_path'], job['repo_name'], job['file_path']),
+                            code, self.backend, self.config)
+
+    def run_one(self, job):
+        job_id = job['job_id']
+        logging.info(f"🔧 [{self.owner}] Claimed {job_id} (attempt {job['attempts']})")
+        try:
+            with LeaseKeeper(self.queue, job_id, self.owner, self.lease_sec) as keeper:
+                outcome = self.fix(job)
+            # Fence: only the current lease holder may write, a reclaimed job belongs to its new owner
+            if keeper.lost or not self.queue.heartbeat(job_id, self.owner, self.lease_sec):
+                self.stats['stale'] += 1
+                logging.warning(f"⚠️ [{self.owner}] Lease on {job_id} expired, dropping result")
+                return
+            if outcome is None:
+                self.queue.complete(job_id, self.owner, 'failed', 'file missing, no issues or too large')
+                self.stats['failed'] += 1
+                return
+            self.write(job, outcome)
+            status = 'done' if outcome[0] else 'failed'
+            self.queue.complete(job_id, self.owner, status, None if outcome[0] else 'no usable fix')
+            self.stats[status] += 1
+        except Exception as e:
+            retry = job['attempts'] < self.max_attempts
+            logging.error(f"❌ [{self.owner}] Job {job_id} failed{', will retry' if retry else ''}: {e}")
+            self.queue.complete(job_id, self.owner, 'pending' if retry else 'failed', str(e))
+            if not retry:
+                self.stats['failed'] += 1
+
+    def run(self, exit_when_idle=False, stop=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.queue.reap(self.max_attempts)
+            job = self.queue.claim(self.owner, self.backend, self.lease_sec, self.max_attempts)
+            if job is None:
+                if exit_when_idle:
+                    break
+                stop.wait(self.poll_sec)
+                continue
+            self.run_one(job)
+        logging.info(f"🏁 [{self.owner}] Worker stopped: {self.stats}")
+        return self.stats
+
+
+def worker_config(config, args):
+    """Per-process overrides so workers on different hosts can point at their own model servers."""
+    config = copy.deepcopy(config)
+    if args.ollama_host:
+        config['autofix']['ollama_host'] = args.ollama_host
+    if args.model:
+        config['autofix']['model'] = args.model
+    if args.deployment:
+        config['azure']['deployment'] = args.deployment
+    return config
+
+
+def run_workers(config, backend, threads, exit_when_idle=False, name=None):
+    store = open_result_store(config['database'])
+    queue = open_job_queue(config['database'])
+    base = name or f"{socket.gethostname()}-{os.getpid()}"
+    stop = threading.Event()
+    workers = [AutofixWorker(config, backend, f"{base}-{i}", store, queue) for i in range(threads)]
+    pool = [threading.Thread(target=w.run, args=(exit_when_idle, stop), name=w.owner) for w in workers]
+    for thread in pool:
+        thread.start()
+    try:
+        for thread in pool:
+            while thread.is_alive():
+                thread.join(1.0)
+    except KeyboardInterrupt:
+        # In-flight jobs finish; anything left leased expires and is reclaimed by other workers
+        logging.info("🛑 Stopping workers after their current job...")
+        stop.set()
+        for thread in pool:
+            thread.join()
+    queue.close()
+    store.close()
+
+
+# Usage:
+#   python autofix_worker.py enqueue [--backend azure]
+#   python autofix_worker.py work [--backend local] [--threads 2] [--ollama-host http://gpu2:11434] [--until-idle]
+#   python autofix_worker.py status
+if __name__ == "__main__":
+    config = sonar_ai_analyzer.config
+    parser = argparse.ArgumentParser(description="Distributed autofix work queue")
+    parser.add_argument('command', choices=['enqueue', 'work', 'status'])
+    parser.add_argument('--backend', default=config['backend']['type'])
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--name')
+    parser.add_argument('--ollama-host')
+    parser.add_argument('--model')
+    parser.add_argument('--deployment')
+    parser.add_argument('--until-idle', action='store_true', help="exit once no job is available")
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        store = open_result_store(config['database'])
+        queue = open_job_queue(config['database'])
+        total = sum(enqueue_repository(repo, store, queue, args.backend, config)
+                    for repo in config['github']['repos'] if repo.get('enabled', True))
+        logging.info(f"📬 {total} job(s) queued, queue now: {queue.counts()}")
+        queue.close()
+        store.close()
+    elif args.command == 'status':
+        queue = open_job_queue(config['database'])
+        print(queue.counts())
+        queue.close()
+    else:
+        local_config = worker_config(config, args)
+        threads = args.threads or get_backend_concurrency(args.backend, local_config)
+        run_workers(local_config, args.backend, threads, args.until_idle, args.name)
@@ -0,0 +1,126 @@
+import re
+import threading
+from collections import defaultdict
+
+from prompt_batcher import fence_language
+
+# ==== FENCED CODE EXTRACTION ====
+
+FENCE_OPEN = re.compile(r"^\s*(```|~~~)\s*([\w+#.-]*)")
+
+# Fence tags models use for the same language
+LANGUAGE_ALIASES = {
+    'py': 'python', 'python3': 'python', 'yml': 'yaml', 'sh': 'bash', 'shell': 'bash',
+    'zsh': 'bash', 'ipynb': 'json', 'docker': 'dockerfile',
+}
+
+REPAIR_CONTEXT_LINES = 15
+
+
+def normalize_language(tag):
+    tag = (tag or '').lower()
+    return LANGUAGE_ALIASES.get(tag, tag)
+
+
+def find_code_blocks(llm_output):
+    """Return [(language, code, closed)] for every fenced block, in order.
+
+    A block still open at the end of the output is returned with closed=False;
+    that is how truncated responses show up.
+    """
+    blocks = []
+    if not llm_output:
+        return blocks
+    fence, language, lines = None, None, []
+    for line in llm_output.splitlines():
+        if fence is None:
+            match = FENCE_OPEN.match(line)
+            if match:
+                fence, language, lines = match.group(1), normalize_language(match.group(2)), []
+        elif line.strip() == fence:
+            blocks.append((language, "\n".join(lines).strip("\n"), True))
+            fence = None
+        else:
+            lines.append(line)
+    if fence is not None and lines:
+        blocks.append((language, "\n".join(lines).strip("\n"), False))
+    return blocks
+
+
+def extract_code(llm_output, file_name=None):
+    """Pick the fixed file out of a response, returns (code, truncated).
+
+    Complete blocks win over a truncated one. Among those, a block tagged
+    with the file's language is preferred, then the longest block, since
+    models sometimes add a short usage example after the fix.
+    """
+    blocks = find_code_blocks(llm_output)
+    if not blocks:
+        return None, False
+    wanted = fence_language(file_name) if file_name else None
+
+    def rank(block):
+        language, code, closed = block
+        return closed, bool(wanted) and language == wanted, len(code)
+
+    language, code, closed = max(blocks, key=rank)
+    return (code or None), not closed
+
+
+def error_line(error):
+    """Line number in a validation error message, or None."""
+    match = re.search(r"line (\d+)", error or "")
+    return int(match.group(1)) if match else None
+
+
+def error_region(code, line, context=REPAIR_CONTEXT_LINES):
+    """Return (start, end) 1-based inclusive lines around a parse error."""
+    total = len(code.splitlines())
+    if not line:
+        # No position reported, the end of the file is the usual culprit
+        line = total
+    line = min(max(line, 1), total)
+    return max(1, line - context), min(total, line + context)
+
+
+def replace_lines(code, start, end, replacement):
+    lines = code.splitlines()
+    return "\n".join(lines[:start - 1] + replacement.splitlines() + lines[end:])
+
+# ==== WASTED SPEND ====
+
+_waste = defaultdict(lambda: {'calls': 0, 'tokens': 0, 'failed_calls': 0, 'wasted_tokens': 0,
+                               'repair_calls': 0, 'repair_tokens': 0, 'repaired': 0})
+_waste_lock = threading.Lock()
+
+
+def call_tokens(model_details):
+    return ((model_details or {}).get('metrics') or {}).get('total_tokens') or 0
+
+
+def record_call(model, tokens, failed=False, repair=False):
+    with _waste_lock:
+        stats = _waste[model]
+        stats['calls'] += 1
+        stats['tokens'] += tokens
+        if repair:
+            stats['repair_calls'] += 1
+            stats['repair_tokens'] += tokens
+        if failed:
+            stats['failed_calls'] += 1
+            stats['wasted_tokens'] += tokens
+
+
+def record_repaired(model):
+    with _waste_lock:
+        _waste[model]['repaired'] += 1
+
+
+def waste_stats():
+    """Per-model call and token counts, with the share spent on unusable output."""
+    with _waste_lock:
+        rows = []
+        for model, stats in sorted(_waste.items()):
+            share = round(100.0 * stats['wasted_tokens'] / stats['tokens'], 1) if stats['tokens'] else 0.0
+            rows.append(dict(stats, model=model, wasted_pct=share))
+        return rows
@@ -0,0 +1,31 @@
+import os
+import ast
+import json
+
+import yaml
+
+# ==== FIXED CODE VALIDATION ====
+
+def validate_code(file_path, code):
+    """Check that fixed content still parses for its file type.
+
+    Returns (status, error) where status is 'valid', 'invalid' or
+    'unchecked' for file types without a parser.
+    """
+    if not code:
+        return 'invalid', 'no code extracted'
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext == '.py':
+            ast.parse(code)
+        elif ext in ('.yaml', '.yml'):
+            list(yaml.safe_load_all(code))
+        elif ext in ('.json', '.ipynb'):
+            json.loads(code)
+        else:
+            return 'unchecked', None
+    except SyntaxError as e:
+        return 'invalid', f"line {e.lineno}: {e.msg}"
+    except (yaml.YAMLError, ValueError) as e:
+        return 'invalid', str(e)
+    return 'valid', None
@@ -0,0 +1,138 @@
+import time
+import queue
+import logging
+import threading
+from collections import defaultdict, deque
+
+import usage_ledger
+from llm_streaming import set_cancel_event
+
+# ==== HEDGED REQUESTS ====
+# The primary backend gets a head start of about its own p90 (configurable)
+# per-file latency. If no validated fix has arrived by then, the same file is
+# sent to the secondary backend as well; the first validated fix wins and the
+# other request is cancelled. Streamed calls stop at the next chunk; blocking
+# calls run to completion in the background and their result is dropped.
+# Every file adds a primary latency sample: the real one when the primary
+# wins, otherwise the time it had taken so far as a lower bound, so slow
+# primaries that lose the race still push the delay up. Response cache hits
+# are not samples: their near-zero latency would drag the delay to its floor.
+
+DEFAULT_PERCENTILE = 90
+DEFAULT_INITIAL_DELAY_SEC = 60
+DEFAULT_MIN_DELAY_SEC = 5
+DEFAULT_MIN_SAMPLES = 5
+LATENCY_WINDOW = 200
+
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_stats = {'files': 0, 'fired': 0, 'primary_wins': 0, 'secondary_wins': 0, 'both_failed': 0}
+_lock = threading.Lock()
+
+
+def hedge_settings(config):
+    return config['autofix'].get('hedging', {}) or {}
+
+
+def secondary_backend(backend, config):
+    settings = hedge_settings(config)
+    if not settings.get('enabled', False):
+        return None
+    secondary = settings.get('secondary') or ('azure' if backend == 'local' else 'local')
+    return secondary if secondary != backend else None
+
+
+def hedge_delay(backend, config):
+    """Seconds to wait for the primary before hedging, from its recent per-file latencies."""
+    settings = hedge_settings(config)
+    with _lock:
+        samples = list(_latencies[backend])
+    if len(samples) < settings.get('min_samples', DEFAULT_MIN_SAMPLES):
+        return settings.get('initial_delay_sec', DEFAULT_INITIAL_DELAY_SEC)
+    return max(settings.get('min_delay_sec', DEFAULT_MIN_DELAY_SEC),
+               usage_ledger.percentile(samples, settings.get('percentile', DEFAULT_PERCENTILE)))
+
+
+def hedge_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['fired_pct'] = round(100.0 * stats['fired'] / stats['files'], 1) if stats['files'] else 0.0
+    return stats
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+def _record_latency(backend, seconds):
+    with _lock:
+        _latencies[backend].append(seconds)
+
+
+def _is_valid(result):
+    return result is not None and bool(result[0])
+
+
+def _start(fn, backend, results):
+    """Run fn(backend) on a daemon thread; returns the event that cancels it."""
+    cancel = threading.Event()
+    context = usage_ledger.current_context()
+
+    def run():
+        set_cancel_event(cancel)
+        start = time.monotonic()
+        try:
+            with usage_ledger.call_context(**context):
+                result = fn(backend)
+        except Exception as e:
+            logging.error(f"❌ Hedged request on {backend} failed: {e}")
+            result = None
+        results.put((backend, result, time.monotonic() - start))
+
+    threading.Thread(target=run, name=f"hedge-{backend}", daemon=True).start()
+    return cancel
+
+
+def run_hedged(fn, backend, config):
+    """Call fn(backend) -> (code, raw_output, model_details), hedging to the secondary backend if slow.
+
+    Without hedging enabled this is just fn(backend).
+    """
+    secondary = secondary_backend(backend, config)
+    if not secondary:
+        return fn(backend)
+
+    _count('files')
+    delay = hedge_delay(backend, config)
+    started = time.monotonic()
+    results = queue.Queue()
+    running = {backend: _start(fn, backend, results)}
+    outcomes = {}
+    fired = False
+    while True:
+        try:
+            finished, result, elapsed = results.get(timeout=None if fired else delay)
+        except queue.Empty:
+            finished = None
+        if finished:
+            running.pop(finished)
+            outcomes[finished] = result
+            if _is_valid(result):
+                if not (result[2] or {}).get('cache_hit'):
+                    _record_latency(backend, elapsed if finished == backend else time.monotonic() - started)
+                for cancel in running.values():
+                    cancel.set()
+                _count('primary_wins' if finished == backend else 'secondary_wins')
+                hedge = {'fired': fired, 'winner': finished, 'delay_sec': round(delay, 1)}
+                return result[0], result[1], dict(result[2], hedge=hedge)
+        if not fired:
+            # The primary is slow, or already failed
+            fired = True
+            _count('fired')
+            reason = "failed" if finished else f"has no valid result after {delay:.0f}s"
+            logging.info(f"🏎️ {backend} {reason}, hedging to {secondary}")
+            running[secondary] = _start(fn, secondary, results)
+        if not running:
+            _record_latency(backend, time.monotonic() - started)
+            _count('both_failed')
+            return outcomes.get(backend) or outcomes.get(secondary)
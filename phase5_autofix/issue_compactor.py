@@ -0,0 +1,132 @@
+import logging
+import threading
+from collections import defaultdict
+
+from llm_dispatcher import estimate_tokens
+
+# ==== ISSUE LIST COMPACTION ====
+# Findings with the same rule, severity and message are listed once with
+# their line ranges. Prompts that already tell the model to fix a rule
+# everywhere in the file (fix_everywhere) also cap how much of each rule is
+# spelled out, since the remaining occurrences add tokens but no information.
+
+DEFAULT_MAX_GROUPS_PER_RULE = 5
+DEFAULT_MAX_LINES_PER_GROUP = 20
+
+_savings = {}
+_savings_lock = threading.Lock()
+
+
+def compaction_settings(config):
+    return config['autofix'].get('compaction', {}) or {}
+
+
+def verbose_line(issue):
+    if issue.get('cell') is not None:
+        return (f"- Rule: {issue['rule']}, Severity: {issue['severity']}, Cell: {issue['cell']}, "
+                f"Line in cell: {issue['cell_line']}, Message: {issue['message']}")
+    return f"- Rule: {issue['rule']}, Severity: {issue['severity']}, Line: {issue['line']}, Message: {issue['message']}"
+
+
+def line_ranges(lines):
+    """[3, 4, 5, 9] -> '3-5, 9'."""
+    numbers = sorted(set(n for n in lines if n is not None))
+    parts = []
+    for n in numbers:
+        if parts and n == parts[-1][1] + 1:
+            parts[-1][1] = n
+        else:
+            parts.append([n, n])
+    text = ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in parts)
+    if len(numbers) < len(lines):
+        text = f"{text}, file level" if text else "file level"
+    return text
+
+
+def group_line(rule, severity, message, cell, lines, max_lines):
+    shown = sorted(lines, key=lambda n: (n is None, n or 0))
+    more = 0
+    if max_lines and len(shown) > max_lines:
+        shown, more = shown[:max_lines], len(shown) - max_lines
+    where = line_ranges(shown) + (f" (+{more} more)" if more else "")
+    label = ("Line" if len(lines) == 1 else "Lines") + (" in cell" if cell is not None else "")
+    parts = [f"- Rule: {rule}", f"Severity: {severity}"]
+    if cell is not None:
+        parts.append(f"Cell: {cell}")
+    parts.append(f"{label}: {where}" + (f" ({len(lines)}x)" if len(lines) > 1 else ""))
+    parts.append(f"Message: {message}")
+    return ", ".join(parts)
+
+
+def compact_issues(issues, config, fix_everywhere=True):
+    """Return the compacted issue lines for a prompt."""
+    settings = compaction_settings(config)
+    max_groups = settings.get('max_groups_per_rule', DEFAULT_MAX_GROUPS_PER_RULE) if fix_everywhere else None
+    max_lines = settings.get('max_lines_per_group', DEFAULT_MAX_LINES_PER_GROUP) if fix_everywhere else None
+
+    # Keep the rule order of the original list so related findings stay together
+    groups = defaultdict(list)
+    for issue in issues:
+        cell = issue.get('cell')
+        key = (issue['rule'], issue['severity'], issue['message'], cell)
+        groups[key].append(issue['cell_line'] if cell is not None else issue.get('line'))
+
+    by_rule = defaultdict(list)
+    for key, lines in groups.items():
+        by_rule[key[0]].append((key, lines))
+
+    output = []
+    for rule, rule_groups in by_rule.items():
+        # The most frequent messages are the most useful examples
+        rule_groups.sort(key=lambda g: -len(g[1]))
+        listed = rule_groups[:max_groups] if max_groups else rule_groups
+        for (_, severity, message, cell), lines in listed:
+            output.append(group_line(rule, severity, message, cell, lines, max_lines))
+        dropped = [n for _, lines in rule_groups[len(listed):] for n in lines]
+        if dropped:
+            shown = sorted(dropped, key=lambda n: (n is None, n or 0))[:max_lines]
+            more = len(dropped) - len(shown)
+            output.append(f"- Rule: {rule}: {len(dropped)} more finding(s) with other messages on lines "
+                          f"{line_ranges(shown)}{f' (+{more} more)' if more else ''}, fix every occurrence of this rule")
+    return output
+
+
+def describe_issues(issues, config, file_name=None, fix_everywhere=True):
+    """Issue list text for a prompt, compacted unless autofix.compaction.enabled is false."""
+    verbose = "\n".join(verbose_line(i) for i in issues)
+    if not compaction_settings(config).get('enabled', True):
+        return verbose
+    compact = "\n".join(compact_issues(issues, config, fix_everywhere))
+    if file_name:
+        # Keyed by the issue set, so building the same prompt twice is only counted once
+        signature = (file_name, tuple(sorted((i['rule'], str(i.get('line')), str(i.get('cell'))) for i in issues)))
+        with _savings_lock:
+            _savings[signature] = (len(issues), compact.count("\n") + 1 if compact else 0,
+                                   estimate_tokens(verbose), estimate_tokens(compact))
+    return compact
+
+
+def compaction_stats():
+    """Per-file rows: issues, listed lines and prompt tokens before/after compaction."""
+    rows = defaultdict(lambda: {'issues': 0, 'listed_lines': 0, 'tokens_before': 0, 'tokens_after': 0})
+    with _savings_lock:
+        entries = list(_savings.items())
+    for (file_name, _), (issues, listed, before, after) in entries:
+        row = rows[file_name]
+        row['issues'] += issues
+        row['listed_lines'] += listed
+        row['tokens_before'] += before
+        row['tokens_after'] += after
+    return [dict(file=file_name, tokens_saved=row['tokens_before'] - row['tokens_after'], **row)
+            for file_name, row in sorted(rows.items())]
+
+
+def log_compaction_summary():
+    rows = compaction_stats()
+    saved = sum(row['tokens_saved'] for row in rows)
+    if not saved:
+        return
+    for row in sorted(rows, key=lambda r: -r['tokens_saved'])[:10]:
+        logging.info(f"🗜️ {row['file']}: {row['issues']} issue(s) listed in {row['listed_lines']} line(s), "
+                     f"~{row['tokens_saved']} prompt tokens saved")
+    logging.info(f"🗜️ Issue compaction saved ~{saved} prompt tokens over {len(rows)} file(s)")
@@ -0,0 +1,285 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+# ==== LEASED JOB QUEUE ====
+
+DEFAULT_LEASE_SEC = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_SQLITE_QUEUE_PATH = os.path.join("results", "autofix_jobs.sqlite")
+
+# Finished jobs are handed out again when their file is queued anew, e.g. after a rescan
+TERMINAL_STATUSES = ('done', 'failed')
+
+
+def make_job_id(repo_name, file_path, backend):
+    return f"{repo_name}:{backend}:{file_path}"
+
+
+class JobQueue:
+    """File-level fix jobs shared by any number of worker processes.
+
+    A claimed job is leased to one owner until `lease_until`; the owner keeps
+    it alive with heartbeats. Jobs whose lease ran out are handed to the next
+    claimer, and heartbeats or completions from the previous owner are then
+    refused, which fences off stale workers.
+    """
+
+    def enqueue(self, jobs):
+        """Add jobs (dicts with repo_name, repo_url, file_path, backend); returns how many became pending.
+
+        Jobs that are already pending or leased are left alone. Done or failed
+        ones are reset to pending with their attempts and error cleared.
+        """
+        raise NotImplementedError
+
+    def claim(self, owner, backend, lease_sec=DEFAULT_LEASE_SEC, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Lease the oldest available job for `backend`, or return None."""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id, owner, lease_sec=DEFAULT_LEASE_SEC):
+        """Extend the lease; False means the job now belongs to someone else."""
+        raise NotImplementedError
+
+    def complete(self, job_id, owner, status='done', error=None):
+        """Finish a job as 'done' or 'failed', or hand it back as 'pending'. Only the lease owner may."""
+        raise NotImplementedError
+
+    def reap(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Fail expired jobs that already used all attempts, so they stop being reclaimed."""
+        raise NotImplementedError
+
+    def counts(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def requeued_fields():
+        now = time.time()
+        return {'status': 'pending', 'owner': None, 'lease_until': 0, 'attempts': 0,
+                'enqueued_at': now, 'updated_at': now, 'error': None}
+
+    @staticmethod
+    def new_job(job):
+        now = time.time()
+        return dict(job, job_id=make_job_id(job['repo_name'], job['file_path'], job['backend']),
+                    status='pending', owner=None, lease_until=0, attempts=0,
+                    enqueued_at=now, updated_at=now, error=None)
+
+# ==== MONGODB QUEUE ====
+
+class MongoJobQueue(JobQueue):
+
+    def __init__(self, db_config):
+        from pymongo import MongoClient, ASCENDING
+        if 'username' in db_config and db_config['username']:
+            self.client = MongoClient(
+                host=db_config['host'], port=db_config['port'],
+                username=db_config['username'], password=db_config['password'])
+        else:
+            self.client = MongoClient(host=db_config['host'], port=db_config['port'])
+        name = db_config.get('jobs_collection') or f"{db_config['collection']}_jobs"
+        self.collection = self.client[db_config['db_name']][name]
+        self.collection.create_index([('job_id', ASCENDING)], name='job_id', unique=True)
+        self.collection.create_index([('backend', ASCENDING), ('status', ASCENDING), ('enqueued_at', ASCENDING)],
+                                     name='claim_order')
+
+    def enqueue(self, jobs):
+        from pymongo import UpdateOne
+        if not jobs:
+            return 0
+        jobs = [self.new_job(job) for job in jobs]
+        requeue = self.requeued_fields()
+        operations = []
+        for job in jobs:
+            operations.append(UpdateOne({'job_id': job['job_id']}, {'$setOnInsert': job}, upsert=True))
+            operations.append(UpdateOne({'job_id': job['job_id'], 'status': {'$in': list(TERMINAL_STATUSES)}},
+                                        {'$set': requeue}))
+        result = self.collection.bulk_write(operations, ordered=False)
+        return result.upserted_count + result.modified_count
+
+    def claim(self, owner, backend, lease_sec=DEFAULT_LEASE_SEC, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        from pymongo import ReturnDocument, ASCENDING
+        now = time.time()
+        return self.collection.find_one_and_update(
+            {'backend': backend, 'attempts': {'$lt': max_attempts},
+             '$or': [{'status': 'pending'}, {'status': 'leased', 'lease_until': {'$lt': now}}]},
+            {'$set': {'status': 'leased', 'owner': owner, 'lease_until': now + lease_sec, 'updated_at': now},
+             '$inc': {'attempts': 1}},
+            sort=[('enqueued_at', ASCENDING)],
+            projection={'_id': 0},
+            return_document=ReturnDocument.AFTER)
+
+    def heartbeat(self, job_id, owner, lease_sec=DEFAULT_LEASE_SEC):
+        now = time.time()
+        result = self.collection.update_one(
+            {'job_id': job_id, 'owner': owner, 'status': 'leased'},
+            {'$set': {'lease_until': now + lease_sec, 'updated_at': now}})
+        return result.modified_count == 1
+
+    def complete(self, job_id, owner, status='done', error=None):
+        fields = {'status': status, 'error': error, 'updated_at': time.time()}
+        if status == 'pending':
+            fields.update(owner=None, lease_until=0)
+        result = self.collection.update_one({'job_id': job_id, 'owner': owner, 'status': 'leased'}, {'$set': fields})
+        return result.modified_count == 1
+
+    def reap(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        now = time.time()
+        result = self.collection.update_many(
+            {'status': 'leased', 'lease_until': {'$lt': now}, 'attempts': {'$gte': max_attempts}},
+            {'$set': {'status': 'failed', 'error': 'lease expired on last attempt', 'updated_at': now}})
+        return result.modified_count
+
+    def counts(self):
+        return {row['_id']: row['count'] for row in self.collection.aggregate(
+            [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}])}
+
+    def close(self):
+        self.client.close()
+
+# ==== EMBEDDED SQLITE QUEUE ====
+
+class SqliteJobQueue(JobQueue):
+    """Single-host stand-in for Mongo; several worker processes can share the file."""
+
+    COLUMNS = ('job_id', 'repo_name', 'repo_url', 'file_path', 'backend', 'status', 'owner',
+               'lease_until', 'attempts', 'enqueued_at', 'updated_at', 'error')
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, repo_name TEXT, repo_url TEXT, file_path TEXT, backend TEXT,"
+            " status TEXT, owner TEXT, lease_until REAL, attempts INTEGER,"
+            " enqueued_at REAL, updated_at REAL, error TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS claim_order ON jobs (backend, status, enqueued_at)")
+
+    def _update(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def enqueue(self, jobs):
+        added = 0
+        requeue = self.requeued_fields()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job in jobs:
+                    job = self.new_job(job)
+                    added += self.conn.execute(
+                        f"INSERT OR IGNORE INTO jobs ({', '.join(self.COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in self.COLUMNS)})",
+                        [job.get(column) for column in self.COLUMNS]).rowcount
+                    added += self.conn.execute(
+                        f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in requeue)}"
+                        f" WHERE job_id = ? AND status IN ({', '.join('?' for _ in TERMINAL_STATUSES)})",
+                        [*requeue.values(), job['job_id'], *TERMINAL_STATUSES]).rowcount
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim(self, owner, backend, lease_sec=DEFAULT_LEASE_SEC, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        now = time.time()
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so two processes cannot pick the same row
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT job_id FROM jobs WHERE backend = ? AND attempts < ?"
+                    " AND (status = 'pending' OR (status = 'leased' AND lease_until < ?))"
+                    " ORDER BY enqueued_at LIMIT 1", (backend, max_attempts, now)).fetchone()
+                if row:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'leased', owner = ?, lease_until = ?, updated_at = ?,"
+                        " attempts = attempts + 1 WHERE job_id = ?", (owner, now + lease_sec, now, row['job_id']))
+                    row = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row['job_id'],)).fetchone()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row else None
+
+    def heartbeat(self, job_id, owner, lease_sec=DEFAULT_LEASE_SEC):
+        now = time.time()
+        return self._update(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE job_id = ? AND owner = ? AND status = 'leased'",
+            (now + lease_sec, now, job_id, owner)) == 1
+
+    def complete(self, job_id, owner, status='done', error=None):
+        if status == 'pending':
+            sql = ("UPDATE jobs SET status = ?, error = ?, updated_at = ?, owner = NULL, lease_until = 0"
+                   " WHERE job_id = ? AND owner = ? AND status = 'leased'")
+        else:
+            sql = ("UPDATE jobs SET status = ?, error = ?, updated_at = ?"
+                   " WHERE job_id = ? AND owner = ? AND status = 'leased'")
+        return self._update(sql, (status, error, time.time(), job_id, owner)) == 1
+
+    def reap(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        now = time.time()
+        return self._update(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired on last attempt', updated_at = ?"
+            " WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, max_attempts))
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ==== LEASE KEEPER ====
+
+class LeaseKeeper:
+    """Heartbeats a claimed job from a background thread while the fix is running."""
+
+    def __init__(self, queue, job_id, owner, lease_sec=DEFAULT_LEASE_SEC):
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_sec = lease_sec
+        self.lost = False
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def _run(self):
+        while not self.stop.wait(self.lease_sec / 3.0):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.owner, self.lease_sec):
+                    self.lost = True
+                    logging.warning(f"⚠️ Lease lost for job {self.job_id}")
+                    return
+            except Exception as e:
+                logging.warning(f"⚠️ Heartbeat failed for job {self.job_id}: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        return False
+
+
+def open_job_queue(db_config):
+    store_type = db_config.get('type', 'mongodb')
+    if store_type == 'mongodb':
+        return MongoJobQueue(db_config)
+    if store_type == 'sqlite':
+        return SqliteJobQueue(db_config.get('jobs_path') or DEFAULT_SQLITE_QUEUE_PATH)
+    raise ValueError(f"Unsupported database type: {store_type}")
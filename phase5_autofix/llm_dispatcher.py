@@ -0,0 +1,137 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+import ollama
+import openai
+
+# ==== TOKEN ESTIMATION ====
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting and rate limiting
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+# ==== TOKEN BUCKET ====
+
+class TokenBucket:
+    """Refills `capacity_per_minute` units evenly over each minute."""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        # A single request larger than the bucket would wait forever, so cap it
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+# ==== PER-BACKEND LIMITER ====
+
+class BackendLimiter:
+    """Concurrency cap plus optional requests/tokens-per-minute buckets for one backend."""
+
+    def __init__(self, max_concurrency, rpm_limit=None, tpm_limit=None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self.rpm_bucket = TokenBucket(rpm_limit) if rpm_limit else None
+        self.tpm_bucket = TokenBucket(tpm_limit) if tpm_limit else None
+
+    @contextmanager
+    def slot(self, estimated_tokens=0):
+        with self.semaphore:
+            if self.rpm_bucket:
+                self.rpm_bucket.acquire(1)
+            if self.tpm_bucket and estimated_tokens:
+                self.tpm_bucket.acquire(estimated_tokens)
+            yield
+
+
+DEFAULT_CONCURRENCY = {'local': 1, 'azure': 4}
+
+_limiters = {}
+_clients = {}
+_registry_lock = threading.Lock()
+
+
+def get_backend_concurrency(backend, config):
+    caps = config['autofix'].get('concurrency', {}) or {}
+    return int(caps.get(backend, DEFAULT_CONCURRENCY.get(backend, 1)))
+
+
+def get_backend_limiter(backend, config):
+    with _registry_lock:
+        if backend not in _limiters:
+            backend_config = config.get(backend, {}) or {}
+            _limiters[backend] = BackendLimiter(
+                get_backend_concurrency(backend, config),
+                rpm_limit=backend_config.get('rpm_limit'),
+                tpm_limit=backend_config.get('tpm_limit'))
+        return _limiters[backend]
+
+# ==== SHARED CLIENTS ====
+
+def get_azure_client(config):
+    azure_config = config['azure']
+    key = ('azure', azure_config['endpoint'], azure_config['version'])
+    with _registry_lock:
+        if key not in _clients:
+            _clients[key] = openai.AzureOpenAI(
+                api_key=azure_config['key'],
+                azure_endpoint=azure_config['endpoint'],
+                api_version=azure_config['version'],
+                # Retries and backoff are handled by llm_resilience
+                max_retries=0
+            )
+        return _clients[key]
+
+
+def get_ollama_client(config, read_timeout=None):
+    # With streaming the read timeout is an inactivity timeout between tokens
+    host = config['autofix'].get('ollama_host')
+    key = ('ollama', host, read_timeout)
+    with _registry_lock:
+        if key not in _clients:
+            timeout = httpx.Timeout(read_timeout, connect=30) if read_timeout else None
+            _clients[key] = ollama.Client(host=host, timeout=timeout)
+        return _clients[key]
+
+# ==== DISPATCHER ====
+
+def dispatch_work(work_items, worker_fn, on_result, max_workers):
+    """Run worker_fn over work_items in a thread pool.
+
+    on_result(item, result) is called from the calling thread as each item
+    completes, so DB writes and file saves never race each other.
+    """
+    if not work_items:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(worker_fn, item): item for item in work_items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"❌ Worker failed for {item[0]}: {e}")
+                continue
+            on_result(item, result)
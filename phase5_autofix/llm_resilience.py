@@ -0,0 +1,238 @@
+import time
+import random
+import logging
+import threading
+import email.utils
+from collections import deque
+
+import httpx
+import openai
+
+from llm_dispatcher import estimate_tokens
+from llm_streaming import StreamStalledError, StreamCancelledError
+
+# ==== RETRIES, TIMEOUTS AND CIRCUIT BREAKERS ====
+# Shared by the local and Azure backends. Transient failures (429, 5xx,
+# timeouts, stalled streams) are retried with jittered exponential backoff,
+# waiting at least as long as the server's Retry-After. Each call gets a
+# timeout sized from its expected output, and a backend whose recent calls
+# mostly fail is paused (or re-routed) for a cool-down instead of retried.
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BACKOFF_BASE_SEC = 2
+DEFAULT_BACKOFF_MAX_SEC = 60
+DEFAULT_TIMEOUT_BASE_SEC = 30
+DEFAULT_TIMEOUT_MAX_SEC = 900
+DEFAULT_MIN_TOKENS_PER_SEC = {'local': 5, 'azure': 20}
+
+_breakers = {}
+_stats = {'retries': 0, 'retry_wait_sec': 0.0, 'rerouted': 0}
+_lock = threading.Lock()
+
+
+def resilience_settings(config):
+    return config['autofix'].get('resilience', {}) or {}
+
+
+def expected_output_tokens(prompt):
+    # A full-file fix writes back roughly as much as it reads
+    return int(estimate_tokens(prompt) * 1.25) + 256
+
+
+def call_timeout(backend, prompt, config):
+    """Seconds one call may take: a fixed allowance plus the expected output at the slowest acceptable speed."""
+    settings = resilience_settings(config)
+    speeds = dict(DEFAULT_MIN_TOKENS_PER_SEC, **(settings.get('min_tokens_per_sec') or {}))
+    timeout = (settings.get('timeout_base_sec', DEFAULT_TIMEOUT_BASE_SEC) +
+               expected_output_tokens(prompt) / float(speeds.get(backend, 10)))
+    return min(timeout, settings.get('timeout_max_sec', DEFAULT_TIMEOUT_MAX_SEC))
+
+
+def is_retryable(error):
+    if isinstance(error, StreamCancelledError):
+        return False
+    if isinstance(error, (StreamStalledError, httpx.TimeoutException, httpx.TransportError,
+                          openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    # ollama.ResponseError and openai.APIStatusError both carry the HTTP status
+    status = getattr(error, 'status_code', None)
+    return status in (408, 409, 429) or (status is not None and status >= 500)
+
+
+def retry_after_seconds(error):
+    """The server's Retry-After hint in seconds, if the error carries one."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_cap(config):
+    return resilience_settings(config).get('backoff_max_sec', DEFAULT_BACKOFF_MAX_SEC)
+
+
+def backoff_delay(attempt, config, retry_after=None):
+    """Jittered exponential backoff, at least the server's Retry-After, never above backoff_max_sec."""
+    settings = resilience_settings(config)
+    cap = backoff_cap(config)
+    # Full jitter keeps parallel workers from retrying in lockstep
+    delay = random.uniform(0, min(cap, settings.get('backoff_base_sec', DEFAULT_BACKOFF_BASE_SEC) * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    return min(delay, cap)
+
+
+def resilience_stats():
+    with _lock:
+        stats = dict(_stats)
+        breakers = list(_breakers.values())
+    stats['breakers'] = {b.name: dict(b.stats, state=b.state) for b in breakers}
+    return stats
+
+# ==== CIRCUIT BREAKER ====
+
+class CircuitBreaker:
+    """Opens when `error_rate` of the calls in the last `window_sec` failed.
+
+    While open, callers wait out the cool-down. Afterwards a single trial call
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, error_rate=0.5, min_calls=5, window_sec=120, cooldown_sec=60):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_sec = window_sec
+        self.cooldown_sec = cooldown_sec
+        self.state = 'closed'
+        self.open_until = 0.0
+        self.trial_running = False
+        self.outcomes = deque()
+        self.cond = threading.Condition()
+        self.stats = {'opened': 0, 'paused_sec': 0.0}
+
+    def is_open(self):
+        with self.cond:
+            return self.state != 'closed'
+
+    def acquire(self):
+        """Block until a call may go out."""
+        start = time.monotonic()
+        logged = False
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.state == 'open' and now >= self.open_until:
+                    self.state = 'half_open'
+                if self.state == 'closed':
+                    break
+                if self.state == 'half_open' and not self.trial_running:
+                    self.trial_running = True
+                    break
+                if not logged:
+                    logging.warning(f"⏸️ {self.name} circuit is {self.state}, pausing calls")
+                    logged = True
+                self.cond.wait(timeout=max(self.open_until - now, 1.0))
+            self.stats['paused_sec'] += time.monotonic() - start
+
+    def record(self, ok):
+        with self.cond:
+            now = time.monotonic()
+            if self.state == 'half_open' and self.trial_running:
+                self.trial_running = False
+                if ok:
+                    logging.info(f"✅ {self.name} circuit closed again")
+                    self.state = 'closed'
+                    self.outcomes.clear()
+                else:
+                    self._open(now)
+                self.cond.notify_all()
+                return
+            self.outcomes.append((now, ok))
+            while self.outcomes and now - self.outcomes[0][0] > self.window_sec:
+                self.outcomes.popleft()
+            failures = sum(1 for _, outcome in self.outcomes if not outcome)
+            if (not ok and self.state == 'closed' and len(self.outcomes) >= self.min_calls and
+                    failures >= self.error_rate * len(self.outcomes)):
+                self._open(now)
+
+    def _open(self, now):
+        self.state = 'open'
+        self.open_until = now + self.cooldown_sec
+        self.stats['opened'] += 1
+        logging.error(f"🔌 {self.name} circuit opened, pausing calls for {self.cooldown_sec}s")
+
+
+def get_breaker(backend, config):
+    settings = resilience_settings(config)
+    with _lock:
+        if backend not in _breakers:
+            _breakers[backend] = CircuitBreaker(
+                backend,
+                error_rate=settings.get('breaker_error_rate', 0.5),
+                min_calls=settings.get('breaker_min_calls', 5),
+                window_sec=settings.get('breaker_window_sec', 120),
+                cooldown_sec=settings.get('breaker_cooldown_sec', 60))
+        return _breakers[backend]
+
+
+def route(backend, config):
+    """The backend to call: `reroute_to` while this backend's circuit is open, if that one is healthy."""
+    target = resilience_settings(config).get('reroute_to')
+    if target and target != backend and get_breaker(backend, config).is_open() \
+            and not get_breaker(target, config).is_open():
+        with _lock:
+            _stats['rerouted'] += 1
+        logging.warning(f"↪️ {backend} circuit is open, sending this call to {target}")
+        return target
+    return backend
+
+# ==== RETRY LOOP ====
+
+def call_with_retries(backend, fn, config):
+    """Run fn() under the backend's circuit breaker, retrying transient failures.
+
+    Returns (result, attempts). The last error is re-raised with an
+    `attempts` attribute once retries are exhausted or it is not retryable.
+    """
+    breaker = get_breaker(backend, config)
+    max_attempts = resilience_settings(config).get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            retryable = is_retryable(e)
+            # Rejected requests (bad input, auth) say nothing about the endpoint's health
+            breaker.record(not retryable)
+            retry_after = retry_after_seconds(e)
+            if retryable and retry_after is not None and retry_after > backoff_cap(config):
+                # Waiting longer than the cap would stall a worker; let the breaker and re-routing handle it
+                logging.warning(f"⚠️ {backend} asks to retry after {retry_after:.0f}s, "
+                                f"more than backoff_max_sec {backoff_cap(config)}s, giving up")
+                retryable = False
+            if not retryable or attempt >= max_attempts:
+                e.attempts = attempt
+                raise
+            delay = backoff_delay(attempt, config, retry_after)
+            with _lock:
+                _stats['retries'] += 1
+                _stats['retry_wait_sec'] += delay
+            logging.warning(f"⚠️ {backend} call failed ({type(e).__name__}: {e}). "
+                            f"Attempt {attempt}/{max_attempts}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+        breaker.record(True)
+        return result, attempt
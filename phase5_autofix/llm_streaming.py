@@ -0,0 +1,203 @@
+import time
+import logging
+import threading
+
+import httpx
+
+from llm_dispatcher import estimate_tokens
+
+# ==== STREAMING HELPERS ====
+
+DEFAULT_INACTIVITY_TIMEOUT = 120  # seconds without a new token before a stream is abandoned
+
+
+class StreamStalledError(Exception):
+    pass
+
+
+class StreamCancelledError(StreamStalledError):
+    pass
+
+# A hedged request that lost the race sets this thread's event, so its stream stops early
+_cancel = threading.local()
+
+
+def set_cancel_event(event):
+    _cancel.event = event
+
+
+def call_cancelled():
+    event = getattr(_cancel, 'event', None)
+    return event is not None and event.is_set()
+
+
+def streaming_enabled(config):
+    return (config['autofix'].get('streaming', {}) or {}).get('enabled', False)
+
+
+def inactivity_timeout(config):
+    streaming_config = config['autofix'].get('streaming', {}) or {}
+    return streaming_config.get('inactivity_timeout', DEFAULT_INACTIVITY_TIMEOUT)
+
+
+class FenceWatcher:
+    """Tracks streamed text and reports once a fenced code block has closed."""
+
+    def __init__(self):
+        self.parts = []
+        self.pending = ""
+        self.inside = False
+        self.closed = False
+
+    def feed(self, text):
+        self.parts.append(text)
+        self.pending += text
+        *complete, self.pending = self.pending.split("\n")
+        for line in complete:
+            stripped = line.strip()
+            if not self.inside and stripped.startswith("```"):
+                self.inside = True
+            elif self.inside and stripped == "```":
+                self.closed = True
+        return self.closed
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+
+class StreamMetrics:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.first_token_at = None
+        self.end = None
+
+    def token_seen(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def finish(self, text, prompt_tokens=None, completion_tokens=None, stopped_early=False, cached_tokens=None):
+        self.end = time.monotonic()
+        estimated = completion_tokens is None
+        if estimated:
+            completion_tokens = estimate_tokens(text)
+        generation_time = self.end - (self.first_token_at or self.start)
+        metrics = {
+            'streamed': True,
+            'latency_sec': round(self.end - self.start, 3),
+            'time_to_first_token_sec': round(self.first_token_at - self.start, 3) if self.first_token_at else None,
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': (prompt_tokens or 0) + completion_tokens,
+            'tokens_per_sec': round(completion_tokens / generation_time, 2) if generation_time > 0 else None,
+            'usage_estimated': estimated,
+            'stopped_early': stopped_early,
+        }
+        logging.info(f"⏱️ TTFT {metrics['time_to_first_token_sec']}s, {metrics['tokens_per_sec']} tok/s, "
+                     f"{metrics['total_tokens']} tokens{' (stopped at closing fence)' if stopped_early else ''}")
+        return metrics
+
+
+def _estimate_prompt_tokens(messages):
+    # Usage is only reported at the end of a stream, which early termination skips
+    return estimate_tokens("".join(m['content'] for m in messages))
+
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens served from the provider's prompt cache, when the usage block reports them."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None) if details else None
+
+
+def blocking_call_metrics(start, prompt_tokens, completion_tokens, cached_tokens=None):
+    """Metrics for a non-streamed call, in the same shape as streamed ones."""
+    latency = time.monotonic() - start
+    return {
+        'streamed': False,
+        'latency_sec': round(latency, 3),
+        'time_to_first_token_sec': None,
+        'prompt_tokens': prompt_tokens,
+        'cached_tokens': cached_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': (prompt_tokens or 0) + (completion_tokens or 0),
+        'tokens_per_sec': round(completion_tokens / latency, 2) if completion_tokens and latency > 0 else None,
+        'usage_estimated': False,
+        'stopped_early': False,
+    }
+
+# ==== OLLAMA ====
+
+def check_deadline(metrics, max_duration):
+    if max_duration and time.monotonic() - metrics.start > max_duration:
+        raise StreamStalledError(f"no complete answer within {max_duration:.0f}s")
+
+
+def stream_ollama_chat(client, model_name, messages, stop_at_fence=True, max_duration=None, **kwargs):
+    metrics = StreamMetrics()
+    watcher = FenceWatcher()
+    prompt_tokens = completion_tokens = load_duration = None
+    stream = client.chat(model=model_name, messages=messages, stream=True, **kwargs)
+    try:
+        for chunk in stream:
+            content = chunk['message']['content']
+            if content:
+                metrics.token_seen()
+                if watcher.feed(content) and stop_at_fence:
+                    break
+            if call_cancelled():
+                raise StreamCancelledError("cancelled, another backend answered first")
+            check_deadline(metrics, max_duration)
+            if chunk.get('done'):
+                prompt_tokens = chunk.get('prompt_eval_count')
+                completion_tokens = chunk.get('eval_count')
+                load_duration = chunk.get('load_duration')
+    except httpx.TimeoutException:
+        raise StreamStalledError("no tokens from Ollama within the inactivity timeout")
+    finally:
+        # Closing the generator drops the connection, which stops generation server-side
+        stream.close()
+    prompt_tokens = prompt_tokens or _estimate_prompt_tokens(messages)
+    result = metrics.finish(watcher.text, prompt_tokens, completion_tokens, watcher.closed and stop_at_fence)
+    # Only reported on the final chunk, so unknown when the stream was cut at the fence
+    result['load_duration_sec'] = round(load_duration / 1e9, 3) if load_duration else None
+    return watcher.text, result
+
+# ==== AZURE OPENAI ====
+
+def stream_azure_chat(client, deployment, messages, temperature, timeout, stop_at_fence=True, max_duration=None):
+    metrics = StreamMetrics()
+    watcher = FenceWatcher()
+    prompt_tokens = completion_tokens = cached_tokens = None
+    stream = client.chat.completions.create(
+        model=deployment,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        # read timeout applies between chunks, i.e. it is an inactivity timeout
+        timeout=httpx.Timeout(timeout, connect=30)
+    )
+    fence_closed = False
+    try:
+        for chunk in stream:
+            # Text after the closing fence is dropped, but the stream is read on for the final
+            # usage chunk, the only place Azure reports prompt and cached token counts
+            if chunk.choices and not fence_closed:
+                content = chunk.choices[0].delta.content
+                if content:
+                    metrics.token_seen()
+                    fence_closed = watcher.feed(content) and stop_at_fence
+            if call_cancelled():
+                raise StreamCancelledError("cancelled, another backend answered first")
+            check_deadline(metrics, max_duration)
+            if getattr(chunk, 'usage', None):
+                prompt_tokens = chunk.usage.prompt_tokens
+                completion_tokens = chunk.usage.completion_tokens
+                cached_tokens = cached_prompt_tokens(chunk.usage)
+    except httpx.TimeoutException:
+        raise StreamStalledError(f"no tokens from Azure within {timeout}s")
+    finally:
+        stream.close()
+    prompt_tokens = prompt_tokens or _estimate_prompt_tokens(messages)
+    return watcher.text, metrics.finish(watcher.text, prompt_tokens, completion_tokens, fence_closed, cached_tokens)
@@ -0,0 +1,136 @@
+import re
+import ast
+import json
+import logging
+
+# ==== NOTEBOOK CELL MAPPING ====
+
+CELL_START = re.compile(r'^\s*"cell_type"\s*:\s*"(\w+)"')
+SOURCE_START = re.compile(r'^\s*"source"\s*:\s*\[')
+CELL_MARKER = re.compile(r"^# %% \[cell (\d+)\]\s*$")
+# IPython magics and shell escapes are not Python, mask them before parsing
+MAGIC_LINE = re.compile(r"^\s*[%!]")
+
+DEFAULT_CONTEXT_LINES = 8
+
+
+def is_notebook(file_path):
+    return file_path.lower().endswith('.ipynb')
+
+
+def cell_source(cell):
+    source = cell.get('source', '')
+    return "".join(source) if isinstance(source, list) else source
+
+
+def map_issues_to_cells(raw_text, notebook, issues):
+    """Assign Sonar issues, whose lines point into the notebook JSON, to code cells.
+
+    Returns ({cell_index: [issue with cell_line]}, unplaced). Relies on
+    "cell_type" opening every cell object, which is how Jupyter writes them.
+    """
+    cell_starts, source_starts = [], {}
+    for lineno, line in enumerate(raw_text.splitlines(), start=1):
+        if CELL_START.match(line):
+            cell_starts.append(lineno)
+        elif SOURCE_START.match(line) and cell_starts:
+            source_starts.setdefault(len(cell_starts) - 1, lineno)
+
+    cells = notebook.get('cells', [])
+    by_cell, unplaced = {}, []
+    if len(cell_starts) != len(cells):
+        logging.warning("⚠️ Notebook layout not recognised, cannot map issues to cells")
+        return by_cell, list(issues)
+
+    for issue in issues:
+        line = issue.get('line')
+        index = None
+        if line:
+            for i, start in enumerate(cell_starts):
+                if start <= line:
+                    index = i
+        if index is None or cells[index].get('cell_type') != 'code':
+            unplaced.append(issue)
+            continue
+        cell_line = line - source_starts[index] if index in source_starts else None
+        by_cell.setdefault(index, []).append(dict(issue, cell=index, cell_line=cell_line))
+    return by_cell, unplaced
+
+
+def previous_code_cell(cells, index):
+    for i in range(index - 1, -1, -1):
+        if cells[i].get('cell_type') == 'code':
+            return i
+    return None
+
+
+def build_context(cells, indexes, context_lines=DEFAULT_CONTEXT_LINES):
+    """Tail of the nearest preceding code cell for each affected cell, read-only for the model."""
+    parts = []
+    for index in indexes:
+        previous = previous_code_cell(cells, index)
+        if previous is None or previous in indexes:
+            continue
+        tail = cell_source(cells[previous]).splitlines()[-context_lines:]
+        parts.append(f"# %% [cell {previous}] (context, last {len(tail)} lines)\n" + "\n".join(tail))
+    return "\n\n".join(parts)
+
+
+def build_cells_block(cells, indexes):
+    return "\n\n".join(f"# %% [cell {i}]\n{cell_source(cells[i]).rstrip()}" for i in indexes)
+
+
+def parse_cells(code):
+    """Split a model reply on `# %% [cell N]` markers into {N: source}."""
+    fixed, current, lines = {}, None, []
+    for line in (code or "").splitlines():
+        marker = CELL_MARKER.match(line.strip())
+        if marker:
+            if current is not None:
+                fixed[current] = "\n".join(lines).strip("\n")
+            current, lines = int(marker.group(1)), []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        fixed[current] = "\n".join(lines).strip("\n")
+    return fixed
+
+
+def cell_parses(source):
+    masked = "\n".join("pass" if MAGIC_LINE.match(line) else line for line in source.splitlines())
+    try:
+        ast.parse(masked)
+        return True
+    except SyntaxError:
+        return False
+
+
+def to_source_lines(text):
+    lines = text.split("\n")
+    return [line + "\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+
+def json_indent(raw_text):
+    second = raw_text.split("\n", 2)[1] if raw_text.count("\n") > 1 else ""
+    return (len(second) - len(second.lstrip(" "))) or 1
+
+
+def apply_cells(raw_text, notebook, fixed_cells, allowed):
+    """Write fixed sources back into their cells; outputs and metadata are left untouched.
+
+    Returns (new_text, applied, rejected). Cells that were not requested or no
+    longer parse are kept as they were.
+    """
+    cells = notebook.get('cells', [])
+    applied, rejected = [], []
+    for index, source in fixed_cells.items():
+        if index not in allowed or not cell_parses(source):
+            rejected.append(index)
+            continue
+        if source.rstrip() != cell_source(cells[index]).rstrip():
+            cells[index]['source'] = to_source_lines(source)
+            applied.append(index)
+    new_text = json.dumps(notebook, indent=json_indent(raw_text), ensure_ascii=False)
+    if raw_text.endswith("\n"):
+        new_text += "\n"
+    return new_text, sorted(applied), sorted(rejected)
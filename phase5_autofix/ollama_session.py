@@ -0,0 +1,169 @@
+import time
+import logging
+import threading
+
+from llm_dispatcher import estimate_tokens, get_ollama_client
+
+# ==== OLLAMA MODEL RESIDENCY ====
+
+DEFAULT_KEEP_ALIVE = -1  # keep the model loaded until we release it
+DEFAULT_MIN_CTX = 4096
+DEFAULT_MAX_CTX = 16384
+# Upper bound for loading the model; a hung server must not block local calls forever
+DEFAULT_PRELOAD_TIMEOUT_SEC = 600
+# Loads shorter than this are the server touching an already resident model
+RELOAD_THRESHOLD_SEC = 1.0
+# Room left for the system prompt, chat template and tokenizer estimate error
+CTX_MARGIN_TOKENS = 512
+
+
+def ollama_settings(config):
+    return config['autofix'].get('ollama', {}) or {}
+
+
+class OllamaSession:
+    """Keeps one local model resident for a whole run and sizes its context per request.
+
+    Ollama reloads the model whenever num_ctx changes, so context sizes are
+    rounded up to power-of-two buckets and never shrink during a session.
+    """
+
+    def __init__(self, config, model_name):
+        settings = ollama_settings(config)
+        self.config = config
+        self.model_name = model_name
+        self.keep_alive = settings.get('keep_alive', DEFAULT_KEEP_ALIVE)
+        self.min_ctx = int(settings.get('min_ctx', DEFAULT_MIN_CTX))
+        self.max_ctx = int(settings.get('max_ctx', DEFAULT_MAX_CTX))
+        self.preload_timeout = settings.get('preload_timeout_sec', DEFAULT_PRELOAD_TIMEOUT_SEC)
+        self.num_ctx = self.min_ctx
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.thread = None
+        self.timings = {
+            'preload_sec': None,
+            'load_duration_sec': None,
+            'reloads': 0,
+            'reload_sec': 0.0,
+            'ctx_resizes': 0,
+            'oversized_prompts': 0,
+        }
+
+    def _load(self):
+        # An empty generate loads the model and applies keep_alive without producing tokens
+        client = get_ollama_client(self.config, self.preload_timeout)
+        start = time.monotonic()
+        response = client.generate(model=self.model_name, prompt="", keep_alive=self.keep_alive,
+                                   options={'num_ctx': self.num_ctx})
+        elapsed = time.monotonic() - start
+        load_duration = (response.get('load_duration') or 0) / 1e9
+        return elapsed, load_duration
+
+    def _preload(self):
+        try:
+            elapsed, load_duration = self._load()
+            self.timings['preload_sec'] = round(elapsed, 3)
+            self.timings['load_duration_sec'] = round(load_duration, 3)
+            logging.info(f"🔥 Preloaded {self.model_name} in {elapsed:.1f}s "
+                         f"(load {load_duration:.1f}s, num_ctx {self.num_ctx}, keep_alive {self.keep_alive})")
+        except Exception as e:
+            logging.warning(f"⚠️ Preloading {self.model_name} failed, first call will load it: {e}")
+        finally:
+            self.ready.set()
+
+    def preload(self, background=True):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._preload, name=f"preload-{self.model_name}")
+                self.thread.start()
+        if not background:
+            self.wait_ready()
+
+    def wait_ready(self, timeout=None):
+        """Wait for the preload, at most `timeout` seconds (the preload timeout by default)."""
+        if self.thread is None:
+            return True
+        return self.ready.wait(self.preload_timeout if timeout is None else timeout)
+
+    def is_resident(self):
+        client = get_ollama_client(self.config, self.preload_timeout)
+        try:
+            running = client.ps().get('models', [])
+        except Exception:
+            return None
+        return any(m.get('name') == self.model_name or m.get('model') == self.model_name for m in running)
+
+    def request_options(self, prompt):
+        """Return (options, keep_alive) for a chat call carrying `prompt`.
+
+        A full-file fix writes back roughly as much as it reads, so the
+        output budget is sized from the prompt rather than left unbounded.
+        """
+        prompt_tokens = estimate_tokens(prompt)
+        num_predict = int(prompt_tokens * 1.25) + 256
+        needed = prompt_tokens + num_predict + CTX_MARGIN_TOKENS
+        bucket = self.min_ctx
+        while bucket < needed and bucket < self.max_ctx:
+            bucket *= 2
+        bucket = min(bucket, self.max_ctx)
+        with self.lock:
+            if bucket > self.num_ctx:
+                logging.info(f"📏 Growing num_ctx for {self.model_name}: {self.num_ctx} -> {bucket}")
+                self.num_ctx = bucket
+                self.timings['ctx_resizes'] += 1
+            num_ctx = self.num_ctx
+            if needed > num_ctx:
+                self.timings['oversized_prompts'] += 1
+        if needed > num_ctx:
+            logging.warning(f"⚠️ Prompt of ~{prompt_tokens} tokens exceeds max_ctx {num_ctx}, output may be cut short")
+        num_predict = max(256, min(num_predict, num_ctx - prompt_tokens - CTX_MARGIN_TOKENS))
+        return {'num_ctx': num_ctx, 'num_predict': num_predict}, self.keep_alive
+
+    def record_call(self, metrics):
+        """Count a reload when a call had to load the model again (evicted or resized)."""
+        load_duration = (metrics or {}).get('load_duration_sec')
+        if load_duration and load_duration > RELOAD_THRESHOLD_SEC:
+            with self.lock:
+                self.timings['reloads'] += 1
+                self.timings['reload_sec'] = round(self.timings['reload_sec'] + load_duration, 3)
+            logging.warning(f"⚠️ {self.model_name} was reloaded mid-run ({load_duration:.1f}s)")
+
+    def release(self):
+        try:
+            get_ollama_client(self.config, self.preload_timeout).generate(model=self.model_name, prompt="", keep_alive=0)
+            logging.info(f"🧊 Released {self.model_name}")
+        except Exception as e:
+            logging.warning(f"⚠️ Could not release {self.model_name}: {e}")
+
+    def stats(self):
+        return dict(self.timings, model=self.model_name, num_ctx=self.num_ctx, resident=self.is_resident())
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_ollama_session(config, model_name=None):
+    model_name = model_name or config['autofix']['model']
+    key = (config['autofix'].get('ollama_host'), model_name)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = OllamaSession(config, model_name)
+        return _sessions[key]
+
+
+def start_preload(config):
+    """Start loading the local model in the background, returns the session or None."""
+    if config['backend']['type'] != 'local' or not ollama_settings(config).get('preload', True):
+        return None
+    session = get_ollama_session(config)
+    session.preload(background=True)
+    return session
+
+
+def release_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        if ollama_settings(session.config).get('release_on_exit', False):
+            session.release()
@@ -0,0 +1,134 @@
+import re
+import difflib
+import logging
+
+# ==== PATCH / EDIT-BLOCK APPLIER ====
+
+SEARCH_MARKER = re.compile(r"^<{5,}\s*SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^={5,}\s*$")
+REPLACE_MARKER = re.compile(r"^>{5,}\s*REPLACE\s*$")
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+# Minimum similarity for a fuzzy match of a SEARCH section against the file
+FUZZY_THRESHOLD = 0.9
+
+
+class PatchApplyError(Exception):
+    pass
+
+
+def parse_edit_blocks(llm_output):
+    """Return [(search_lines, replace_lines)] from SEARCH/REPLACE blocks."""
+    edits = []
+    state, search, replace = None, [], []
+    for line in llm_output.splitlines():
+        if SEARCH_MARKER.match(line):
+            state, search, replace = 'search', [], []
+        elif state == 'search' and DIVIDER_MARKER.match(line):
+            state = 'replace'
+        elif state == 'replace' and REPLACE_MARKER.match(line):
+            edits.append((search, replace))
+            state = None
+        elif state == 'search':
+            search.append(line)
+        elif state == 'replace':
+            replace.append(line)
+    return edits
+
+
+def parse_unified_diff(llm_output):
+    """Turn unified-diff hunks into (old_lines, new_lines) edits, ignoring line numbers."""
+    edits = []
+    old, new, in_hunk = [], [], False
+
+    def flush():
+        if old or new:
+            edits.append((old, new))
+
+    for line in llm_output.splitlines():
+        if HUNK_HEADER.match(line):
+            flush()
+            old, new, in_hunk = [], [], True
+        elif line.startswith('```'):
+            flush()
+            old, new, in_hunk = [], [], False
+        elif not in_hunk or line.startswith('\\'):
+            continue
+        elif line.startswith('-'):
+            old.append(line[1:])
+        elif line.startswith('+'):
+            new.append(line[1:])
+        else:
+            # Context line; some models drop the leading space on blank lines
+            old.append(line[1:])
+            new.append(line[1:])
+    flush()
+    return edits
+
+
+def _find_block(lines, search):
+    """Locate `search` in `lines`: exact, whitespace-insensitive, then fuzzy.
+
+    Raises PatchApplyError when the block matches more than one place, since
+    patching the wrong copy of a short or repeated block is worse than falling
+    back to a full-file rewrite.
+    """
+    size = len(search)
+    if size == 0 or size > len(lines):
+        return None
+    normalizers = [lambda l: l, lambda l: l.rstrip(), lambda l: l.strip()]
+    for normalize in normalizers:
+        target = [normalize(l) for l in search]
+        matches = [i for i in range(len(lines) - size + 1)
+                   if [normalize(l) for l in lines[i:i + size]] == target]
+        if len(matches) > 1:
+            raise PatchApplyError(f"SEARCH block matches {len(matches)} places (lines "
+                                  f"{', '.join(str(i + 1) for i in matches[:5])})")
+        if matches:
+            return matches[0]
+
+    best_ratio, best_indexes = 0.0, []
+    target = "\n".join(l.strip() for l in search)
+    for i in range(len(lines) - size + 1):
+        window = "\n".join(l.strip() for l in lines[i:i + size])
+        ratio = difflib.SequenceMatcher(None, target, window).ratio()
+        if ratio > best_ratio:
+            best_ratio, best_indexes = ratio, [i]
+        elif ratio == best_ratio:
+            best_indexes.append(i)
+    if best_ratio < FUZZY_THRESHOLD:
+        return None
+    if len(best_indexes) > 1:
+        raise PatchApplyError(f"SEARCH block fuzzily matches {len(best_indexes)} places equally well")
+    return best_indexes[0]
+
+
+def apply_edits(file_content, edits):
+    lines = file_content.splitlines()
+    for number, (search, replace) in enumerate(edits, 1):
+        try:
+            index = _find_block(lines, search)
+        except PatchApplyError as e:
+            raise PatchApplyError(f"edit {number}/{len(edits)} is ambiguous: {e}")
+        if index is None:
+            raise PatchApplyError(f"edit {number}/{len(edits)} did not match the file")
+        lines = lines[:index] + replace + lines[index + len(search):]
+    return "\n".join(lines) + ("\n" if file_content.endswith("\n") else "")
+
+
+def apply_llm_patch(file_content, llm_output):
+    """Apply edit blocks or a unified diff from an LLM response.
+
+    Returns (new_content, patch_format). Raises PatchApplyError when the
+    response holds no usable edits or any edit fails to match.
+    """
+    if not llm_output:
+        raise PatchApplyError("empty response")
+    edits, patch_format = parse_edit_blocks(llm_output), 'edit_blocks'
+    if not edits:
+        edits, patch_format = parse_unified_diff(llm_output), 'unified_diff'
+    if not edits:
+        raise PatchApplyError("no edit blocks or diff hunks found")
+    new_content = apply_edits(file_content, edits)
+    logging.info(f"🩹 Applied {len(edits)} {patch_format} edit(s)")
+    return new_content, patch_format
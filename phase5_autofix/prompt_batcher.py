@@ -0,0 +1,82 @@
+import os
+import re
+
+from llm_dispatcher import estimate_tokens
+
+# ==== MULTI-FILE BATCHING ====
+
+FILE_HEADER = re.compile(r"^#{2,}\s*FILE:\s*`?(.+?)`?\s*$")
+
+FENCE_LANGUAGES = {
+    '.py': 'python', '.yaml': 'yaml', '.yml': 'yaml', '.sh': 'bash', '.json': 'json',
+    '.toml': 'toml', '.cfg': 'ini', '.ini': 'ini', '.md': 'markdown', '.txt': 'text',
+}
+
+# Notebooks are JSON blobs with outputs and never benefit from batching
+UNBATCHABLE_EXTENSIONS = ('.ipynb',)
+
+
+def fence_language(file_path):
+    if os.path.basename(file_path).lower().startswith('dockerfile'):
+        return 'dockerfile'
+    return FENCE_LANGUAGES.get(os.path.splitext(file_path)[1].lower(), 'text')
+
+
+def plan_batches(work_items, small_file_tokens=800, batch_token_budget=6000, max_files_per_batch=8):
+    """Split work items into batches of small files and a list of single files.
+
+    Work items are (file_path, full_path, file_content, issues) tuples. Small
+    files are packed first-fit in the given order until the token budget or
+    file cap is reached; batches of one are returned as singles.
+    """
+    singles, batches, current, current_tokens = [], [], [], 0
+    for item in work_items:
+        file_path, _, file_content, _ = item
+        tokens = estimate_tokens(file_content)
+        if tokens > small_file_tokens or file_path.lower().endswith(UNBATCHABLE_EXTENSIONS):
+            singles.append(item)
+            continue
+        if current and (current_tokens + tokens > batch_token_budget or len(current) >= max_files_per_batch):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+
+    for batch in [b for b in batches if len(b) == 1]:
+        batches.remove(batch)
+        singles.extend(batch)
+    return batches, singles
+
+
+def parse_batch_response(llm_output, file_paths):
+    """Split a batched response into {file_path: (section_text, code)}.
+
+    Only sections whose header names a requested file and whose code fence
+    is complete are returned; everything else falls back to single calls.
+    """
+    results = {}
+    if not llm_output:
+        return results
+    wanted = set(file_paths)
+    current, section, code, inside = None, [], [], False
+
+    for line in llm_output.splitlines():
+        header = FILE_HEADER.match(line.strip())
+        if header and not inside:
+            current, section, code = header.group(1).strip(), [line], []
+            continue
+        if current is None:
+            continue
+        section.append(line)
+        if not inside and line.strip().startswith("```"):
+            inside = True
+        elif inside and line.strip() == "```":
+            inside = False
+            if current in wanted and code:
+                results[current] = ("\n".join(section), "\n".join(code).strip())
+            current = None
+        elif inside:
+            code.append(line)
+    return results
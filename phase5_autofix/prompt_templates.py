@@ -0,0 +1,167 @@
+# ==== VERSIONED PROMPT TEMPLATES ====
+# Every prompt is a static system section followed by the per-request part
+# (file name, issues, code). The static sections never contain anything file
+# specific, so consecutive requests of the same kind share an identical
+# prefix that Ollama's KV cache can reuse. Azure caches only prompts of 1024+
+# tokens, and the largest section here is ~520, so across files Azure's
+# cached_tokens stays at 0; only repeats of one prompt (retries, hedges) hit.
+
+# Bump whenever any wording below or in the prompt builders changes, so cached responses are not reused
+TEMPLATE_VERSION = "v4"
+
+FILE_TYPES = [
+    "⚠️ IMPORTANT:",
+    "- The file can be any type (Python, YAML, Dockerfile, shell script, config, etc).",
+    "- Always apply rule fixes according to the file's format, language and context.",
+]
+
+FULL_FILE_TASKS = [
+    "🛠️ **Your Tasks:**",
+    "- Carefully scan the **entire file**, not only the specific lines mentioned in the issue list.",
+    "- Apply comprehensive fixes for all occurrences of the same rule types across any part of the file, even if not explicitly listed.",
+    "- Apply each rule correction across the entire file globally wherever relevant.",
+    "- Apply consistent fixes for all similar rule patterns, across all functions, classes, and nested blocks.",
+    "- Do not introduce unrelated refactoring or stylistic changes unrelated to these rules.",
+    "- Preserve file's valid syntax, code logic, functionality, docstrings, comments, and overall code structure.",
+    "- Add any necessary imports if required for your fixes.",
+    "- Avoid excessive code deletions unless strictly necessary to fix rule violations.",
+    "",
+    "**Strict Guidelines:**",
+    "- Do not invent unrelated improvements or rewrite unrelated code.",
+    "- Do not remove valid comments, docstrings, metadata, or logic not related to these issues.",
+    "- Only apply changes necessary to fix the listed issues and closely related violations.",
+    "- Add any missing imports or declarations required to apply the fixes.",
+    "- Avoid introducing unrelated refactoring or over-corrections not tied to the listed rules.",
+    "- If something needs to be restructured to comply with rule (like cognitive complexity reductions), do so while preserving functionality.",
+]
+
+FULL_OUTPUT_FORMAT = [
+    "**IMPORTANT OUTPUT FORMAT:**",
+    "- Return the fully corrected file inside one fenced code block, tagged with the language given in the request.",
+    "- Do NOT include any explanation or commentary.",
+]
+
+PATCH_OUTPUT_FORMAT = [
+    "**IMPORTANT OUTPUT FORMAT:**",
+    "- Do NOT return the whole file. Return ONLY search/replace edit blocks inside one ```diff fence.",
+    "- Each edit block must look exactly like this:",
+    "<<<<<<< SEARCH",
+    "(original lines copied verbatim from the file, enough to be unique)",
+    "=======",
+    "(replacement lines)",
+    ">>>>>>> REPLACE",
+    "- Use one block per changed area, in file order, and keep SEARCH sections short.",
+    "- Do NOT include any explanation or commentary.",
+]
+
+SYSTEM_SECTIONS = {
+    'full': [
+        "You are an expert software engineer tasked with automatically fixing ALL code quality issues detected by SonarQube in one file.",
+        "",
+        *FILE_TYPES,
+        "",
+        *FULL_FILE_TASKS,
+        "",
+        *FULL_OUTPUT_FORMAT,
+    ],
+    'patch': [
+        "You are an expert software engineer tasked with automatically fixing ALL code quality issues detected by SonarQube in one file.",
+        "",
+        *FILE_TYPES,
+        "",
+        *FULL_FILE_TASKS,
+        "",
+        *PATCH_OUTPUT_FORMAT,
+    ],
+    'region': [
+        "You are an expert software engineer tasked with automatically fixing code quality issues detected by SonarQube.",
+        "",
+        "You are given ONLY a snippet of a Python file. Line numbers in the request refer to the full file.",
+        "",
+        "**Strict Guidelines:**",
+        "- Fix the listed issues and closely related violations inside the snippet only.",
+        "- Keep the snippet's original indentation level and its public names and signatures.",
+        "- Do not add code outside the snippet and do not rewrite unrelated code.",
+        "- Preserve code logic, functionality, docstrings and comments.",
+        "- The read-only context from the rest of the file must NOT be returned.",
+        "",
+        "**IMPORTANT OUTPUT FORMAT:**",
+        "- Your output must start with: ```python",
+        "- Your output must end with: ```",
+        "- Do NOT include any explanation or commentary.",
+    ],
+    'batch': [
+        "You are an expert software engineer tasked with automatically fixing ALL code quality issues detected by SonarQube.",
+        "",
+        "You are given several small files. Each file is introduced by a `### FILE: <path>` header, followed by its issues and content.",
+        "",
+        "⚠️ IMPORTANT:",
+        "- The files can be any type (Python, YAML, Dockerfile, shell script, config, etc).",
+        "- Always apply rule fixes according to each file's format, language and context.",
+        "- Fix all occurrences of the listed rule types in each file, not only the listed lines.",
+        "- Do not introduce unrelated refactoring; preserve logic, comments and docstrings.",
+        "",
+        "**IMPORTANT OUTPUT FORMAT:**",
+        "- For EVERY file, output its `### FILE: <path>` header line exactly as given,",
+        "  followed by the fully corrected file inside one fenced code block.",
+        "- Keep the files in the order they were given.",
+        "- Do NOT include any explanation or commentary.",
+    ],
+    'notebook': [
+        "You are an expert software engineer tasked with automatically fixing code quality issues detected by SonarQube.",
+        "",
+        "You are given ONLY the affected code cells of a Jupyter notebook.",
+        "Each cell starts with a `# %% [cell N]` marker line.",
+        "",
+        "**Strict Guidelines:**",
+        "- Fix the listed issues and closely related violations inside the given cells only.",
+        "- Keep IPython magics (`%...`) and shell escapes (`!...`) as they are.",
+        "- Keep names other cells may rely on; do not merge, split, add or drop cells.",
+        "- Preserve code logic, functionality and comments.",
+        "- Read-only context from preceding cells must NOT be returned.",
+        "",
+        "**IMPORTANT OUTPUT FORMAT:**",
+        "- Your output must start with: ```python",
+        "- Return every given cell, each under its unchanged `# %% [cell N]` marker line.",
+        "- Your output must end with: ```",
+        "- Do NOT include any explanation or commentary.",
+    ],
+    'repair': [
+        "You fix syntax errors in code that an automated fixer produced.",
+        "You are given the lines around the error. Fix ONLY the syntax problem;",
+        "keep every other line, the indentation and the logic exactly as they are.",
+        "Return ONLY the corrected lines inside one fenced code block, without commentary.",
+    ],
+    'continuation': [
+        "You complete source files whose corrected version was cut off.",
+        "Continue the file from the line right after the given last lines up to the end of the file.",
+        "Return ONLY the remaining lines inside one fenced code block, without repeating the given lines.",
+    ],
+}
+
+
+class Prompt(str):
+    """Prompt text that also knows its static system section and per-request part.
+
+    It behaves as the full text wherever a plain string is expected (token
+    estimates, cache keys); the backends send `system` and `user` as separate
+    messages.
+    """
+
+    def __new__(cls, system, user):
+        prompt = super().__new__(cls, f"{system}\n\n{user}")
+        prompt.system = system
+        prompt.user = user
+        return prompt
+
+
+def render(template, user_parts):
+    return Prompt("\n".join(SYSTEM_SECTIONS[template]), "\n".join(user_parts))
+
+
+def chat_messages(prompt, default_system=None):
+    """Messages for a chat call: the static section as system message when the prompt has one."""
+    if isinstance(prompt, Prompt):
+        return [{"role": "system", "content": prompt.system}, {"role": "user", "content": prompt.user}]
+    messages = [{"role": "system", "content": default_system}] if default_system else []
+    return messages + [{"role": "user", "content": prompt}]
@@ -0,0 +1,152 @@
+import os
+import ast
+import logging
+
+# ==== AST-AWARE REGION CHUNKING ====
+
+CHUNKABLE_EXTENSIONS = ('.py',)
+
+# Lines of neighbouring code kept around issues that sit outside any statement
+WINDOW_LINES = 3
+
+
+def is_chunkable(file_path):
+    return os.path.splitext(file_path)[1].lower() in CHUNKABLE_EXTENSIONS
+
+
+def _node_span(node):
+    start = node.lineno
+    for decorator in getattr(node, 'decorator_list', []):
+        start = min(start, decorator.lineno)
+    return start, node.end_lineno
+
+
+def _enclosing_span(body, line, max_region_lines):
+    """Smallest sensible statement span in `body` containing `line`."""
+    for node in body:
+        start, end = _node_span(node)
+        if start <= line <= end:
+            # Large classes are split down to the method holding the issue
+            if isinstance(node, ast.ClassDef) and end - start + 1 > max_region_lines:
+                inner = _enclosing_span(node.body, line, max_region_lines)
+                if inner:
+                    return inner
+            return start, end
+    return None
+
+
+def find_regions(file_content, issues, max_region_lines=200):
+    """Group issues into non-overlapping regions of whole functions/classes.
+
+    Returns (regions, unplaced_issues) where each region is a dict with
+    1-based inclusive 'start'/'end' lines and its 'issues'. Issues without a
+    line number cannot be localised and are returned as unplaced.
+    """
+    tree = ast.parse(file_content)
+    total_lines = len(file_content.splitlines())
+    spans = []
+    unplaced = []
+    for issue in issues:
+        line = issue.get('line')
+        if not line:
+            unplaced.append(issue)
+            continue
+        span = _enclosing_span(tree.body, line, max_region_lines)
+        if span is None:
+            span = (max(1, line - WINDOW_LINES), min(total_lines, line + WINDOW_LINES))
+        spans.append((span[0], span[1], issue))
+
+    regions = []
+    for start, end, issue in sorted(spans, key=lambda s: (s[0], s[1])):
+        if regions and start <= regions[-1]['end'] + 1:
+            regions[-1]['end'] = max(regions[-1]['end'], end)
+            regions[-1]['issues'].append(issue)
+        else:
+            regions.append({'start': start, 'end': end, 'issues': [issue]})
+    return regions, unplaced
+
+
+def build_context(file_content, regions):
+    """Imports plus signatures of top-level definitions outside the regions."""
+    tree = ast.parse(file_content)
+    lines = file_content.splitlines()
+    covered = [(r['start'], r['end']) for r in regions]
+
+    def outside(start, end):
+        return all(end < r_start or start > r_end for r_start, r_end in covered)
+
+    context = []
+    for node in tree.body:
+        start, end = _node_span(node)
+        if not outside(start, end):
+            # Keep the enclosing class header when only one of its methods is sent
+            if isinstance(node, ast.ClassDef) and not any(
+                    r_start <= start and end <= r_end for r_start, r_end in covered):
+                context.extend(lines[start - 1:node.lineno])
+                context.append("    ...")
+            continue
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            context.extend(lines[start - 1:end])
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            header_end = node.body[0].lineno - 1 if node.body else end
+            context.extend(lines[start - 1:max(header_end, node.lineno)])
+            context.append("    ...")
+    return "\n".join(context)
+
+
+def extract_region(file_content, region):
+    lines = file_content.splitlines()
+    return "\n".join(lines[region['start'] - 1:region['end']])
+
+
+def _indent_of(text):
+    indents = [len(l) - len(l.lstrip()) for l in text.splitlines() if l.strip()]
+    return min(indents) if indents else 0
+
+
+def _reindent(fixed_code, original_code):
+    """Restore the original leading indentation if the model dedented the snippet."""
+    delta = _indent_of(original_code) - _indent_of(fixed_code)
+    if delta == 0:
+        return fixed_code
+    lines = []
+    for line in fixed_code.splitlines():
+        if line.strip():
+            line = " " * delta + line if delta > 0 else line[-delta:]
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def splice_regions(file_content, regions, fixed_by_region):
+    """Write fixed regions back into the file, bottom-up.
+
+    A region is rejected as a conflict when its original text no longer
+    matches the file or when splicing it makes the module unparsable.
+    Returns (new_content, applied_regions, conflicts).
+    """
+    lines = file_content.splitlines()
+    trailing_newline = file_content.endswith("\n")
+    applied, conflicts = [], []
+
+    for region in sorted(regions, key=lambda r: r['start'], reverse=True):
+        key = (region['start'], region['end'])
+        fixed = fixed_by_region.get(key)
+        if not fixed:
+            continue
+        original = region.get('original', "\n".join(lines[region['start'] - 1:region['end']]))
+        if "\n".join(lines[region['start'] - 1:region['end']]) != original:
+            conflicts.append({'region': key, 'reason': 'original text changed'})
+            continue
+        candidate = lines[:region['start'] - 1] + _reindent(fixed, original).splitlines() + lines[region['end']:]
+        try:
+            ast.parse("\n".join(candidate))
+        except SyntaxError as e:
+            conflicts.append({'region': key, 'reason': f'syntax error after splice: {e}'})
+            continue
+        lines = candidate
+        applied.append(key)
+
+    for conflict in conflicts:
+        logging.warning(f"⚠️ Region {conflict['region']} not applied: {conflict['reason']}")
+    new_content = "\n".join(lines) + ("\n" if trailing_newline else "")
+    return new_content, applied, conflicts
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# ==== PERSISTENT LLM RESPONSE CACHE ====
+
+class ResponseCache:
+    """Content-addressed store of extracted LLM fixes with LRU eviction.
+
+    Entries are keyed by a hash of everything that determines the answer, so
+    the cache is safe to share across runs, repos, forks and backends.
+    """
+
+    def __init__(self, path, max_entries=5000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, extracted_code TEXT, raw_output TEXT,"
+            " model_details TEXT, created REAL, last_access REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(template_version, file_content, issues, model, temperature):
+        sorted_issues = sorted(json.dumps(i, sort_keys=True, default=str) for i in issues)
+        payload = json.dumps({
+            'template': template_version,
+            'content': file_content,
+            'issues': sorted_issues,
+            'model': model,
+            'temperature': temperature,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT extracted_code, raw_output, model_details FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return {
+            'extracted_code': row[0],
+            'raw_output': row[1],
+            'model_details': json.loads(row[2]) if row[2] else {},
+        }
+
+    def put(self, key, extracted_code, raw_output, model_details):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, extracted_code, raw_output, json.dumps(model_details, default=str), now, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+DEFAULT_CACHE_PATH = os.path.join("results", "llm_response_cache.sqlite")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(config):
+    """Return the shared cache, or None when autofix.cache.enabled is false."""
+    global _cache
+    cache_config = config['autofix'].get('cache', {}) or {}
+    if not cache_config.get('enabled', False):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = cache_config.get('path', DEFAULT_CACHE_PATH)
+            _cache = ResponseCache(path, cache_config.get('max_entries', 5000))
+            logging.info(f"♻️ LLM response cache opened: {path}")
+        return _cache
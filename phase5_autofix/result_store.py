@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+
+# ==== RESULT STORE INTERFACE ====
+
+# Fields holding full LLM outputs; stored compressed and never loaded for state checks
+LARGE_FIELD_PREFIXES = ('llm_output_raw_', 'code_extracted_')
+
+DEFAULT_SQLITE_PATH = os.path.join("results", "autofix_results.sqlite")
+
+
+def is_large_field(key):
+    return key.startswith(LARGE_FIELD_PREFIXES)
+
+
+class ResultStore:
+    """Where per-file autofix results live. Records are keyed by (repo_name, full_file_path)."""
+
+    def load_repo_records(self, repo_name, backends):
+        """Return {full_file_path: record} with has_output_<backend> flags, without large outputs."""
+        raise NotImplementedError
+
+    def bulk_upsert(self, updates):
+        """Merge a list of (repo_name, full_file_path, fields) into stored records."""
+        raise NotImplementedError
+
+    def iter_records(self):
+        """Yield every full record, used for migrations."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def writer(self, records=None, batch_size=20):
+        return RecordWriter(self, records, batch_size)
+
+
+class RecordWriter:
+    """Buffers record upserts and sends them to the store in bulk.
+
+    Records are also mirrored into the in-memory `records` map so summaries
+    after processing do not need another query.
+    """
+
+    def __init__(self, store, records=None, batch_size=20, max_delay=5.0):
+        self.store = store
+        self.records = records if records is not None else {}
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def upsert(self, repo_name, file_path, fields):
+        self.pending.append((repo_name, file_path, fields))
+        summary = self.records.setdefault(file_path, {'full_file_path': file_path})
+        for key, value in fields.items():
+            if key.startswith('llm_output_raw_'):
+                summary['has_output_' + key[len('llm_output_raw_'):]] = bool(value)
+            elif key == 'content_hash' or key.startswith('fixed_content_hash_'):
+                summary[key] = value
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush > self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.store.bulk_upsert(self.pending)
+            logging.info(f"💾 Bulk upserted {len(self.pending)} record(s)")
+            self.pending = []
+        self.last_flush = time.monotonic()
+
+# ==== MONGODB STORE ====
+
+class MongoResultStore(ResultStore):
+
+    def __init__(self, db_config):
+        from pymongo import MongoClient
+        if 'username' in db_config and db_config['username']:
+            self.client = MongoClient(
+                host=db_config['host'], port=db_config['port'],
+                username=db_config['username'], password=db_config['password'])
+        else:
+            self.client = MongoClient(host=db_config['host'], port=db_config['port'])
+        self.db = self.client[db_config['db_name']]
+        self.collection = self.db[db_config['collection']]
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        from pymongo import ASCENDING
+        from pymongo.errors import OperationFailure
+        try:
+            self.collection.create_index([('repo_name', ASCENDING), ('full_file_path', ASCENDING)],
+                                         name='repo_full_path', unique=True)
+        except OperationFailure as e:
+            # Legacy duplicates block a unique index; lookups still benefit from a plain one
+            logging.warning(f"⚠️ Unique index not created ({e}), falling back to non-unique")
+            self.collection.create_index([('repo_name', ASCENDING), ('full_file_path', ASCENDING)],
+                                         name='repo_full_path_lookup')
+
+    def load_repo_records(self, repo_name, backends):
+        projection = {'_id': 0, 'full_file_path': 1, 'file_name': 1, 'content_hash': 1}
+        for backend in backends:
+            projection[f"fixed_content_hash_{backend}"] = 1
+            projection[f"has_output_{backend}"] = {
+                '$gt': [{'$strLenCP': {'$ifNull': [f"$llm_output_raw_{backend}", ""]}}, 0]}
+        records = {}
+        for record in self.collection.aggregate([{'$match': {'repo_name': repo_name}}, {'$project': projection}]):
+            if record.get('full_file_path'):
+                records[record['full_file_path']] = record
+        return records
+
+    def bulk_upsert(self, updates):
+        from pymongo import UpdateOne
+        if updates:
+            self.collection.bulk_write([
+                UpdateOne({'repo_name': repo_name, 'full_file_path': file_path}, {'$set': fields}, upsert=True)
+                for repo_name, file_path, fields in updates], ordered=False)
+
+    def iter_records(self):
+        return self.collection.find({}, {'_id': 0})
+
+    def close(self):
+        self.client.close()
+
+# ==== EMBEDDED SQLITE STORE ====
+
+class SqliteResultStore(ResultStore):
+    """Single-file store for air-gapped runs. WAL mode, large outputs zlib-compressed."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " repo_name TEXT NOT NULL, full_file_path TEXT NOT NULL, meta TEXT NOT NULL,"
+            " PRIMARY KEY (repo_name, full_file_path))")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            " repo_name TEXT NOT NULL, full_file_path TEXT NOT NULL, field TEXT NOT NULL, data BLOB,"
+            " PRIMARY KEY (repo_name, full_file_path, field))")
+        self.conn.commit()
+
+    @staticmethod
+    def _compress(value):
+        if value is None:
+            return None
+        return zlib.compress(json.dumps(value, default=str).encode('utf-8'))
+
+    @staticmethod
+    def _decompress(blob):
+        if blob is None:
+            return None
+        return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+    def load_repo_records(self, repo_name, backends):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT full_file_path, meta FROM records WHERE repo_name = ?", (repo_name,)).fetchall()
+        records = {}
+        for file_path, meta in rows:
+            record = json.loads(meta)
+            records[file_path] = {key: record.get(key) for key in
+                                  ['full_file_path', 'file_name', 'content_hash'] +
+                                  [f"fixed_content_hash_{b}" for b in backends] +
+                                  [f"has_output_{b}" for b in backends]}
+        return records
+
+    def bulk_upsert(self, updates):
+        with self.lock, self.conn:
+            for repo_name, file_path, fields in updates:
+                row = self.conn.execute(
+                    "SELECT meta FROM records WHERE repo_name = ? AND full_file_path = ?",
+                    (repo_name, file_path)).fetchone()
+                meta = json.loads(row[0]) if row else {}
+                for key, value in fields.items():
+                    if is_large_field(key):
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+                            (repo_name, file_path, key, self._compress(value)))
+                        if key.startswith('llm_output_raw_'):
+                            meta['has_output_' + key[len('llm_output_raw_'):]] = bool(value)
+                    else:
+                        meta[key] = value
+                meta.update({'repo_name': repo_name, 'full_file_path': file_path})
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                    (repo_name, file_path, json.dumps(meta, default=str)))
+
+    def iter_records(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT repo_name, full_file_path, meta FROM records").fetchall()
+        for repo_name, file_path, meta in rows:
+            record = json.loads(meta)
+            # has_output_* flags are derived, the target store recomputes them
+            record = {k: v for k, v in record.items() if not k.startswith('has_output_')}
+            with self.lock:
+                outputs = self.conn.execute(
+                    "SELECT field, data FROM outputs WHERE repo_name = ? AND full_file_path = ?",
+                    (repo_name, file_path)).fetchall()
+            for field, data in outputs:
+                record[field] = self._decompress(data)
+            yield record
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ==== FACTORY & MIGRATION ====
+
+def open_result_store(db_config):
+    store_type = db_config.get('type', 'mongodb')
+    if store_type == 'mongodb':
+        return MongoResultStore(db_config)
+    if store_type == 'sqlite':
+        return SqliteResultStore(db_config.get('path') or DEFAULT_SQLITE_PATH)
+    raise ValueError(f"Unsupported database type: {store_type}")
+
+
+def migrate_store(source, target, batch_size=200):
+    moved, batch = 0, []
+    for record in source.iter_records():
+        if not record.get('repo_name') or not record.get('full_file_path'):
+            continue
+        batch.append((record['repo_name'], record['full_file_path'], record))
+        if len(batch) >= batch_size:
+            target.bulk_upsert(batch)
+            moved += len(batch)
+            batch = []
+    if batch:
+        target.bulk_upsert(batch)
+        moved += len(batch)
+    return moved
+
+
+# Usage: python result_store.py migrate <mongodb|sqlite>
+# Copies every record from the configured database.type into the other store.
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+    from config_manager import ConfigManager
+
+    if len(sys.argv) != 3 or sys.argv[1] != 'migrate':
+        print("Usage: python result_store.py migrate <mongodb|sqlite>")
+        sys.exit(1)
+
+    db_config = ConfigManager().config['database']
+    source = open_result_store(db_config)
+    target = open_result_store(dict(db_config, type=sys.argv[2]))
+    count = migrate_store(source, target)
+    logging.info(f"✅ Migrated {count} record(s) from {db_config.get('type', 'mongodb')} to {sys.argv[2]}")
+    source.close()
+    target.close()
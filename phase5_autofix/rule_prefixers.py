@@ -0,0 +1,460 @@
+import re
+import io
+import ast
+import logging
+import builtins
+import difflib
+import threading
+import tokenize
+from collections import defaultdict
+
+# ==== DETERMINISTIC RULE PRE-FIXERS ====
+# Mechanical Sonar rules are rewritten here before the LLM stage. Each fixer
+# receives the file content and its issues for one rule, and returns the new
+# content plus the issues it actually handled. Anything it is not sure about
+# is left for the LLM.
+
+PREFIXERS = {}
+
+_stats = defaultdict(lambda: {'issues_fixed': 0, 'files': 0, 'skipped': 0})
+_stats_lock = threading.Lock()
+
+
+def register_prefixer(*rule_ids):
+    def wrap(fn):
+        for rule_id in rule_ids:
+            PREFIXERS[rule_id] = fn
+        return fn
+    return wrap
+
+
+def prefixer_stats():
+    with _stats_lock:
+        return {rule: dict(values) for rule, values in _stats.items()}
+
+# ==== HELPERS ====
+
+def _quoted_name(message):
+    match = re.search(r'"([^"]+)"', message or "")
+    return match.group(1) if match else None
+
+
+def _char_col(line, byte_col):
+    # ast column offsets are UTF-8 byte offsets
+    return len(line.encode('utf-8')[:byte_col].decode('utf-8', errors='ignore'))
+
+
+def _apply_span_edits(lines, edits):
+    """Apply (line_no, byte_start, byte_end, text) edits, right to left per line."""
+    for line_no, start, end, text in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        line = lines[line_no - 1]
+        s, e = _char_col(line, start), _char_col(line, end)
+        lines[line_no - 1] = line[:s] + text + line[e:]
+    return lines
+
+
+def _join(lines, original):
+    return "\n".join(lines) + ("\n" if original.endswith("\n") else "")
+
+
+def _owns_lines(node, lines):
+    """Whether the statement is alone on its lines, apart from indentation and a trailing comment.
+
+    False for `import os; x = 1` or `if DEBUG: import os`, where editing whole
+    lines would drop the neighbouring code.
+    """
+    first, last = lines[node.lineno - 1], lines[node.end_lineno - 1]
+    before = first[:_char_col(first, node.col_offset)]
+    after = last[_char_col(last, node.end_col_offset):].strip()
+    return not before.strip() and (not after or after.startswith('#'))
+
+
+def _enclosing_function(tree, line):
+    best = None
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.lineno <= line <= node.end_lineno:
+            if best is None or node.lineno >= best.lineno:
+                best = node
+    return best
+
+
+def _uses_dynamic_scope(function):
+    for node in ast.walk(function):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('locals', 'vars', 'eval', 'exec'):
+            return True
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            return True
+    return False
+
+
+def _parameter_names(function):
+    args = function.args
+    names = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+    names += [a.arg for a in (args.vararg, args.kwarg) if a]
+    return set(names)
+
+
+NESTED_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef,
+                 ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def _own_scope_nodes(function):
+    """Nodes of the function's own scope, plus the nested scopes found in it."""
+    own, nested, pending = [], [], list(ast.iter_child_nodes(function))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, NESTED_SCOPES):
+            nested.append(node)
+            # Decorators and defaults are evaluated in the enclosing scope
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                own.append(node)
+                pending += node.decorator_list
+            if isinstance(node, ast.ClassDef):
+                pending += node.bases + node.keywords
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                pending += [d for d in node.args.defaults + node.args.kw_defaults if d is not None]
+            continue
+        own.append(node)
+        pending += ast.iter_child_nodes(node)
+    return own, nested
+
+
+def _is_binding(node, name):
+    """Whether node binds `name` other than as a plain variable store."""
+    if isinstance(node, ast.arg):
+        return node.arg == name
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.ExceptHandler)):
+        return node.name == name
+    if isinstance(node, ast.alias):
+        return (node.asname or node.name.split('.')[0]) == name
+    if isinstance(node, (ast.Global, ast.Nonlocal)):
+        return name in node.names
+    # match statement captures (MatchAs, MatchStar, MatchMapping rest)
+    return type(node).__name__.startswith('Match') and name in (getattr(node, 'name', None), getattr(node, 'rest', None))
+
+
+def _local_occurrences(function, name):
+    """ast.Name nodes referring to the function's local `name`.
+
+    Returns None when the name cannot be safely treated as one variable: it
+    is bound some other way (import, except, def), or a nested function,
+    lambda, class or comprehension binds or shadows it. Nested scopes that
+    only read the name refer to the local and are included.
+    """
+    own, nested = _own_scope_nodes(function)
+    if any(_is_binding(node, name) for node in own):
+        return None
+    occurrences = [n for n in own if isinstance(n, ast.Name) and n.id == name]
+    for scope in nested:
+        inner = list(ast.walk(scope))
+        names = [n for n in inner if isinstance(n, ast.Name) and n.id == name]
+        if any(_is_binding(n, name) for n in inner[1:]) or any(not isinstance(n.ctx, ast.Load) for n in names):
+            return None
+        occurrences += names
+    # Defaults and decorators of nested functions are seen from both sides
+    return list({id(n): n for n in occurrences}.values())
+
+
+def _string_lines(content):
+    """Lines that lie inside multi-line string literals (unsafe to edit)."""
+    inside, fstring_starts = set(), []
+    fstring_start = getattr(tokenize, 'FSTRING_START', None)  # Python 3.12+
+    fstring_end = getattr(tokenize, 'FSTRING_END', None)
+    for token in tokenize.generate_tokens(io.StringIO(content).readline):
+        if token.type == tokenize.STRING and token.end[0] > token.start[0]:
+            inside.update(range(token.start[0], token.end[0]))
+        elif fstring_start is not None and token.type == fstring_start:
+            fstring_starts.append(token.start[0])
+        elif fstring_end is not None and token.type == fstring_end and fstring_starts:
+            inside.update(range(fstring_starts.pop(), token.end[0]))
+    return inside
+
+
+def remap_issue_lines(old_content, new_content, issues):
+    """Shift issue line numbers after lines were inserted or removed."""
+    if old_content == new_content:
+        return issues
+    matcher = difflib.SequenceMatcher(None, old_content.splitlines(), new_content.splitlines(), autojunk=False)
+    mapping = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for offset, old_index in enumerate(range(i1, i2)):
+            mapping[old_index + 1] = (j1 + offset + 1) if tag == 'equal' else (j1 + 1)
+    remapped = []
+    for issue in issues:
+        line = issue.get('line')
+        remapped.append(dict(issue, line=mapping.get(line, line)) if line else issue)
+    return remapped
+
+# ==== FIXERS ====
+
+@register_prefixer('python:S1131')
+def fix_trailing_whitespace(content, issues):
+    protected = _string_lines(content)
+    lines = content.splitlines()
+    for index, line in enumerate(lines):
+        if index + 1 not in protected:
+            lines[index] = line.rstrip()
+    handled = [i for i in issues if i.get('line') and i['line'] not in protected]
+    return _join(lines, content), handled
+
+
+@register_prefixer('python:S125')
+def fix_commented_out_code(content, issues):
+    lines = content.splitlines()
+    protected = _string_lines(content)
+    to_delete, handled = set(), []
+    for issue in issues:
+        line = issue.get('line')
+        if not line or line in protected or not lines[line - 1].lstrip().startswith('#'):
+            continue
+        indent = len(lines[line - 1]) - len(lines[line - 1].lstrip())
+        block = [line]
+        while block[-1] < len(lines):
+            nxt = lines[block[-1]]
+            if nxt.lstrip().startswith('#') and len(nxt) - len(nxt.lstrip()) == indent and block[-1] + 1 not in protected:
+                block.append(block[-1] + 1)
+            else:
+                break
+        # Delete the longest leading run that really is Python code, not prose
+        for end in range(len(block), 0, -1):
+            code = "\n".join(re.sub(r'^\s*#\s?', '', lines[n - 1]) for n in block[:end])
+            try:
+                parsed = ast.parse(code)
+            except SyntaxError:
+                continue
+            if parsed.body and not all(isinstance(n, ast.Expr) and isinstance(n.value, (ast.Name, ast.Constant))
+                                       for n in parsed.body):
+                to_delete.update(block[:end])
+                handled.append(issue)
+            break
+    lines = [l for n, l in enumerate(lines, 1) if n not in to_delete]
+    return _join(lines, content), handled
+
+
+@register_prefixer('python:S1128')
+def fix_unused_imports(content, issues):
+    tree = ast.parse(content)
+    lines = content.splitlines()
+    imports = {node.lineno: node for node in ast.walk(tree) if isinstance(node, (ast.Import, ast.ImportFrom))}
+    handled, removals, rewrites = [], [], {}
+
+    # Sonar reports one issue per unused name, so a statement can carry several;
+    # decide once per statement and remove or rewrite it at most once
+    by_node = defaultdict(list)
+    for issue in issues:
+        node = imports.get(issue.get('line'))
+        if node is not None:
+            by_node[node].append(issue)
+
+    for node, node_issues in by_node.items():
+        if isinstance(node, ast.ImportFrom) and node.module == '__future__':
+            continue
+        if any(alias.name == '*' for alias in node.names) or not _owns_lines(node, lines):
+            continue
+        statement_lines = set(range(node.lineno, node.end_lineno + 1))
+        others = "\n".join(l for n, l in enumerate(lines, 1) if n not in statement_lines)
+
+        def bound(alias):
+            return alias.asname or alias.name.split('.')[0]
+
+        # Conservative: any other textual mention (code, strings, __all__) counts as a use
+        unused = [a for a in node.names if not re.search(r'\b%s\b' % re.escape(bound(a)), others)]
+        if not unused:
+            continue
+        if len(unused) == len(node.names):
+            removals.append(node)
+        elif node.lineno == node.end_lineno:
+            kept = [a for a in node.names if a not in unused]
+            names = ", ".join(a.name + (f" as {a.asname}" if a.asname else "") for a in kept)
+            if isinstance(node, ast.ImportFrom):
+                statement = f"from {'.' * node.level}{node.module or ''} import {names}"
+            else:
+                statement = f"import {names}"
+            line = lines[node.lineno - 1]
+            indent = line[:len(line) - len(line.lstrip())]
+            rewrites[node.lineno] = indent + statement + line[_char_col(line, node.end_col_offset):]
+        else:
+            continue
+        handled += node_issues
+
+    for line_no, text in rewrites.items():
+        lines[line_no - 1] = text
+    for node in sorted(removals, key=lambda n: n.lineno, reverse=True):
+        line = lines[node.lineno - 1]
+        indent = line[:len(line) - len(line.lstrip())]
+        # Keep blocks like `try:` valid when the import was their only statement
+        lines[node.lineno - 1:node.end_lineno] = [indent + "pass"]
+        candidate = lines[:node.lineno - 1] + lines[node.lineno:]
+        try:
+            ast.parse("\n".join(candidate))
+            lines = candidate
+        except SyntaxError:
+            pass
+    return _join(lines, content), handled
+
+
+@register_prefixer('python:S1481')
+def fix_unused_local_variables(content, issues):
+    tree = ast.parse(content)
+    if any(isinstance(n, ast.Name) and n.id == '_' and isinstance(n.ctx, ast.Load) for n in ast.walk(tree)):
+        return content, []  # `_` is meaningful here (e.g. gettext)
+    lines = content.splitlines()
+    edits, handled = [], []
+    for issue in issues:
+        name, line = _quoted_name(issue.get('message')), issue.get('line')
+        function = _enclosing_function(tree, line or 0)
+        if not name or function is None or _uses_dynamic_scope(function) or name in _parameter_names(function):
+            continue
+        occurrences = _local_occurrences(function, name)
+        if occurrences is None or any(not isinstance(n.ctx, ast.Store) for n in occurrences):
+            continue
+        targets = [n for n in occurrences if n.lineno == line]
+        if not targets:
+            continue
+        edits += [(n.lineno, n.col_offset, n.end_col_offset, '_') for n in targets]
+        handled.append(issue)
+    return _join(_apply_span_edits(lines, edits), content), handled
+
+
+def _snake_case(name):
+    snake = re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name)
+    snake = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1_\2', snake)
+    return re.sub(r'_+', '_', snake).lower()
+
+
+@register_prefixer('python:S117')
+def fix_local_variable_naming(content, issues):
+    tree = ast.parse(content)
+    all_names = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)} | set(dir(builtins))
+    lines = content.splitlines()
+    edits, handled, renamed = [], [], set()
+    for issue in issues:
+        name, line = _quoted_name(issue.get('message')), issue.get('line')
+        if not name or 'local variable' not in (issue.get('message') or ''):
+            continue
+        function = _enclosing_function(tree, line or 0)
+        new_name = _snake_case(name)
+        if (function is None or new_name == name or new_name in all_names or (function, name) in renamed
+                or _uses_dynamic_scope(function) or name in _parameter_names(function)
+                or not re.fullmatch(r'[_a-z][a-z0-9_]*', new_name)):
+            continue
+        occurrences = _local_occurrences(function, name)
+        if not occurrences or not any(isinstance(n.ctx, ast.Store) for n in occurrences):
+            continue
+        edits += [(n.lineno, n.col_offset, n.end_col_offset, new_name) for n in occurrences]
+        renamed.add((function, name))
+        all_names.add(new_name)
+        handled.append(issue)
+    return _join(_apply_span_edits(lines, edits), content), handled
+
+
+def _constant_name(literal, taken):
+    base = re.sub(r'[^A-Za-z0-9]+', '_', literal).strip('_').upper()[:30].strip('_') or 'STR'
+    if base[0].isdigit():
+        base = 'STR_' + base
+    name, suffix = base, 2
+    while name in taken:
+        name, suffix = f"{base}_{suffix}", suffix + 1
+    return name
+
+
+def _is_single_string_token(segment):
+    try:
+        tokens = [t for t in tokenize.generate_tokens(io.StringIO(segment).readline)
+                  if t.type not in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER)]
+    except tokenize.TokenError:
+        return False
+    return len(tokens) == 1 and tokens[0].type == tokenize.STRING
+
+
+@register_prefixer('python:S1192')
+def fix_duplicated_literals(content, issues):
+    tree = ast.parse(content)
+    lines = content.splitlines()
+    docstrings = {id(node.body[0].value) for node in ast.walk(tree)
+                  if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+                  and node.body and isinstance(node.body[0], ast.Expr)
+                  and isinstance(node.body[0].value, ast.Constant)}
+    in_fstring = {id(v) for n in ast.walk(tree) if isinstance(n, ast.JoinedStr) for v in n.values}
+    # A name in a `case` pattern is a capture, not a value, so pattern literals must stay
+    match_case = getattr(ast, 'match_case', None)  # Python 3.10+
+    in_pattern = {id(c) for n in ast.walk(tree) if match_case and isinstance(n, match_case)
+                  for c in ast.walk(n.pattern)}
+    taken = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+    edits, handled, definitions = [], [], []
+
+    for issue in issues:
+        match = re.search(r'literal "(.*)" \d+ times', issue.get('message') or "")
+        if not match:
+            continue
+        literal = match.group(1)
+        nodes = [n for n in ast.walk(tree)
+                 if isinstance(n, ast.Constant) and isinstance(n.value, str) and n.value == literal
+                 and id(n) not in docstrings and id(n) not in in_fstring and id(n) not in in_pattern
+                 and n.lineno == n.end_lineno]
+        segments = [ast.get_source_segment(content, n) for n in nodes]
+        if len(nodes) < 2 or not all(seg and _is_single_string_token(seg) for seg in segments):
+            continue
+        name = _constant_name(literal, taken)
+        taken.add(name)
+        definitions.append(f"{name} = {segments[0]}")
+        edits += [(n.lineno, n.col_offset, n.end_col_offset, name) for n in nodes]
+        handled.append(issue)
+
+    if not definitions:
+        return content, []
+    lines = _apply_span_edits(lines, edits)
+    # Constants go after the module docstring and the leading import block
+    insert_at = 0
+    for node in tree.body:
+        is_docstring = node is tree.body[0] and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+        if is_docstring or isinstance(node, (ast.Import, ast.ImportFrom)):
+            insert_at = node.end_lineno
+        else:
+            break
+    needs_gap = insert_at >= len(lines) or lines[insert_at].strip() != ""
+    block = ([""] if insert_at else []) + definitions + ([""] if needs_gap else [])
+    lines[insert_at:insert_at] = block
+    return _join(lines, content), handled
+
+# ==== RUNNER ====
+
+def apply_prefixers(file_path, content, issues, enabled_rules=None):
+    """Run every registered fixer that has issues in this file.
+
+    Returns (new_content, remaining_issues, handled_issues). Only Python
+    sources are rewritten; a fixer whose output no longer parses is discarded.
+    """
+    if not file_path.endswith('.py'):
+        return content, issues, []
+    try:
+        ast.parse(content)
+    except SyntaxError:
+        return content, issues, []
+
+    remaining, handled_all = list(issues), []
+    for rule_id, fixer in PREFIXERS.items():
+        if enabled_rules is not None and rule_id not in enabled_rules:
+            continue
+        rule_issues = [i for i in remaining if i.get('rule') == rule_id]
+        if not rule_issues:
+            continue
+        try:
+            new_content, handled = fixer(content, rule_issues)
+            ast.parse(new_content)
+        except Exception as e:
+            logging.debug(f"Prefixer {rule_id} skipped for {file_path}: {e}")
+            handled, new_content = [], content
+        with _stats_lock:
+            _stats[rule_id]['issues_fixed'] += len(handled)
+            _stats[rule_id]['skipped'] += len(rule_issues) - len(handled)
+            _stats[rule_id]['files'] += 1 if handled else 0
+        if not handled:
+            continue
+        handled_ids = {id(i) for i in handled}
+        others = [i for i in remaining if id(i) not in handled_ids]
+        remaining = remap_issue_lines(content, new_content, others)
+        content = new_content
+        handled_all += handled
+    return content, remaining, handled_all
+
@@ -1,13 +1,18 @@
 import os
+import re
 import sys
+import copy
+import math
 import json
+import time
+import hashlib
 import datetime
 import logging
-from pymongo import MongoClient
+import openai
 import requests
-import ollama
 import pandas as pd
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -15,21 +20,35 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 # ==== CONFIG LOADER ====
 sys.path.append("../utils")
 from config_manager import ConfigManager
+from llm_dispatcher import (estimate_tokens, get_backend_limiter, get_backend_concurrency,
+                            get_azure_client, get_ollama_client, dispatch_work)
+from response_cache import get_response_cache
+from patch_applier import apply_llm_patch, PatchApplyError
+from llm_streaming import (streaming_enabled, inactivity_timeout, stream_ollama_chat,
+                           stream_azure_chat, blocking_call_metrics, StreamCancelledError, call_cancelled, cached_prompt_tokens)
+import region_chunker
+import prompt_batcher
+from code_validation import validate_code
+import code_extraction
+import notebook_fixer
+import usage_ledger
+import autofix_budget
+import issue_compactor
+import hedging
+import llm_resilience
+import prompt_templates
+from code_extraction import extract_code
+from result_store import open_result_store
+from rule_prefixers import apply_prefixers, prefixer_stats
+from ollama_session import get_ollama_session, start_preload, release_sessions
 
 config_mgr = ConfigManager()
 config = config_mgr.config
 
-# ==== MONGODB CONNECTION ====
+# ==== RESULT STORE ====
 
-def connect_to_mongodb(db_config):
-    if 'username' in db_config and db_config['username']:
-        client = MongoClient(
-            host=db_config['host'], port=db_config['port'],
-            username=db_config['username'], password=db_config['password'])
-    else:
-        client = MongoClient(host=db_config['host'], port=db_config['port'])
-    db = client[db_config['db_name']]
-    return db[db_config['collection']]
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 # ==== LATEST NORMALIZED FILE ====
 
@@ -53,164 +72,534 @@ def load_issues_by_file(normalized_json_path):
     return issues_by_file
 
 # ==== PROMPT BUILDER ====
+# Static instructions live in prompt_templates; only the per-file part is built here, and it always goes last.
 
-def build_llm_prompt(file_content, issues, file_name):
-    issue_descriptions = "\n".join([
-        f"- Rule: {i['rule']}, Severity: {i['severity']}, Line: {i['line']}, Message: {i['message']}"
-        for i in issues
-    ])
+def build_llm_prompt(file_content, issues, file_name, output_mode='full'):
+    # The prompt asks for every occurrence of each rule to be fixed, so long issue lists can be capped
+    issue_descriptions = issue_compactor.describe_issues(issues, config, file_name)
+    language = prompt_batcher.fence_language(file_name)
 
-    prompt_parts = [
-        "You are an expert software engineer tasked with automatically fixing ALL code quality issues related to the rules listed below.",
-        "",
-        f"You are tasked to fix ALL code quality issues detected by SonarQube for the following file: `{file_name}`.",
-        "",
-        "⚠️ IMPORTANT:",
-        "- The file can be any type (Python, YAML, Dockerfile, shell script, config, etc).",
-        "- Always apply rule fixes according to the file's format, language and context.",
+    user_parts = [
+        f"File: `{file_name}`",
         "",
         f"SonarQube reported {len(issues)} issue(s):",
         issue_descriptions,
         "",
-        "🛠️ **Your Tasks:**",
-        "- Carefully scan the **entire file**, not only the specific lines mentioned above.",
-        "- Apply comprehensive fixes for all occurrences of the same rule types across any part of the file, even if not explicitly listed above.",
-        "- Apply each rule correction across the entire file globally wherever relevant.",
-        "- Apply consistent fixes for all similar rule patterns, across all functions, classes, and nested blocks.",
-        "- Do not introduce unrelated refactoring or stylistic changes unrelated to these rules.",
-        "- Preserve file's valid syntax, code logic, functionality, docstrings, comments, and overall code structure.",
-        "- Add any necessary imports if required for your fixes.",
-        "- Avoid excessive code deletions unless strictly necessary to fix rule violations.",
+        "Here is the full file content you must fix:",
+        "```",
+        file_content,
+        "```",
         "",
-        "**Strict Guidelines:**",
-        "- Do not invent unrelated improvements or rewrite unrelated code.",
-        "- Do not remove valid comments, docstrings, metadata, or logic not related to these issues.",
-        "- Only apply changes necessary to fix the listed issues and closely related violations.",
-        "- Add any missing imports or declarations required to apply the fixes.",
-        "- Avoid introducing unrelated refactoring or over-corrections not tied to the listed rules.",
-        "- If something needs to be restructured to comply with rule (like cognitive complexity reductions), do so while preserving functionality.",
+        ("Please provide ONLY the edit blocks now:" if output_mode == 'patch'
+         else f"Please provide ONLY the fully corrected file content now, starting with ```{language} and ending with ```:")
+    ]
+
+    return prompt_templates.render('patch' if output_mode == 'patch' else 'full', user_parts)
+
+
+def build_region_prompt(region_code, context, issues, file_name, start_line, end_line):
+    issue_descriptions = issue_compactor.describe_issues(issues, config, file_name, fix_everywhere=False)
+
+    user_parts = [
+        f"File: `{file_name}`, lines {start_line}-{end_line}",
         "",
-        "**IMPORTANT OUTPUT FORMAT:**",
-        "- Your output must start with: ```python",
-        "- Your output must end with: ```",
-        "- Do NOT include any explanation or commentary.",
+        f"SonarQube reported {len(issues)} issue(s) in this snippet:",
+        issue_descriptions,
         "",
-        "Here is the full file content you must fix:",
+        "Read-only context from the rest of the file (imports and signatures, do NOT return it):",
         "```",
-        file_content,
+        context,
+        "```",
+        "",
+        "Here is the snippet you must fix:",
+        "```",
+        region_code,
         "```",
         "",
-        "Please provide ONLY the fully corrected file content now:"
+        "Please provide ONLY the corrected snippet now:"
     ]
-    
 
-    return "\n".join(prompt_parts)
+    return prompt_templates.render('region', user_parts)
+
+
+def build_batch_prompt(entries):
+    sections = []
+    for file_path, file_content, issues in entries:
+        issue_descriptions = issue_compactor.describe_issues(issues, config, file_path)
+        sections += [
+            f"### FILE: {file_path}",
+            f"SonarQube reported {len(issues)} issue(s):",
+            issue_descriptions,
+            f"```{prompt_batcher.fence_language(file_path)}",
+            file_content,
+            "```",
+            "",
+        ]
+
+    user_parts = [
+        f"Here are the {len(entries)} files you must fix:",
+        "",
+        *sections,
+        "Please provide ONLY the corrected files now, in the same order:"
+    ]
 
+    return prompt_templates.render('batch', user_parts)
 
-# ==== CODE EXTRACTION ====
 
-def extract_python_code(llm_output):
-    if llm_output is None:
-        return None
-    inside = False
-    code_lines = []
-    for line in llm_output.splitlines():
-        if not inside and line.strip().startswith("```python"):
-            inside = True
-            continue
-        if inside:
-            if line.strip() == "```":
-                break
-            code_lines.append(line)
-    return "\n".join(code_lines).strip() if code_lines else None
+def build_notebook_prompt(cells_block, context, issues, file_name):
+    issue_descriptions = issue_compactor.describe_issues(issues, config, file_name, fix_everywhere=False)
+
+    user_parts = [
+        f"Notebook: `{file_name}`",
+        "",
+        f"SonarQube reported {len(issues)} issue(s) in these cells:",
+        issue_descriptions,
+        "",
+        *(["Read-only context from preceding cells (do NOT return it):", "```python", context, "```", ""] if context else []),
+        "Here are the cells you must fix:",
+        "```python",
+        cells_block,
+        "```",
+        "",
+        "Please provide ONLY the corrected cells now:"
+    ]
+
+    return prompt_templates.render('notebook', user_parts)
+
+
+def build_repair_prompt(file_name, region_code, start_line, end_line, error):
+    language = prompt_batcher.fence_language(file_name)
+    user_parts = [
+        f"The corrected version of `{file_name}` fails to parse: {error}",
+        "",
+        f"Below are lines {start_line}-{end_line} of it, where the error is.",
+        "",
+        f"```{language}",
+        region_code,
+        "```",
+        "",
+        f"Return ONLY the corrected lines {start_line}-{end_line} inside one ```{language} fence:"
+    ]
+    return prompt_templates.render('repair', user_parts)
+
+
+def build_continuation_prompt(file_name, tail):
+    language = prompt_batcher.fence_language(file_name)
+    user_parts = [
+        f"Your corrected version of `{file_name}` was cut off. These are its last lines:",
+        "",
+        f"```{language}",
+        tail,
+        "```",
+        "",
+        f"Return ONLY the remaining lines inside one ```{language} fence:"
+    ]
+    return prompt_templates.render('continuation', user_parts)
 
 # ==== BACKEND HANDLERS ====
 
-def run_local_backend(prompt, config):
+def run_local_backend(prompt, config, stop_at_fence=True):
     model_name = config['autofix']['model']
     logging.info(f"🧠 Calling LOCAL LLM: {model_name}")
+    stream = streaming_enabled(config)
+    timeout = llm_resilience.call_timeout('local', prompt, config)
+    # Blocking calls share a few clients whose read timeout is rounded up to whole minutes
+    client = get_ollama_client(config, inactivity_timeout(config) if stream else 60 * math.ceil(timeout / 60.0))
+    session = get_ollama_session(config, model_name)
+    # A preload still in flight is cheaper to wait for than a second concurrent load
+    if not session.wait_ready():
+        logging.warning(f"⚠️ Preload of {model_name} still running after {session.preload_timeout}s, calling anyway")
+    options, keep_alive = session.request_options(prompt)
+    # Static instructions first, so Ollama can reuse the cached prefix between files
+    messages = prompt_templates.chat_messages(prompt)
+
+    def attempt():
+        with get_backend_limiter('local', config).slot():
+            if stream:
+                return stream_ollama_chat(client, model_name, messages, stop_at_fence, max_duration=timeout,
+                                          options=options, keep_alive=keep_alive)
+            start = time.monotonic()
+            response = client.chat(model=model_name, messages=messages, options=options, keep_alive=keep_alive)
+            metrics = blocking_call_metrics(start, response.get('prompt_eval_count'), response.get('eval_count'))
+            load_duration = response.get('load_duration')
+            metrics['load_duration_sec'] = round(load_duration / 1e9, 3) if load_duration else None
+            return response['message']['content'], metrics
+
     try:
-        response = ollama.chat(model=model_name, messages=[{"role": "user", "content": prompt}])
-        return response['message']['content'], {"model": model_name, "source": "local"}
+        (reply, metrics), attempts = llm_resilience.call_with_retries('local', attempt, config)
+        session.record_call(metrics)
+        metrics.update(num_ctx=options['num_ctx'], num_predict=options['num_predict'])
+        return reply, {"model": model_name, "source": "local", "metrics": metrics, "attempts": attempts}
+    except StreamCancelledError as e:
+        return None, {"model": model_name, "source": "local", "cancelled": True, "attempts": e.attempts}
     except Exception as e:
         logging.error(f"❌ Local LLM call failed: {e}")
-        return None, {"model": model_name, "source": "local"}
-
+        return None, {"model": model_name, "source": "local", "attempts": getattr(e, 'attempts', 1)}
 
-
-import time
-import openai
-
-def run_azure_backend(prompt, config):
+def run_azure_backend(prompt, config, stop_at_fence=True):
     logging.info("🧠 Calling Azure OpenAI backend via SDK...")
 
-    api_key = config['azure']['key']
-    endpoint = config['azure']['endpoint']
     deployment = config['azure']['deployment']
-    api_version = config['azure']['version']
     temperature = config['autofix']['temperature']
-
-    # Azure OpenAI SDK style initialization
-    client = openai.AzureOpenAI(
-        api_key=api_key,
-        azure_endpoint=endpoint,
-        api_version=api_version
-    )
-
-    max_retries = 1
-    retry_wait = 10  # seconds
-
-    for attempt in range(1, max_retries + 1):
-        try:
+    stream = streaming_enabled(config)
+    timeout = llm_resilience.call_timeout('azure', prompt, config)
+
+    # Shared client, reused across files and threads
+    client = get_azure_client(config)
+    limiter = get_backend_limiter('azure', config)
+    # Prompt plus a full-file answer of roughly the same size
+    estimated_tokens = estimate_tokens(prompt) * 2
+    # A stable system prefix lets Azure serve it from its prompt cache
+    messages = prompt_templates.chat_messages(prompt, default_system="You are a software fixer.")
+
+    def attempt():
+        with limiter.slot(estimated_tokens):
+            if stream:
+                return stream_azure_chat(client, deployment, messages, temperature,
+                                         inactivity_timeout(config), stop_at_fence, max_duration=timeout)
+            start = time.monotonic()
             response = client.chat.completions.create(
                 model=deployment,
-                messages=[
-                    {"role": "system", "content": "You are a software fixer."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 temperature=temperature,
-                timeout=600  # seconds (timeout for entire request)
+                timeout=timeout  # sized from the expected output length
             )
-
             # Parse response
-            reply = response.choices[0].message.content
-            return reply, {"model": deployment, "source": "azure"}
-
-        except openai.RateLimitError:
-            logging.warning(f"⚠️ Azure Rate Limit hit (429). Attempt {attempt}/{max_retries}. Retrying after {retry_wait} sec...")
-            time.sleep(retry_wait)
-
-        except openai.Timeout:
-            logging.warning(f"⚠️ Azure Timeout occurred. Attempt {attempt}/{max_retries}. Retrying after {retry_wait} sec...")
-            time.sleep(retry_wait)
-
-        except openai.APIError as e:
-            logging.error(f"❌ Azure API Error: {e}")
-            return None, {"model": deployment, "source": "azure"}
+            usage = response.usage
+            return response.choices[0].message.content, blocking_call_metrics(
+                start, usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None,
+                cached_prompt_tokens(usage))
 
-        except Exception as e:
-            logging.error(f"❌ Unexpected error calling Azure OpenAI: {e}")
-            return None, {"model": deployment, "source": "azure"}
-
-    logging.error("❌ Maximum retries exhausted for Azure backend.")
-    return None, {"model": deployment, "source": "azure"}
+    try:
+        (reply, metrics), attempts = llm_resilience.call_with_retries('azure', attempt, config)
+        return reply, {"model": deployment, "source": "azure", "metrics": metrics, "attempts": attempts}
+    except StreamCancelledError as e:
+        return None, {"model": deployment, "source": "azure", "cancelled": True, "attempts": e.attempts}
+    except openai.APIError as e:
+        logging.error(f"❌ Azure API Error: {e}")
+        return None, {"model": deployment, "source": "azure", "attempts": getattr(e, 'attempts', 1)}
+    except Exception as e:
+        logging.error(f"❌ Unexpected error calling Azure OpenAI: {e}")
+        return None, {"model": deployment, "source": "azure", "attempts": getattr(e, 'attempts', 1)}
 
 
-def run_llm_backend(file_content, file_name, file_issues, backend, config):
-    prompt = build_llm_prompt(file_content, file_issues, file_name)
+def get_backend_model(backend, config):
+    if backend == 'local':
+        return config['autofix']['model']
+    if backend == 'azure':
+        return config['azure']['deployment']
+    raise ValueError(f"Unsupported backend: {backend}")
+
+
+def call_backend(prompt, backend, config, stop_at_fence=True, purpose='fix'):
+    # A hedged request that already lost does not start follow-up calls (repairs, continuations)
+    if call_cancelled():
+        return None, {"model": get_backend_model(backend, config), "source": backend, "cancelled": True}
+    # While a backend's circuit is open, calls may go to resilience.reroute_to instead
+    backend = llm_resilience.route(backend, config)
+    # Multi-file responses hold several fences, so they must not stop at the first
     if backend == 'local':
-        raw_output, model_details = run_local_backend(prompt, config)
+        reply, details = run_local_backend(prompt, config, stop_at_fence)
     elif backend == 'azure':
-        raw_output, model_details = run_azure_backend(prompt, config)
+        reply, details = run_azure_backend(prompt, config, stop_at_fence)
     else:
         raise ValueError(f"Unsupported backend: {backend}")
-    extracted_code = extract_python_code(raw_output)
+    usage_ledger.record_call(details, purpose, reply is not None, config)
+    return reply, details
+
+
+DEFAULT_REPAIR_ATTEMPTS = 1
+CONTINUATION_TAIL_LINES = 20
+
+
+def finalize_output(code, truncated, file_name, backend, config, model_details, count_call=True):
+    """Validate extracted code, repairing it with small follow-up requests when it does not parse.
+
+    Returns (code or None, model_details). Tokens of calls whose output ends up
+    unusable are recorded as wasted for the model.
+    """
+    repair_config = config['autofix'].get('repair', {}) or {}
+    model = model_details.get('model')
+    spent = [(code_extraction.call_tokens(model_details), False)] if count_call else []
+
+    def settle(result, details, failed):
+        for tokens, repair in spent:
+            code_extraction.record_call(model, tokens, failed=failed, repair=repair)
+        return result, details
+
+    if not code:
+        return settle(None, dict(model_details, validation='no_code'), True)
+    if not repair_config.get('enabled', True):
+        status, error = validate_code(file_name, code)
+        return settle(code if status != 'invalid' else None, dict(model_details, validation=status), status == 'invalid')
+
+    if truncated:
+        logging.warning(f"✂️ Response for {file_name} was cut off, asking for the rest")
+        tail = "\n".join(code.splitlines()[-CONTINUATION_TAIL_LINES:])
+        reply, details = call_backend(build_continuation_prompt(file_name, tail), backend, config,
+                                      purpose='continuation')
+        spent.append((code_extraction.call_tokens(details), True))
+        rest, _ = extract_code(reply, file_name)
+        if rest:
+            code = code + "\n" + rest
+
+    attempts = 0
+    status, error = validate_code(file_name, code)
+    while status == 'invalid' and attempts < repair_config.get('max_attempts', DEFAULT_REPAIR_ATTEMPTS):
+        attempts += 1
+        start, end = code_extraction.error_region(code, code_extraction.error_line(error),
+                                                  repair_config.get('context_lines', code_extraction.REPAIR_CONTEXT_LINES))
+        region = "\n".join(code.splitlines()[start - 1:end])
+        logging.warning(f"🩹 {file_name} does not parse ({error}), re-asking for lines {start}-{end}")
+        reply, details = call_backend(build_repair_prompt(file_name, region, start, end, error), backend, config,
+                                      purpose='repair')
+        spent.append((code_extraction.call_tokens(details), True))
+        fixed_region, _ = extract_code(reply, file_name)
+        if not fixed_region:
+            break
+        code = code_extraction.replace_lines(code, start, end, fixed_region)
+        status, error = validate_code(file_name, code)
+
+    model_details = dict(model_details, validation=status, repair_attempts=attempts, continued=truncated)
+    if status == 'invalid':
+        logging.warning(f"❌ {file_name} still does not parse after {attempts} repair(s): {error}")
+        return settle(None, dict(model_details, validation_error=error), True)
+    if attempts or truncated:
+        code_extraction.record_repaired(model)
+    return settle(code, model_details, False)
+
+
+def run_patch_backend(file_content, file_name, file_issues, backend, config):
+    """Ask for edit blocks only; fall back to full-file output if they do not apply."""
+    prompt = build_llm_prompt(file_content, file_issues, file_name, output_mode='patch')
+    raw_output, model_details = call_backend(prompt, backend, config, purpose='patch')
+    try:
+        patched, patch_format = apply_llm_patch(file_content, raw_output)
+        status, error = validate_code(file_name, patched)
+        if status == 'invalid':
+            raise PatchApplyError(f"patched file does not parse: {error}")
+        savings = estimate_tokens(file_content) - estimate_tokens(raw_output)
+        model_details = dict(model_details, output_mode='patch', patch_format=patch_format,
+                             output_token_savings=savings, validation=status)
+        code_extraction.record_call(model_details.get('model'), code_extraction.call_tokens(model_details))
+        return patched, raw_output, model_details
+    except PatchApplyError as e:
+        code_extraction.record_call(model_details.get('model'), code_extraction.call_tokens(model_details), failed=True)
+        logging.warning(f"⚠️ Patch did not apply for {file_name} ({e}), falling back to full-file mode")
+
+    prompt = build_llm_prompt(file_content, file_issues, file_name)
+    fallback_output, model_details = call_backend(prompt, backend, config)
+    model_details = dict(model_details, output_mode='full_fallback',
+                         output_token_savings=-estimate_tokens(raw_output))
+    code, truncated = extract_code(fallback_output, file_name)
+    code, model_details = finalize_output(code, truncated, file_name, backend, config, model_details)
+    return code, fallback_output, model_details
+
+
+def response_cache_key(cache, content, issues, backend, config, output_mode='full'):
+    return cache.make_key(f"{prompt_templates.TEMPLATE_VERSION}-{output_mode}", content, issues,
+                          get_backend_model(backend, config),
+                          config['autofix'].get('temperature'))
+
+
+def run_llm_backend(file_content, file_name, file_issues, backend, config, prompt=None):
+    # Caller-built prompts (regions) are small and always use full output
+    caller_prompt = prompt is not None
+    output_mode = 'full' if caller_prompt else config['autofix'].get('output_mode', 'full')
+    cache = get_response_cache(config)
+    cache_key = None
+    if cache:
+        # A caller-built prompt (e.g. a region with context) is itself the cache content
+        cache_key = response_cache_key(cache, prompt or file_content, file_issues, backend, config, output_mode)
+        cached = cache.get(cache_key)
+        if cached:
+            logging.info(f"♻️ Cache hit, reusing stored fix for: {file_name}")
+            model_details = dict(cached['model_details'], cache_hit=True)
+            return cached['extracted_code'], cached['raw_output'], model_details
+
+    if output_mode == 'patch':
+        extracted_code, raw_output, model_details = run_patch_backend(
+            file_content, file_name, file_issues, backend, config)
+    else:
+        if prompt is None:
+            prompt = build_llm_prompt(file_content, file_issues, file_name)
+        raw_output, model_details = call_backend(prompt, backend, config)
+        model_details = dict(model_details, output_mode='full')
+        if caller_prompt:
+            # Region snippets are validated once spliced back into the file
+            extracted_code, _ = extract_code(raw_output)
+            code_extraction.record_call(model_details.get('model'), code_extraction.call_tokens(model_details),
+                                        failed=not extracted_code)
+        else:
+            extracted_code, truncated = extract_code(raw_output, file_name)
+            extracted_code, model_details = finalize_output(
+                extracted_code, truncated, file_name, backend, config, model_details)
+    if cache and extracted_code:
+        cache.put(cache_key, extracted_code, raw_output, model_details)
     return extracted_code, raw_output, model_details
 
+# ==== BATCHED PROCESSING ====
+
+def run_batch_backend(items, backend, config):
+    """Fix several small files with one request.
+
+    Returns {file_path: (extracted_code, raw_output, model_details)}. Files
+    whose section of the response cannot be parsed are retried one by one.
+    """
+    cache = get_response_cache(config)
+    results, pending = {}, []
+    for file_path, _, file_content, issues in items:
+        cached = cache.get(response_cache_key(cache, file_content, issues, backend, config)) if cache else None
+        if cached:
+            logging.info(f"♻️ Cache hit, reusing stored fix for: {file_path}")
+            results[file_path] = (cached['extracted_code'], cached['raw_output'],
+                                  dict(cached['model_details'], cache_hit=True))
+        else:
+            pending.append((file_path, file_content, issues))
+    if not pending:
+        return results
+
+    prompt = build_batch_prompt(pending)
+    logging.info(f"📦 Sending batch of {len(pending)} files (~{estimate_tokens(prompt)} prompt tokens)")
+    raw_output, model_details = call_backend(prompt, backend, config, stop_at_fence=False, purpose='batch')
+    parsed = prompt_batcher.parse_batch_response(raw_output, [p[0] for p in pending])
+    # One call for the whole batch; it is only wasted if no file could be used from it
+    code_extraction.record_call(model_details.get('model'), code_extraction.call_tokens(model_details), failed=not parsed)
+
+    for file_path, file_content, issues in pending:
+        if file_path in parsed:
+            section, code = parsed[file_path]
+            details = dict(model_details, output_mode='full', batched=True, batch_size=len(pending))
+            code, details = finalize_output(code, False, file_path, backend, config, details, count_call=False)
+            results[file_path] = (code, section, details)
+            if cache and code:
+                cache.put(response_cache_key(cache, file_content, issues, backend, config), code, section, details)
+        else:
+            logging.warning(f"⚠️ No usable batch section for {file_path}, retrying as a single file")
+            results[file_path] = run_llm_backend(file_content, file_path, issues, backend, config)
+    return results
+
+# ==== CHUNKED PROCESSING ====
+
+DEFAULT_CHUNK_ABOVE_TOKENS = 4000
+DEFAULT_MAX_PROMPT_TOKENS = 12000
+DEFAULT_MAX_REGION_LINES = 200
+
+
+def run_chunked_backend(file_content, file_name, file_issues, backend, config):
+    chunk_config = config['autofix'].get('chunking', {}) or {}
+    max_prompt_tokens = chunk_config.get('max_prompt_tokens', DEFAULT_MAX_PROMPT_TOKENS)
+    regions, unplaced = region_chunker.find_regions(
+        file_content, file_issues, chunk_config.get('max_region_lines', DEFAULT_MAX_REGION_LINES))
+    if unplaced:
+        logging.warning(f"⚠️ {len(unplaced)} issue(s) without line numbers not sent for {file_name}")
+    context = region_chunker.build_context(file_content, regions)
+
+    prompts = {}
+    for region in regions:
+        region['original'] = region_chunker.extract_region(file_content, region)
+        prompt = build_region_prompt(region['original'], context, region['issues'], file_name,
+                                     region['start'], region['end'])
+        if estimate_tokens(prompt) > max_prompt_tokens:
+            logging.warning(f"⚠️ Region {region['start']}-{region['end']} of {file_name} exceeds token budget, skipping")
+            continue
+        prompts[(region['start'], region['end'])] = (region, prompt)
+
+    if not prompts:
+        return None, None, {"model": get_backend_model(backend, config), "source": backend, "chunked": True}
+
+    # Region calls run on pool threads, which do not inherit the caller's ledger context
+    ledger_context = usage_ledger.current_context()
+
+    def fix_region(key):
+        region, prompt = prompts[key]
+        with usage_ledger.call_context(**ledger_context):
+            return key, run_llm_backend(region['original'], file_name, region['issues'], backend, config,
+                                        prompt=prompt)
+
+    fixed_by_region, raw_parts = {}, []
+    with ThreadPoolExecutor(max_workers=min(len(prompts), get_backend_concurrency(backend, config))) as pool:
+        for key, (extracted, raw_output, model_details) in pool.map(fix_region, list(prompts)):
+            raw_parts.append(f"### Region {key[0]}-{key[1]}\n{raw_output or ''}")
+            if extracted:
+                fixed_by_region[key] = extracted
+
+    new_content, applied, conflicts = region_chunker.splice_regions(file_content, regions, fixed_by_region)
+    model_details = dict(model_details, chunked=True, regions=len(regions),
+                         regions_applied=len(applied), conflicts=conflicts)
+    if applied:
+        new_content, model_details = finalize_output(new_content, False, file_name, backend, config,
+                                                     model_details, count_call=False)
+    return (new_content if applied else None), "\n\n".join(raw_parts), model_details
+
+
+# ==== NOTEBOOK PROCESSING ====
+
+def run_notebook_backend(file_content, file_name, file_issues, backend, config):
+    """Send only the code cells that carry issues and write the fixed cells back into the notebook."""
+    notebook_config = config['autofix'].get('notebooks', {}) or {}
+    notebook = json.loads(file_content)
+    cell_issues, unplaced = notebook_fixer.map_issues_to_cells(file_content, notebook, file_issues)
+    if unplaced:
+        logging.warning(f"⚠️ {len(unplaced)} notebook issue(s) outside code cells not sent for {file_name}")
+    details = {"model": get_backend_model(backend, config), "source": backend, "notebook": True}
+    if not cell_issues:
+        return None, None, details
+
+    cells = notebook['cells']
+    indexes = sorted(cell_issues)
+    context = notebook_fixer.build_context(
+        cells, indexes, notebook_config.get('context_lines', notebook_fixer.DEFAULT_CONTEXT_LINES))
+    issues = [issue for index in indexes for issue in cell_issues[index]]
+    prompt = build_notebook_prompt(notebook_fixer.build_cells_block(cells, indexes), context, issues, file_name)
+    logging.info(f"📓 Sending {len(indexes)} of {len(cells)} cells of {file_name} "
+                 f"(~{estimate_tokens(prompt)} prompt tokens instead of ~{estimate_tokens(file_content)})")
+
+    extracted, raw_output, model_details = run_llm_backend(file_content, file_name, file_issues, backend, config,
+                                                           prompt=prompt)
+    fixed_cells = notebook_fixer.parse_cells(extracted)
+    new_content, applied, rejected = notebook_fixer.apply_cells(file_content, notebook, fixed_cells, set(indexes))
+    if rejected:
+        logging.warning(f"⚠️ Kept original cell(s) {rejected} of {file_name}, fixed versions were unusable")
+    model_details = dict(model_details, notebook=True, cells_sent=len(indexes), cells_applied=len(applied),
+                         cells_rejected=rejected)
+    return (new_content if applied else None), raw_output, model_details
+
+
+def run_llm_for_file(file_content, file_name, file_issues, backend, config):
+    """Send the whole file when it is small enough, otherwise only the affected regions.
+
+    Returns None when the file is too large and cannot be chunked.
+    """
+    if notebook_fixer.is_notebook(file_name) and (config['autofix'].get('notebooks', {}) or {}).get('enabled', True):
+        try:
+            return run_notebook_backend(file_content, file_name, file_issues, backend, config)
+        except (ValueError, KeyError) as e:
+            logging.warning(f"⚠️ Cannot read {file_name} as a notebook ({e}), sending it whole")
+
+    chunk_config = config['autofix'].get('chunking', {}) or {}
+    prompt_tokens = estimate_tokens(build_llm_prompt(file_content, file_issues, file_name))
+    chunk_above = chunk_config.get('chunk_above_tokens', DEFAULT_CHUNK_ABOVE_TOKENS)
+    max_prompt_tokens = chunk_config.get('max_prompt_tokens', DEFAULT_MAX_PROMPT_TOKENS)
+
+    if chunk_config.get('enabled', True) and prompt_tokens > chunk_above and region_chunker.is_chunkable(file_name):
+        try:
+            logging.info(f"✂️ Chunking {file_name} (~{prompt_tokens} prompt tokens)")
+            return run_chunked_backend(file_content, file_name, file_issues, backend, config)
+        except SyntaxError as e:
+            logging.warning(f"⚠️ Cannot parse {file_name} for chunking: {e}")
+
+    if prompt_tokens > max_prompt_tokens:
+        logging.warning(f"⚠️ Ignoring file, ~{prompt_tokens} prompt tokens exceeds budget: {file_name}")
+        return None
+    return hedging.run_hedged(
+        lambda use_backend: run_llm_backend(file_content, file_name, file_issues, use_backend, config),
+        backend, config)
+
 # ==== DB WRITER ====
 
-def insert_or_update_record(collection, repo_name, file_path, issues, backend,
-                             code_extracted, raw_llm_output, model_details):
+def insert_or_update_record(writer, repo_name, file_path, issues, backend,
+                             code_extracted, raw_llm_output, model_details, file_content=None):
     file_name = os.path.basename(file_path)
     timestamp = datetime.datetime.utcnow()
     update_fields = {
@@ -223,10 +612,17 @@ def insert_or_update_record(collection, repo_name, file_path, issues, backend,
         'status': 'Success' if code_extracted else 'Failure',
         'model_details': model_details,
         f"llm_output_raw_{backend}": raw_llm_output,
-        f"code_extracted_{backend}": code_extracted
+        f"code_extracted_{backend}": code_extracted,
+        f"status_{backend}": 'Success' if code_extracted else 'Failure',
+        f"model_details_{backend}": model_details,
+        f"output_mode_{backend}": model_details.get('output_mode', 'full'),
+        f"output_token_savings_{backend}": model_details.get('output_token_savings', 0)
     }
-    collection.update_one({'repo_name': repo_name, 'file_name': file_name},
-                          {'$set': update_fields}, upsert=True)
+    if file_content is not None:
+        update_fields['content_hash'] = content_hash(file_content)
+    if code_extracted:
+        update_fields[f"fixed_content_hash_{backend}"] = content_hash(code_extracted)
+    writer.upsert(repo_name, file_path, update_fields)
 
 # ==== SAVE FIXED FILE ====
 
@@ -250,35 +646,36 @@ def save_fixed_file(full_path, fixed_content, backend, config):
 
 # ==== DB & FILE CHECKERS ====
 
-def check_db_and_file(collection, repo_name, file_path, backend, repo_base_path):
-    file_name = os.path.basename(file_path)
-    record = collection.find_one({'repo_name': repo_name, 'file_name': file_name})
-    db_present = bool(record and f"llm_output_raw_{backend}" in record and record[f"llm_output_raw_{backend}"])
-    
-    # filename_no_ext, ext = os.path.splitext(os.path.basename(file_path))
-    # fixed_file = f"{filename_no_ext}_fix_{backend}{ext}"
-    # fix_path = os.path.join(repo_base_path, os.path.dirname(file_path), fixed_file)
-    # fix_file_present = os.path.exists(fix_path)
-    
-    
+def check_db_and_file(records, file_path, backend, repo_base_path, fix_files=None):
+    record = records.get(file_path)
+    db_present = bool(record and record.get(f"has_output_{backend}"))
+
     filename_no_ext, ext = os.path.splitext(os.path.basename(file_path))
+    if fix_files is None:
+        fix_files = config['autofix'].get('fix_files', False)
 
-    if config['autofix'].get('fix_files', False):
+    if fix_files:
         # Fix is done by replacing original file
         fix_path = os.path.join(repo_base_path, file_path)
     else:
         fixed_file = f"{filename_no_ext}_fix_{backend}{ext}"
         fix_path = os.path.join(repo_base_path, os.path.dirname(file_path), fixed_file)
-    
+
     fix_file_present = os.path.exists(fix_path)
 
-    
-    
+    # A record only counts if it was made for the file as it is now (or as we fixed it)
+    if db_present and record.get('content_hash'):
+        source_path = os.path.join(repo_base_path, file_path)
+        if os.path.exists(source_path):
+            with open(source_path, 'r') as f:
+                current_hash = content_hash(f.read())
+            db_present = current_hash in (record['content_hash'], record.get(f"fixed_content_hash_{backend}"))
+
     return db_present, fix_file_present
 
 # ==== COMMON SUMMARY CALCULATOR ====
 
-def calculate_repo_summary(repo, collection, config, backend):
+def calculate_repo_summary(repo, store, config, backend, records=None):
     repo_url = repo['repo_url']
     repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
     repo_path = os.path.join(repo['local_clone_path'], repo_name)
@@ -288,9 +685,11 @@ def calculate_repo_summary(repo, collection, config, backend):
         return repo_name, None, None
 
     issues_by_file = load_issues_by_file(normalized_file)
+    if records is None:
+        records = store.load_repo_records(repo_name, [backend])
     summary = []
     for file_path, issues in issues_by_file.items():
-        db_present, fix_file_present = check_db_and_file(collection, repo_name, file_path, backend, repo_path)
+        db_present, fix_file_present = check_db_and_file(records, file_path, backend, repo_path)
         action = 'Skip' if db_present and fix_file_present else 'Process'
         summary.append({
             'File Name': os.path.basename(file_path),
@@ -315,18 +714,14 @@ def print_summary_table(repo_name, summary, stage):
 
 # ==== MAIN PROCESSING ====
 
-# ==== IGNORE FILE LIST ==== for Azure, token ptu limit, for now tetsing here. needs to be come from external file sourece like dynamically generated excel file
-IGNORE_FILES_TOO_LARGE = [
-    'scaling_laws.ipynb',
-    'transformer_sizing.ipynb',
-]
-
-
-def process_repository(repo, collection, backend):
-    repo_name, issues_by_file, pre_summary = calculate_repo_summary(repo, collection, config, backend)
+def process_repository(repo, store, backend):
+    """Fix one repo and return (repo_name, pre_summary, post_summary)."""
+    repo_name = repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
+    records = store.load_repo_records(repo_name, [backend])
+    repo_name, issues_by_file, pre_summary = calculate_repo_summary(repo, store, config, backend, records)
     if issues_by_file is None:
         logging.error("❌ No normalized file found. Skipping repo.")
-        return
+        return repo_name, None, None
 
     logging.info(f"🚀 Processing repo: {repo_name}")
     print_summary_table(repo_name, pre_summary, "Pre-Processing")
@@ -334,11 +729,18 @@ def process_repository(repo, collection, backend):
     files_to_process = [s for s in pre_summary if s['Action'] == 'Process']
     if not files_to_process:
         logging.info("✅ Nothing to process. All files already analyzed.")
-        return
+        return repo_name, pre_summary, pre_summary
 
     repo_path = os.path.join(repo['local_clone_path'], repo_name)
-
-    for idx, file_info in enumerate(files_to_process, 1):
+    writer = store.writer(records, config['database'].get('bulk_write_size', 20))
+    prefix_config = config['autofix'].get('prefixers', {}) or {}
+    # Original on-disk content and rule-prefixed content of files that go on to the LLM
+    original_contents, prefixed_contents = {}, {}
+    # Files whose fix was saved this run, and files the budget left for a later run
+    fixed_paths, deferred_paths = set(), set()
+
+    work_items = []
+    for file_info in files_to_process:
         file_path = file_info['File Path']
         full_path = os.path.join(repo_path, file_path)
 
@@ -346,71 +748,336 @@ def process_repository(repo, collection, backend):
             logging.warning(f"⚠️ File not found, skipping: {full_path}")
             continue
 
-        with open(full_path, 'r') as f:
-            file_content = f.read()
-
-        issues = issues_by_file[file_path]
-        logging.info(f"🔧 Processing [{idx}/{len(files_to_process)}]: {file_path}")
-
-        if file_path in IGNORE_FILES_TOO_LARGE:
-            print(f"⚠️ Ignoring file: {file_path}")
-            continue
-        
-        
         if config['autofix'].get('dry_run', False):
             logging.info(f"🟡 Dry run: Skipping LLM and DB for {file_path}")
             continue
 
-        extracted_code, raw_output, model_details = run_llm_backend(file_content, file_path, issues, backend, config)
-        insert_or_update_record(collection, repo_name, file_path, issues, backend, extracted_code, raw_output, model_details)
+        with open(full_path, 'r') as f:
+            file_content = f.read()
+        issues = issues_by_file[file_path]
+
+        if prefix_config.get('enabled', True):
+            fixed_content, remaining, handled = apply_prefixers(
+                file_path, file_content, issues, prefix_config.get('rules'))
+            if handled and not remaining:
+                logging.info(f"📐 All {len(handled)} issue(s) fixed by rule prefixers, skipping LLM: {file_path}")
+                rules_fixed = sorted({i['rule'] for i in handled})
+                insert_or_update_record(writer, repo_name, file_path, issues, backend, fixed_content,
+                                        f"[rule prefixers] fixed {len(handled)} issue(s): {', '.join(rules_fixed)}",
+                                        {"model": "rule-prefixers", "source": "rules", "output_mode": "rules",
+                                         "rules_fixed": rules_fixed}, file_content)
+                save_fixed_file(full_path, fixed_content, backend, config)
+                fixed_paths.add(file_path)
+                continue
+            if handled:
+                logging.info(f"📐 {len(handled)} issue(s) fixed by rule prefixers, {len(remaining)} left for LLM: {file_path}")
+                original_contents[file_path] = file_content
+                prefixed_contents[file_path] = fixed_content
+                file_content, issues = fixed_content, remaining
+
+        work_items.append((file_path, full_path, file_content, issues))
+
+    # Each unit is (label, [work items]); small files may share one request
+    units = [(item[0], [item]) for item in work_items]
+    batch_config = config['autofix'].get('batching', {}) or {}
+    if batch_config.get('enabled', False) and config['autofix'].get('output_mode', 'full') == 'full':
+        batches, singles = prompt_batcher.plan_batches(
+            work_items,
+            batch_config.get('small_file_tokens', 800),
+            batch_config.get('batch_token_budget', 6000),
+            batch_config.get('max_files_per_batch', 8))
+        units = ([(item[0], [item]) for item in singles]
+                 + [(f"batch of {len(b)} files", b) for b in batches])
+        logging.info(f"📦 {sum(len(b) for b in batches)} small files packed into {len(batches)} batch request(s)")
+
+    budget = autofix_budget.get_run_budget(config)
+    if budget:
+        # Highest weighted debt per prompt token first, so a budget cut drops the least valuable files
+        units = autofix_budget.prioritize(units, config)
+
+    def fix_unit(unit):
+        label, items = unit
+        # Prompt plus a full-file answer of roughly the same size
+        estimated = sum(estimate_tokens(item[2]) for item in items) * 2
+        if budget and budget.try_reserve(estimated):
+            return [(item, autofix_budget.DEFERRED) for item in items]
+        rules = dict(Counter(i['rule'] for item in items for i in item[3]))
+        try:
+            with usage_ledger.call_context(repo=repo_name, file=label, rules=rules):
+                if len(items) > 1:
+                    batch_results = run_batch_backend(items, backend, config)
+                    return [(item, batch_results[item[0]]) for item in items]
+                file_path, _, file_content, issues = items[0]
+                logging.info(f"🔧 Sending to {backend}: {file_path}")
+                return [(items[0], run_llm_for_file(file_content, file_path, issues, backend, config))]
+        finally:
+            if budget:
+                budget.release(estimated)
+
+    completed = 0
+
+    def on_unit_result(unit, unit_results):
+        for item, result in unit_results:
+            on_result(item, result)
+
+    def on_result(item, result):
+        # Runs on this thread as each file completes, so writes stay serialized
+        nonlocal completed
+        completed += 1
+        file_path, full_path, file_content, issues = item
+        if result is autofix_budget.DEFERRED:
+            deferred_paths.add(file_path)
+            if file_path in prefixed_contents:
+                # Deterministic fixes are free, keep them even when the LLM part is deferred
+                save_fixed_file(full_path, prefixed_contents[file_path], backend, config)
+            logging.info(f"⏸️ Deferred by budget [{completed}/{len(work_items)}]: {file_path}")
+            return
+        if result is None:
+            logging.info(f"⏭️ Skipped [{completed}/{len(work_items)}]: {file_path}")
+            return
+        extracted_code, raw_output, model_details = result
+        logging.info(f"📥 Completed [{completed}/{len(work_items)}]: {file_path}")
+        if file_path in prefixed_contents:
+            model_details = dict(model_details, rule_prefixed=True)
+        if not model_details.get('cache_hit'):
+            # Cache hits cost nothing and would inflate fixes per token
+            usage_ledger.record_outcome(repo_name, file_path, model_details.get('model'), issues, extracted_code)
+        insert_or_update_record(writer, repo_name, file_path, issues, backend, extracted_code, raw_output,
+                                model_details, original_contents.get(file_path, file_content))
 
         if extracted_code:
             save_fixed_file(full_path, extracted_code, backend, config)
+            fixed_paths.add(file_path)
             logging.info(f"✅ Fixed & saved: {file_path}")
+        elif file_path in prefixed_contents:
+            save_fixed_file(full_path, prefixed_contents[file_path], backend, config)
+            logging.warning(f"⚠️ Extraction failed, saved rule-prefixer fixes only: {file_path}")
         else:
             logging.warning(f"❌ Extraction failed, No Changes Made: {file_path}")
 
-    # Recalculate and display post-processing summary
-    _, _, post_summary = calculate_repo_summary(repo, collection, config, backend)
+    dispatch_work(units, fix_unit, on_unit_result, get_backend_concurrency(backend, config))
+    writer.flush()
+
+    if budget:
+        previously_fixed = {row['File Path'] for row in pre_summary if row['Action'] == 'Skip'}
+        budget.record_repo(
+            repo_name,
+            sum(autofix_budget.file_debt(issues, config) for issues in issues_by_file.values()),
+            sum(autofix_budget.file_debt(issues_by_file[p], config) for p in fixed_paths),
+            sum(autofix_budget.file_debt(issues_by_file[p], config) for p in previously_fixed),
+            len(deferred_paths))
+
+    # Recalculate and display post-processing summary from the in-memory records
+    _, _, post_summary = calculate_repo_summary(repo, store, config, backend, records)
     print_summary_table(repo_name, post_summary, "Post-Processing")
+    return repo_name, pre_summary, post_summary
+
+# ==== MULTI-BACKEND COMPARISON ====
+
+def get_compare_variants(config):
+    """Expand backend.compare into labelled backends, each with its own config copy."""
+    variants = []
+    for spec in config['backend'].get('compare') or []:
+        if isinstance(spec, str):
+            spec = {'type': spec}
+        variant_config = copy.deepcopy(config)
+        if spec.get('model'):
+            variant_config['autofix']['model'] = spec['model']
+        if spec.get('deployment'):
+            variant_config['azure']['deployment'] = spec['deployment']
+        # Every backend keeps its own side-by-side file so outputs never overwrite each other
+        variant_config['autofix']['fix_files'] = False
+        # A variant's row must hold its own backend's answer, never a hedged or re-routed one
+        variant_config['autofix']['hedging'] = dict(variant_config['autofix'].get('hedging') or {}, enabled=False)
+        variant_config['autofix']['resilience'] = dict(variant_config['autofix'].get('resilience') or {},
+                                                       reroute_to=None)
+        # Labels end up in Mongo field names and file names
+        label = re.sub(r'[^A-Za-z0-9_-]', '_', spec.get('name', spec['type']))
+        variants.append({'label': label, 'type': spec['type'], 'config': variant_config})
+    return variants
+
+
+def compare_repository(repo, store, variants):
+    repo_name = repo['repo_url'].rstrip('/').split('/')[-1].replace('.git', '')
+    records = store.load_repo_records(repo_name, [v['label'] for v in variants])
+    repo_name, issues_by_file, _ = calculate_repo_summary(repo, store, config, variants[0]['label'], records)
+    if issues_by_file is None:
+        logging.error("❌ No normalized file found. Skipping repo.")
+        return repo_name, []
+
+    logging.info(f"🚀 Comparing {len(variants)} backends on repo: {repo_name}")
+    repo_path = os.path.join(repo['local_clone_path'], repo_name)
+
+    units = []
+    for file_path, issues in issues_by_file.items():
+        full_path = os.path.join(repo_path, file_path)
+        if not os.path.exists(full_path):
+            logging.warning(f"⚠️ File not found, skipping: {full_path}")
+            continue
+        with open(full_path, 'r') as f:
+            file_content = f.read()
+        for variant in variants:
+            db_present, fix_file_present = check_db_and_file(
+                records, file_path, variant['label'], repo_path, fix_files=False)
+            if db_present and fix_file_present:
+                continue
+            units.append((f"{file_path} -> {variant['label']}", file_path, full_path, file_content, issues, variant))
+
+    if config['autofix'].get('dry_run', False):
+        logging.info(f"🟡 Dry run: {len(units)} file/backend pairs would be sent")
+        return repo_name, []
+
+    def fix_unit(unit):
+        _, file_path, _, file_content, issues, variant = unit
+        start = time.monotonic()
+        with usage_ledger.call_context(repo=repo_name, file=file_path,
+                                       rules=dict(Counter(i['rule'] for i in issues))):
+            result = run_llm_for_file(file_content, file_path, issues, variant['type'], variant['config'])
+        return result, time.monotonic() - start
+
+    rows = []
+    writer = store.writer(records, config['database'].get('bulk_write_size', 20))
+
+    def on_result(unit, outcome):
+        _, file_path, full_path, file_content, issues, variant = unit
+        result, elapsed = outcome
+        if result is None:
+            rows.append({'File Path': file_path, 'Backend': variant['label'], 'Model': None,
+                         'Latency (s)': None, 'Tokens': None, 'Status': 'Skipped'})
+            return
+        extracted_code, raw_output, model_details = result
+        if not model_details.get('cache_hit'):
+            usage_ledger.record_outcome(repo_name, file_path, model_details.get('model'), issues, extracted_code)
+        insert_or_update_record(writer, repo_name, file_path, issues, variant['label'],
+                                extracted_code, raw_output, model_details, file_content)
+        if extracted_code:
+            save_fixed_file(full_path, extracted_code, variant['label'], variant['config'])
+        status, error = validate_code(file_path, extracted_code)
+        metrics = model_details.get('metrics', {})
+        rows.append({
+            'File Path': file_path,
+            'Backend': variant['label'],
+            'Model': model_details.get('model'),
+            'Latency (s)': round(metrics.get('latency_sec', elapsed), 2),
+            'Tokens': metrics.get('total_tokens'),
+            'Status': status if not error else f"{status}: {error}",
+        })
+
+    workers = sum(get_backend_concurrency(v['type'], config) for v in variants)
+    dispatch_work(units, fix_unit, on_result, workers)
+    writer.flush()
+    print_comparison_table(repo_name, rows)
+    return repo_name, rows
+
+
+def print_comparison_table(repo_name, rows):
+    print(f"\n========== Backend Comparison for Repo: {repo_name} ==========")
+    print("{:<40} {:<20} {:<12} {:<10} {:<20}".format("File", "Backend", "Latency(s)", "Tokens", "Status"))
+    print("-" * 100)
+    for row in sorted(rows, key=lambda r: (r['File Path'], r['Backend'])):
+        print("{:<40} {:<20} {:<12} {:<10} {:<20}".format(
+            os.path.basename(row['File Path']), row['Backend'], str(row['Latency (s)']),
+            str(row['Tokens']), row['Status'][:20]))
+    print("-" * 100 + "\n")
 
 # ==== WRITE FINAL SUMMARY TO EXCEL ====
 
-def write_final_summary_to_excel(all_repos_summaries):
+def write_final_summary_to_excel(all_repos_summaries, usage_report=None):
     output_file = "File_Analysis_Full_Summary.xlsx"
     columns_order = ["File Name", "#Issues", "DB Record", "Fix File", "Action"]
     with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
         for repo_name, summaries in all_repos_summaries.items():
-            # Write PRE summary
-            df_pre = pd.DataFrame(summaries['pre'])[columns_order]
-            df_pre.to_excel(writer, index=False, sheet_name=(repo_name[:28] + "_Pre"))
-            # Write POST summary
-            df_post = pd.DataFrame(summaries['post'])[columns_order]
-            df_post.to_excel(writer, index=False, sheet_name=(repo_name[:28] + "_Post"))
+            if summaries.get('pre'):
+                # Write PRE summary
+                df_pre = pd.DataFrame(summaries['pre'])[columns_order]
+                df_pre.to_excel(writer, index=False, sheet_name=(repo_name[:28] + "_Pre"))
+            if summaries.get('post'):
+                # Write POST summary
+                df_post = pd.DataFrame(summaries['post'])[columns_order]
+                df_post.to_excel(writer, index=False, sheet_name=(repo_name[:28] + "_Post"))
+            if summaries.get('comparison'):
+                df_cmp = pd.DataFrame(summaries['comparison'])
+                df_cmp.to_excel(writer, index=False, sheet_name=(repo_name[:28] + "_Cmp"))
+        waste = code_extraction.waste_stats()
+        if waste:
+            pd.DataFrame(waste).to_excel(writer, index=False, sheet_name="LLM_Spend")
+        compaction = issue_compactor.compaction_stats()
+        if compaction:
+            pd.DataFrame(compaction).to_excel(writer, index=False, sheet_name="Issue_Compaction")
+        hedge = hedging.hedge_stats()
+        if hedge['files']:
+            pd.DataFrame([hedge]).to_excel(writer, index=False, sheet_name="Hedging")
+        budget = autofix_budget.get_run_budget(config)
+        if budget and budget.repos:
+            pd.DataFrame(budget.repos).to_excel(writer, index=False, sheet_name="Budget")
+        for key, rows in (usage_report or {}).items():
+            if rows:
+                pd.DataFrame(rows).to_excel(writer, index=False, sheet_name=f"Usage_{key[3:].capitalize()}")
     logging.info(f"📊 Full Summary exported to Excel: {output_file}")
 
 
 # ==== MAIN ENTRY ====
 
+def analyze_repository(repo, store, backend, variants):
+    """Fix or compare one repo; returns (repo_name, summaries) or (repo_name, None)."""
+    if variants:
+        repo_name, rows = compare_repository(repo, store, variants)
+        return repo_name, {'comparison': rows}
+    repo_name, pre_summary, post_summary = process_repository(repo, store, backend)
+    if pre_summary is None:
+        return repo_name, None
+    return repo_name, {'pre': pre_summary, 'post': post_summary}
+
+
+def finish_analysis(all_summaries, store, session=None):
+    usage_report = usage_ledger.aggregate()
+    write_final_summary_to_excel(all_summaries, usage_report)
+    usage_ledger.write_metrics_file(config, usage_report)
+    store.close()
+
+    for row in usage_report['by_model']:
+        logging.info(f"📈 {row['model']}: {row['calls']} call(s), {row['total_tokens']} tokens, ${row['cost']}, "
+                     f"p50/p90 latency {row['latency_p50_sec']}/{row['latency_p90_sec']}s, "
+                     f"{row['issues_fixed']} issue(s) fixed, {row['fixes_per_1k_tokens']} fixes/1k tokens")
+
+    cache = get_response_cache(config)
+    if cache:
+        logging.info(f"♻️ LLM response cache stats: {cache.stats()}")
+    for rule, stats in sorted(prefixer_stats().items()):
+        logging.info(f"📐 Prefixer {rule}: {stats['issues_fixed']} issue(s) fixed in {stats['files']} file(s), "
+                     f"{stats['skipped']} left for the LLM")
+    for row in code_extraction.waste_stats():
+        logging.info(f"💸 {row['model']}: {row['wasted_tokens']} of {row['tokens']} tokens wasted ({row['wasted_pct']}%), "
+                     f"{row['failed_calls']} failed call(s), {row['repaired']} output(s) repaired "
+                     f"with {row['repair_tokens']} repair tokens")
+    issue_compactor.log_compaction_summary()
+    hedge = hedging.hedge_stats()
+    if hedge['files']:
+        logging.info(f"🏎️ Hedging: {hedge}")
+    logging.info(f"🛡️ LLM retries and circuit breakers: {llm_resilience.resilience_stats()}")
+    if session:
+        logging.info(f"🧠 Ollama residency for {session.model_name}: {session.stats()}")
+    release_sessions()
+
+
 def run_sonar_ai_analysis():
     db_config = config['database']
     backend = config['backend']['type']
-    collection = connect_to_mongodb(db_config)
+    # Loads the local model while Sonar results are read and the first prompts are built
+    session = start_preload(config)
+    store = open_result_store(db_config)
+    variants = get_compare_variants(config)
 
     all_summaries = {}
 
     for repo in config['github']['repos']:
-        if repo.get('enabled', True):
-            repo_name, issues_by_file, pre_summary = calculate_repo_summary(repo, collection, config, backend)
-            if issues_by_file is None:
-                continue
-            #print_summary_table(repo_name, pre_summary, "Pre-Processing")
-            process_repository(repo, collection, backend)
-            _, _, post_summary = calculate_repo_summary(repo, collection, config, backend)
-            #print_summary_table(repo_name, post_summary, "Post-Processing")
-            all_summaries[repo_name] = {'pre': pre_summary, 'post': post_summary}
+        if not repo.get('enabled', True):
+            continue
+        repo_name, summaries = analyze_repository(repo, store, backend, variants)
+        if summaries:
+            all_summaries[repo_name] = summaries
 
-    write_final_summary_to_excel(all_summaries)
+    finish_analysis(all_summaries, store, session)
 
 if __name__ == '__main__':
     run_sonar_ai_analysis()
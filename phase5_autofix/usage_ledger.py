@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+from collections import Counter, defaultdict, deque
+
+# ==== USAGE LEDGER ====
+# Per-call entries feed the percentile and per-rule reports. Only the most
+# recent `max_recorded_calls` are kept, so a long-running service does not
+# grow without bound; token and cost totals are running sums over every call.
+
+DEFAULT_METRICS_PATH = os.path.join("results", "llm_usage_metrics.json")
+DEFAULT_MAX_RECORDED_CALLS = 20000
+
+_calls = deque()
+_outcomes = deque()
+_max_recorded = DEFAULT_MAX_RECORDED_CALLS
+_totals = {'tokens': 0, 'cost': 0.0, 'dropped_calls': 0}
+_repo_totals = defaultdict(lambda: {'tokens': 0, 'cost': 0.0})
+_lock = threading.Lock()
+_context = threading.local()
+
+
+@contextmanager
+def call_context(**fields):
+    """Tag every LLM call made by this thread with repo/file/rules until the block exits."""
+    previous = getattr(_context, 'fields', {})
+    _context.fields = dict(previous, **fields)
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+def current_context():
+    return dict(getattr(_context, 'fields', {}))
+
+
+def call_cost(model, prompt_tokens, completion_tokens, pricing, cached_tokens=None):
+    price = (pricing or {}).get(model) or {}
+    prompt_price = price.get('prompt_per_1k', 0.0)
+    # Prompt tokens served from the provider's cache are billed at the cached rate when one is configured
+    cached = min(cached_tokens or 0, prompt_tokens or 0)
+    return round(((prompt_tokens or 0) - cached) / 1000.0 * prompt_price +
+                 cached / 1000.0 * price.get('cached_prompt_per_1k', prompt_price) +
+                 (completion_tokens or 0) / 1000.0 * price.get('completion_per_1k', 0.0), 6)
+
+
+def record_call(model_details, purpose, success, config):
+    """Store one backend call with its usage metadata and the current call context."""
+    metrics = (model_details or {}).get('metrics') or {}
+    pricing = config['autofix'].get('pricing', {}) or {}
+    entry = dict(
+        current_context(),
+        timestamp=time.time(),
+        model=model_details.get('model'),
+        source=model_details.get('source'),
+        purpose=purpose,
+        success=success,
+        attempts=model_details.get('attempts', 1),
+        prompt_tokens=metrics.get('prompt_tokens'),
+        cached_tokens=metrics.get('cached_tokens'),
+        completion_tokens=metrics.get('completion_tokens'),
+        total_tokens=metrics.get('total_tokens'),
+        usage_estimated=metrics.get('usage_estimated'),
+        latency_sec=metrics.get('latency_sec'),
+        time_to_first_token_sec=metrics.get('time_to_first_token_sec'),
+        tokens_per_sec=metrics.get('tokens_per_sec'),
+        cost=call_cost(model_details.get('model'), metrics.get('prompt_tokens'),
+                       metrics.get('completion_tokens'), pricing, metrics.get('cached_tokens')),
+    )
+    global _max_recorded
+    _max_recorded = (config['autofix'].get('usage', {}) or {}).get('max_recorded_calls', DEFAULT_MAX_RECORDED_CALLS)
+    with _lock:
+        _totals['tokens'] += entry['total_tokens'] or 0
+        _totals['cost'] += entry['cost']
+        repo = _repo_totals[entry.get('repo')]
+        repo['tokens'] += entry['total_tokens'] or 0
+        repo['cost'] += entry['cost']
+        _calls.append(entry)
+        while len(_calls) > _max_recorded:
+            _calls.popleft()
+            _totals['dropped_calls'] += 1
+
+
+def record_outcome(repo, file_path, model, issues, fixed):
+    """Store whether a file's issues were addressed, so spend can be related to fixes."""
+    with _lock:
+        _outcomes.append({'repo': repo, 'file': file_path, 'model': model, 'fixed': bool(fixed),
+                          'rules': dict(Counter(i['rule'] for i in issues))})
+        while len(_outcomes) > _max_recorded:
+            _outcomes.popleft()
+
+def totals(repo=None):
+    """(total_tokens, cost) of every call recorded so far, or only of one repo's calls."""
+    with _lock:
+        totals = _totals if repo is None else _repo_totals.get(repo, {'tokens': 0, 'cost': 0.0})
+        return totals['tokens'], totals['cost']
+
+# ==== AGGREGATION ====
+
+def percentile(values, pct):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100.0
+    low, high = int(rank), min(int(rank) + 1, len(values) - 1)
+    return round(values[low] + (values[high] - values[low]) * (rank - low), 3)
+
+
+def _cached_pct(calls):
+    # Only calls whose response reported cached tokens; others would dilute the share
+    reported = [c for c in calls if c.get('cached_tokens') is not None]
+    prompt = sum(c['prompt_tokens'] or 0 for c in reported)
+    return round(100.0 * sum(c['cached_tokens'] for c in reported) / prompt, 1) if prompt else None
+
+
+def _summarize(calls, issues_fixed):
+    tokens = sum(c['total_tokens'] or 0 for c in calls)
+    cost = sum(c['cost'] for c in calls)
+    latency = sum(c['latency_sec'] or 0 for c in calls)
+    return {
+        'calls': len(calls),
+        'failed_calls': sum(1 for c in calls if not c['success']),
+        'retries': sum(max(0, (c['attempts'] or 1) - 1) for c in calls),
+        'prompt_tokens': round(sum(c['prompt_tokens'] or 0 for c in calls)),
+        'cached_tokens': round(sum(c.get('cached_tokens') or 0 for c in calls)),
+        'cached_pct': _cached_pct(calls),
+        'completion_tokens': round(sum(c['completion_tokens'] or 0 for c in calls)),
+        'total_tokens': round(tokens),
+        'cost': round(cost, 4),
+        'latency_p50_sec': percentile([c['latency_sec'] for c in calls], 50),
+        'latency_p90_sec': percentile([c['latency_sec'] for c in calls], 90),
+        'latency_p99_sec': percentile([c['latency_sec'] for c in calls], 99),
+        'ttft_p50_sec': percentile([c['time_to_first_token_sec'] for c in calls], 50),
+        'tokens_per_sec_p50': percentile([c['tokens_per_sec'] for c in calls], 50),
+        'issues_fixed': round(issues_fixed, 2),
+        'fixes_per_1k_tokens': round(issues_fixed * 1000.0 / tokens, 3) if tokens else None,
+        'fixes_per_dollar': round(issues_fixed / cost, 2) if cost else None,
+        'fixes_per_minute': round(issues_fixed * 60.0 / latency, 2) if latency else None,
+    }
+
+
+def aggregate():
+    """Return {'by_model': [...], 'by_repo': [...], 'by_rule': [...]} rows for reports."""
+    with _lock:
+        calls, outcomes = list(_calls), list(_outcomes)
+
+    fixed_by = defaultdict(float)
+    for outcome in outcomes:
+        if not outcome['fixed']:
+            continue
+        for rule, count in outcome['rules'].items():
+            fixed_by[('model', outcome['model'])] += count
+            fixed_by[('repo', outcome['repo'], outcome['model'])] += count
+            fixed_by[('rule', rule, outcome['model'])] += count
+
+    groups = defaultdict(list)
+    rule_calls = defaultdict(list)
+    for call in calls:
+        groups[('model', call['model'])].append(call)
+        groups[('repo', call.get('repo'), call['model'])].append(call)
+        # A call serves every rule of its file; split its usage by issue count
+        rules = call.get('rules') or {}
+        total = sum(rules.values())
+        for rule, count in rules.items():
+            share = count / total
+            rule_calls[(rule, call['model'])].append(dict(
+                call, **{key: (call[key] or 0) * share
+                         for key in ('prompt_tokens', 'completion_tokens', 'total_tokens', 'cost')},
+                cached_tokens=None if call.get('cached_tokens') is None else call['cached_tokens'] * share))
+    for (rule, model), shared in rule_calls.items():
+        groups[('rule', rule, model)] = shared
+
+    report = {'by_model': [], 'by_repo': [], 'by_rule': []}
+    for key, group_calls in sorted(groups.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        row = _summarize(group_calls, fixed_by.get(key, 0))
+        if key[0] == 'model':
+            report['by_model'].append(dict(model=key[1], **row))
+        elif key[0] == 'repo':
+            report['by_repo'].append(dict(repo=key[1], model=key[2], **row))
+        else:
+            report['by_rule'].append(dict(rule=key[1], model=key[2], **row))
+    return report
+
+
+def write_metrics_file(config, report=None):
+    path = (config['autofix'].get('usage', {}) or {}).get('metrics_path') or DEFAULT_METRICS_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _lock:
+        calls = list(_calls)
+        dropped = _totals['dropped_calls']
+    payload = {
+        'generated_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'summary': report or aggregate(),
+        # Older calls beyond autofix.usage.max_recorded_calls are only in the totals
+        'dropped_calls': dropped,
+        'calls': calls,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, default=str)
+    logging.info(f"📈 LLM usage metrics written to: {path}")
+    return path
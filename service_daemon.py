@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running AutoSonarFixer service.
+
+Keeps the config, result store, LLM clients, response cache and local model
+warm, and accepts scan / fix / report jobs over a local HTTP port or a Unix
+socket, so CI hooks can trigger work without starting a full pipeline.
+
+    POST /jobs        {"type": "scan", "repo": "my-repo", "fix": true}
+                      {"type": "fix", "repo": "my-repo", "files": ["src/a.py"], "backend": "azure"}
+                      {"type": "report", "repo": "my-repo"}
+    GET  /jobs        all tracked jobs
+    GET  /jobs/<id>   one job
+    GET  /health      service and job counts
+"""
+
+import os
+import json
+import time
+import uuid
+import signal
+import logging
+import threading
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+# Sets up sys.path for every phase and imports phases 1-4
+from main_orchestrator import ConfigManager, prepare_repo, clone_repo, sonar_scanner, ollama_session
+import sonar_summary_reporter
+import sonar_ai_analyzer
+import usage_ledger
+import autofix_budget
+from result_store import open_result_store
+from response_cache import get_response_cache
+from autofix_worker import AutofixWorker, repo_name_of
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_JOBS = 2
+DEFAULT_JOB_HISTORY = 500
+JOB_TYPES = ('scan', 'fix', 'report')
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+# ==== SERVICE ====
+
+class AutofixService:
+    """Runs submitted jobs on a thread pool; jobs on the same repo run one after another."""
+
+    def __init__(self, config_mgr):
+        self.config_mgr = config_mgr
+        self.config = config_mgr.config
+        self.settings = self.config.get('service', {}) or {}
+        self.backend = self.config['backend']['type']
+        self.started = time.time()
+
+        # Warm state shared by every job
+        self.store = open_result_store(self.config['database'])
+        self.session = ollama_session.start_preload(self.config)
+        get_response_cache(self.config)
+        self.fixer = AutofixWorker(self.config, self.backend, "service", self.store, None)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.settings.get('max_concurrent_jobs', DEFAULT_MAX_JOBS),
+                                           thread_name_prefix="service-job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.repo_locks = {}
+
+    def find_repo(self, name):
+        for repo in self.config['github']['repos']:
+            if name in (repo['repo_url'], repo_name_of(repo)):
+                return repo
+        return None
+
+    def repo_lock(self, repo_name):
+        with self.lock:
+            return self.repo_locks.setdefault(repo_name, threading.Lock())
+
+    def submit(self, request):
+        """Validate and queue a job; returns the job record or raises ValueError."""
+        job_type = request.get('type')
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"type must be one of {', '.join(JOB_TYPES)}")
+        repo = self.find_repo(request.get('repo', ''))
+        if repo is None:
+            raise ValueError(f"unknown repo: {request.get('repo')}")
+        job = {
+            'job_id': uuid.uuid4().hex[:12], 'type': job_type, 'repo': repo_name_of(repo),
+            'request': request, 'status': 'queued', 'submitted_at': time.time(),
+            'started_at': None, 'finished_at': None, 'result': None, 'error': None,
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+            # Only finished jobs are forgotten; queued and running ones stay visible
+            excess = len(self.jobs) - self.settings.get('job_history', DEFAULT_JOB_HISTORY)
+            finished = [job_id for job_id, record in self.jobs.items() if record['status'] in FINISHED_STATUSES]
+            for job_id in finished[:max(excess, 0)]:
+                del self.jobs[job_id]
+        self.executor.submit(self.run_job, job, repo)
+        logging.info(f"📥 Job {job['job_id']}: {job_type} {job['repo']}")
+        return dict(job)
+
+    def run_job(self, job, repo):
+        with self.repo_lock(job['repo']):
+            job.update(status='running', started_at=time.time())
+            try:
+                handler = getattr(self, f"run_{job['type']}")
+                job['result'] = handler(repo, job['request'])
+                job['status'] = 'done'
+            except Exception as e:
+                logging.error(f"❌ Job {job['job_id']} failed: {e}")
+                job.update(status='failed', error=str(e))
+            job['finished_at'] = time.time()
+        logging.info(f"🏁 Job {job['job_id']} {job['status']} in {job['finished_at'] - job['started_at']:.1f}s")
+
+    # ==== JOB HANDLERS ====
+
+    def run_scan(self, repo, request):
+        repo_name = repo_name_of(repo)
+        if request.get('prepare', True):
+            full_repo_path = prepare_repo(self.config_mgr, repo)
+            if not full_repo_path:
+                raise Exception("clone, detection or build failed, see the service log")
+        else:
+            full_repo_path = os.path.join(repo['local_clone_path'], repo_name)
+        with self.config_mgr.state.phase(repo['repo_url'], 'sonar_scan'):
+            sonar_scanner.run_full_sonar_pipeline(full_repo_path, repo_name, self.config)
+        self.config_mgr.update_repo_entry(repo['repo_url'], 'last_commit_scanned',
+                                          clone_repo.get_head_commit(full_repo_path))
+        normalized_file = sonar_summary_reporter.normalize_repo_snapshot(repo, self.config)
+        # The next fix job must read the new issues, not the cached ones
+        with self.fixer.issues_lock:
+            self.fixer.issues.pop(repo_name, None)
+        result = {'normalized_file': normalized_file,
+                  'total_issues': sonar_summary_reporter.global_stats.get(repo_name, {}).get('total_issues')}
+        if request.get('fix'):
+            result['fix'] = self.run_fix(repo, request)
+        return result
+
+    def run_fix(self, repo, request):
+        backend = request.get('backend') or self.backend
+        files = request.get('files')
+        if not files:
+            # Each job gets its own budget, counting only this repo's calls
+            with autofix_budget.budget_scope(self.config, repo_name_of(repo)) as budget:
+                _, summaries = sonar_ai_analyzer.analyze_repository(repo, self.store, backend, None)
+            if summaries is None:
+                raise Exception("no normalized issues, run a scan job first")
+            result = {stage: {'files': len(rows), 'processed': sum(1 for r in rows if r['Action'] == 'Process')}
+                      for stage, rows in summaries.items()}
+            if budget and budget.repos:
+                result['budget'] = budget.repos[-1]
+            return result
+
+        fixer = self.fixer if backend == self.backend else AutofixWorker(self.config, backend, "service",
+                                                                          self.store, None)
+        results = {}
+        for file_path in files:
+            job = {'repo_name': repo_name_of(repo), 'file_path': file_path}
+            outcome = fixer.fix(job)
+            if outcome is None:
+                results[file_path] = 'skipped'
+                continue
+            fixer.write(job, outcome)
+            results[file_path] = 'fixed' if outcome[0] else 'no usable fix'
+        return results
+
+    def run_report(self, repo, request):
+        repo_name = repo_name_of(repo)
+        if request.get('facets') or self.config['sonarqube'].get('summary_mode') == 'facets':
+            sonar_summary_reporter.process_facet_summaries(self.config, [repo_name])
+        else:
+            sonar_summary_reporter.normalize_repo_snapshot(repo, self.config)
+        stats = dict(sonar_summary_reporter.global_stats.get(repo_name, {}))
+        stats.pop('files', None)
+        _, _, summary = sonar_ai_analyzer.calculate_repo_summary(repo, self.store, self.config, self.backend)
+        return {'sonar': stats,
+                'autofix': {'files': len(summary or []),
+                            'pending': sum(1 for r in summary or [] if r['Action'] == 'Process')}}
+
+    # ==== STATUS ====
+
+    def list_jobs(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def health(self):
+        counts = {}
+        for job in self.list_jobs():
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {'status': 'ok', 'uptime_sec': round(time.time() - self.started), 'backend': self.backend,
+                'jobs': counts, 'llm_tokens': usage_ledger.totals()[0]}
+
+    def close(self):
+        # Running jobs finish; queued ones are dropped
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            for job in self.jobs.values():
+                if job['status'] == 'queued':
+                    job.update(status='cancelled', finished_at=time.time())
+        usage_ledger.write_metrics_file(self.config)
+        self.store.close()
+        ollama_session.release_sessions()
+
+# ==== HTTP API ====
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, indent=2, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/health':
+            self.send_json(200, service.health())
+        elif self.path == '/jobs':
+            self.send_json(200, service.list_jobs())
+        elif self.path.startswith('/jobs/'):
+            job = service.get_job(self.path[len('/jobs/'):])
+            if job:
+                self.send_json(200, job)
+            else:
+                self.send_json(404, {'error': 'unknown job'})
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self.send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("request body must be a JSON object")
+            job = self.server.service.submit(request)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, job)
+
+    def log_message(self, format, *args):
+        # Unix-socket clients have no address, so the default access log cannot be used
+        logging.debug(f"{self.command} {self.path}: " + format % args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, settings):
+    socket_path = settings.get('socket_path')
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, JobRequestHandler)
+        logging.info(f"🛰️ Service listening on unix socket {socket_path}")
+    else:
+        address = (settings.get('host', '127.0.0.1'), settings.get('port', DEFAULT_PORT))
+        server = ThreadingHTTPServer(address, JobRequestHandler)
+        logging.info(f"🛰️ Service listening on http://{address[0]}:{address[1]}")
+    server.service = service
+    return server
+
+
+# Usage: python service_daemon.py
+#   curl -X POST localhost:8765/jobs -d '{"type": "scan", "repo": "my-repo", "fix": true}'
+#   curl --unix-socket /tmp/autosonarfixer.sock http://localhost/jobs
+if __name__ == "__main__":
+    config_mgr = ConfigManager()
+    service = AutofixService(config_mgr)
+    server = make_server(service, service.settings)
+
+    # SIGTERM stops accepting requests; running jobs are allowed to finish
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    logging.info("🛑 Service stopping, waiting for running jobs...")
+    server.server_close()
+    service.close()
+    if service.settings.get('socket_path') and os.path.exists(service.settings['socket_path']):
+        os.remove(service.settings['socket_path'])
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The phase modules import each other by bare name, as when run from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("utils", "phase5_autofix"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
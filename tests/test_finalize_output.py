@@ -0,0 +1,66 @@
+import pytest
+
+for module in ("openai", "ollama", "httpx", "requests", "pandas"):
+    pytest.importorskip(module)
+
+import sonar_ai_analyzer
+
+CONFIG = {'autofix': {'repair': {'enabled': True, 'max_attempts': 1, 'context_lines': 15}}}
+DETAILS = {'model': 'test-model', 'source': 'local', 'metrics': {'total_tokens': 10}}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Fake call_backend answering with the queued replies and recording each call's purpose."""
+    calls, replies = [], []
+
+    def fake_call_backend(prompt, backend, config, stop_at_fence=True, purpose='fix'):
+        calls.append((purpose, str(prompt)))
+        return replies.pop(0), dict(DETAILS)
+
+    monkeypatch.setattr(sonar_ai_analyzer, 'call_backend', fake_call_backend)
+    return calls, replies
+
+
+def test_valid_code_needs_no_follow_up(backend):
+    calls, _ = backend
+    code, details = sonar_ai_analyzer.finalize_output("x = 1\n", False, "a.py", 'local', CONFIG, dict(DETAILS))
+    assert code == "x = 1\n"
+    assert details['validation'] == 'valid'
+    assert calls == []
+
+
+def test_truncated_output_is_continued(backend):
+    calls, replies = backend
+    replies.append("```python\n    return x\n```")
+    head = "def f():\n" + "".join(f"    v{n} = {n}\n" for n in range(30)) + "    x = 1"
+    code, details = sonar_ai_analyzer.finalize_output(head, True, "a.py", 'local', CONFIG, dict(DETAILS))
+    assert code == head + "\n    return x"
+    assert details['continued'] is True
+    assert details['validation'] == 'valid'
+    assert [purpose for purpose, _ in calls] == ['continuation']
+    # Only the last CONTINUATION_TAIL_LINES lines are sent back
+    assert "v0 = 0" not in calls[0][1]
+    assert "x = 1" in calls[0][1]
+
+
+def test_invalid_output_is_repaired(backend):
+    calls, replies = backend
+    replies.append("```python\ndef f():\n    return 1\n```")
+    code, details = sonar_ai_analyzer.finalize_output("def f():\n    return (1\n", False, "a.py", 'local',
+                                                      CONFIG, dict(DETAILS))
+    assert code == "def f():\n    return 1"
+    assert details['repair_attempts'] == 1
+    assert details['validation'] == 'valid'
+    assert [purpose for purpose, _ in calls] == ['repair']
+
+
+def test_repair_gives_up_after_max_attempts(backend):
+    calls, replies = backend
+    replies.append("```python\ndef f():\n    return (2\n```")
+    code, details = sonar_ai_analyzer.finalize_output("def f():\n    return (1\n", False, "a.py", 'local',
+                                                      CONFIG, dict(DETAILS))
+    assert code is None
+    assert details['repair_attempts'] == sonar_ai_analyzer.DEFAULT_REPAIR_ATTEMPTS
+    assert 'validation_error' in details
+    assert len(calls) == 1
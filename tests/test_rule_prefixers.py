@@ -0,0 +1,158 @@
+import ast
+
+import pytest
+
+from rule_prefixers import PREFIXERS, apply_prefixers
+
+NAMING_MESSAGE = 'Rename this local variable "{}" to match the regular expression ^[_a-z][a-z0-9_]*$.'
+
+
+def run_fixer(rule, source, issues):
+    return PREFIXERS[rule](source, [dict(i, rule=rule) for i in issues])
+
+
+def run_code(source, call):
+    namespace = {}
+    exec(source, namespace)
+    return eval(call, namespace)
+
+# ==== TRAILING WHITESPACE / COMMENTED-OUT CODE ====
+
+def test_trailing_whitespace_keeps_multiline_strings():
+    result, handled = run_fixer('python:S1131', 'x = 1   \ns = """keep   \n"""\n', [{'line': 1}, {'line': 2}])
+    assert result == 'x = 1\ns = """keep   \n"""\n'
+    assert len(handled) == 1
+
+
+def test_commented_out_code_keeps_prose():
+    result, handled = run_fixer('python:S125', 'x = 1\n# y = compute(x)\n# return y\n# just a note\n',
+                                [{'line': 2}, {'line': 4}])
+    assert result == 'x = 1\n# just a note\n'
+    assert len(handled) == 1
+
+# ==== UNUSED IMPORTS ====
+
+def test_unused_imports():
+    source = ('import os, sys\nfrom a import b, c  # note\ntry:\n    import json\nexcept ImportError:\n'
+              '    pass\nprint(sys, c)\n')
+    result, handled = run_fixer('python:S1128', source, [{'line': 1}, {'line': 2}, {'line': 4}])
+    assert result == ('import sys\nfrom a import c  # note\ntry:\n    pass\nexcept ImportError:\n'
+                      '    pass\nprint(sys, c)\n')
+    assert len(handled) == 3
+
+
+def test_several_issues_on_one_removed_import_line():
+    source = 'import os, sys\nimport json\nprint(json.dumps({}))\n'
+    result, handled = run_fixer('python:S1128', source, [{'line': 1}, {'line': 1}])
+    assert result == 'import json\nprint(json.dumps({}))\n'
+    assert len(handled) == 2
+    run_code(result, 'None')
+
+
+def test_several_issues_on_one_rewritten_import_line():
+    source = 'from os import path, sep, getcwd\nimport json\nprint(path, json)\n'
+    result, handled = run_fixer('python:S1128', source, [{'line': 1}, {'line': 1}])
+    assert result == 'from os import path\nimport json\nprint(path, json)\n'
+    assert len(handled) == 2
+
+@pytest.mark.parametrize('source', [
+    'import os; x = 1\nprint(x)\n',
+    'DEBUG = False\nif DEBUG: import os\nprint(DEBUG)\n',
+    'DEBUG = False\nif DEBUG: import os, sys\nprint(DEBUG, sys)\n',
+])
+def test_unused_import_sharing_its_line_is_left_alone(source):
+    result, handled = run_fixer('python:S1128', source, [{'line': 1}, {'line': 2}])
+    assert result == source
+    assert handled == []
+
+
+def test_unused_import_with_trailing_comment_is_removed():
+    result, handled = run_fixer('python:S1128', 'import os  # legacy\nx = 1\n', [{'line': 1}])
+    assert result == 'x = 1\n'
+    assert len(handled) == 1
+
+# ==== LOCAL VARIABLES ====
+
+def test_unused_local_variable():
+    result, handled = run_fixer('python:S1481', 'def f():\n    a, b = g()\n    return a\n',
+                                [{'line': 2, 'message': 'Remove the unused local variable "b".'}])
+    assert result == 'def f():\n    a, _ = g()\n    return a\n'
+    assert len(handled) == 1
+
+
+def test_local_variable_naming():
+    result, handled = run_fixer('python:S117', 'def f(x):\n    myValue = x + 1\n    return myValue\n',
+                                [{'line': 2, 'message': NAMING_MESSAGE.format('myValue')}])
+    assert result == 'def f(x):\n    my_value = x + 1\n    return my_value\n'
+    assert len(handled) == 1
+
+
+def test_local_variable_naming_renames_closure_reads():
+    source = 'def f(x):\n    myValue = x + 1\n    g = lambda: myValue * 2\n    return g()\n'
+    result, handled = run_fixer('python:S117', source, [{'line': 2, 'message': NAMING_MESSAGE.format('myValue')}])
+    assert result == 'def f(x):\n    my_value = x + 1\n    g = lambda: my_value * 2\n    return g()\n'
+    assert run_code(result, 'f(1)') == 4
+
+
+@pytest.mark.parametrize('source', [
+    # Nested function parameter shadows the name
+    'def f():\n    myValue = 1\n    def g(myValue):\n        return myValue\n    return g(5) + myValue\n',
+    # Nested function rebinds it
+    'def f():\n    myValue = 1\n    def g():\n        myValue = 5\n        return myValue\n    return g() + myValue\n',
+    # Lambda parameter
+    'def f():\n    myValue = 1\n    g = lambda myValue: myValue\n    return g(5) + myValue\n',
+    # Comprehension target
+    'def f():\n    myValue = 1\n    items = [myValue for myValue in range(5, 6)]\n    return items[0] + myValue\n',
+])
+def test_local_variable_naming_skips_shadowing_scopes(source):
+    result, handled = run_fixer('python:S117', source, [{'line': 2, 'message': NAMING_MESSAGE.format('myValue')}])
+    assert result == source
+    assert handled == []
+    assert run_code(result, 'f()') == 6
+
+
+def test_unused_local_variable_skips_shadowing_scopes():
+    source = 'def f():\n    a, b = g()\n    return [b for b in a]\n'
+    result, handled = run_fixer('python:S1481', source,
+                                [{'line': 2, 'message': 'Remove the unused local variable "b".'}])
+    assert result == source
+    assert handled == []
+
+# ==== DUPLICATED LITERALS ====
+
+def test_duplicated_literals():
+    source = ('import os\n\ndef f():\n    """doc"""\n    a = "same text"\n    b = {"same text": 1}\n'
+              '    return "same text", a, b\n')
+    result, handled = run_fixer('python:S1192', source, [
+        {'line': 5, 'message': 'Define a constant instead of duplicating this literal "same text" 3 times.'}])
+    assert result == ('import os\n\nSAME_TEXT = "same text"\n\ndef f():\n    """doc"""\n    a = SAME_TEXT\n'
+                      '    b = {SAME_TEXT: 1}\n    return SAME_TEXT, a, b\n')
+    assert len(handled) == 1
+
+@pytest.mark.skipif(not hasattr(ast, 'match_case'), reason="match statements need Python 3.10+")
+def test_duplicated_literals_keeps_match_patterns():
+    source = ('def f(value):\n    label = "same text"\n    match value:\n        case "same text":\n'
+              '            return label + "same text"\n        case _:\n            return "same text"\n')
+    result, handled = run_fixer('python:S1192', source, [
+        {'line': 2, 'message': 'Define a constant instead of duplicating this literal "same text" 4 times.'}])
+    assert '        case "same text":\n' in result
+    assert result.count('SAME_TEXT') == 4
+    namespace = {}
+    exec(result, namespace)
+    assert namespace['f']("same text") == "same textsame text"
+    assert namespace['f']("other") == "same text"
+
+# ==== RUNNER ====
+
+def test_apply_prefixers_remaps_remaining_issues():
+    content, remaining, handled = apply_prefixers('m.py', 'import os\nx = 1   \ny = 2\n', [
+        {'rule': 'python:S1128', 'line': 1}, {'rule': 'python:S1131', 'line': 2},
+        {'rule': 'python:S3776', 'line': 3}])
+    assert content == 'x = 1\ny = 2\n'
+    assert len(handled) == 2
+    assert remaining[0]['line'] == 2
+
+
+def test_apply_prefixers_leaves_other_files_alone():
+    issues = [{'rule': 'python:S1131', 'line': 1}]
+    assert apply_prefixers('a.yaml', 'x: 1   \n', issues) == ('x: 1   \n', issues, [])
@@ -11,8 +11,18 @@ import logging
 import sys
 import os
 import pprint
+import threading
+
+from run_state import get_run_state, DEFAULT_STATE_PATH
+
+# Fields kept in the run-state store and shown on the repo entries at load time
+REPO_STATE_FIELDS = ('detected_tech_stack', 'last_commit_scanned')
 
 class ConfigManager:
+    # config.yaml is read-only input: parsed once per path and shared by every instance
+    _loaded = {}
+    _load_lock = threading.Lock()
+
     def __init__(self, config_path=None):
         # Dynamically compute project root
         self.project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,8 +32,16 @@ class ConfigManager:
         else:
             self.config_path = config_path
 
-        self.config = self.load_config()
-        self.normalize_paths()
+        with ConfigManager._load_lock:
+            if self.config_path not in ConfigManager._loaded:
+                self.config = self.load_config()
+                self.normalize_paths()
+                self.state = get_run_state(self.state_path())
+                self.apply_run_state()
+                ConfigManager._loaded[self.config_path] = self.config
+            else:
+                self.config = ConfigManager._loaded[self.config_path]
+                self.state = get_run_state(self.state_path())
 
     def load_config(self):
         try:
@@ -45,6 +63,22 @@ class ConfigManager:
                 absolute_path = os.path.join(self.project_root, results_path)
                 sonar_config['results_path'] = absolute_path
 
+        # Normalize LLM response cache path
+        cache_config = (self.config.get('autofix', {}) or {}).get('cache', {}) or {}
+        if cache_config.get('path') and not os.path.isabs(cache_config['path']):
+            cache_config['path'] = os.path.join(self.project_root, cache_config['path'])
+
+        # Normalize LLM usage metrics path
+        usage_config = (self.config.get('autofix', {}) or {}).get('usage', {}) or {}
+        if usage_config.get('metrics_path') and not os.path.isabs(usage_config['metrics_path']):
+            usage_config['metrics_path'] = os.path.join(self.project_root, usage_config['metrics_path'])
+
+        # Normalize embedded result store path
+        db_config = self.config.get('database', {}) or {}
+        for key in ('path', 'jobs_path'):
+            if db_config.get(key) and not os.path.isabs(db_config[key]):
+                db_config[key] = os.path.join(self.project_root, db_config[key])
+
         # Normalize local_clone_path for each repo
         for repo in self.config.get('github', {}).get('repos', []):
             clone_path = repo.get('local_clone_path', '')
@@ -52,27 +86,33 @@ class ConfigManager:
                 absolute_clone = os.path.join(self.project_root, clone_path)
                 repo['local_clone_path'] = absolute_clone
 
-    def save_config(self):
-        try:
-            with open(self.config_path, 'w') as f:
-                yaml.dump(self.config, f, default_flow_style=False)
-            logging.info("Config file updated.")
-        except Exception as e:
-            logging.error(f"Error writing config file: {e}")
-            sys.exit(1)
+    def state_path(self):
+        path = (self.config.get('run_state', {}) or {}).get('path') or DEFAULT_STATE_PATH
+        if not os.path.isabs(path):
+            path = os.path.join(self.project_root, path)
+        return path
+
+    def apply_run_state(self):
+        repos_state = self.state.load().get('repos', {})
+        for repo in self.config.get('github', {}).get('repos', []):
+            saved = repos_state.get(repo.get('repo_url'), {})
+            for key in REPO_STATE_FIELDS:
+                if saved.get(key) is not None:
+                    repo[key] = saved[key]
 
     def get_enabled_repos(self):
         repos = self.config.get('github', {}).get('repos', [])
         return [repo for repo in repos if repo.get('enabled', False)]
 
     def update_repo_entry(self, repo_url, key, value):
+        # Runtime values go to the run-state store; config.yaml is never rewritten
         updated = False
         for repo in self.config.get('github', {}).get('repos', []):
             if repo.get('repo_url') == repo_url:
                 repo[key] = value
                 updated = True
         if updated:
-            self.save_config()
+            self.state.update_repo(repo_url, **{key: value})
         else:
             logging.warning(f"Repo URL {repo_url} not found in config.")
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runtime state (detected stacks, phase results, last scanned commit, timings),
+kept out of config.yaml so the config stays read-only input.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+DEFAULT_STATE_PATH = os.path.join("results", "run_state.json")
+
+
+class RunStateStore:
+    """JSON state file shared by threads and processes.
+
+    Every update is a locked read-modify-write; the new file is written to a
+    temp file in the same directory and swapped in with os.replace, so readers
+    never see a half-written file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.thread_lock = threading.RLock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with self.thread_lock:
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {'repos': {}}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
+            logging.error(f"Run state file {self.path} is unreadable, starting fresh: {e}")
+            return {'repos': {}}
+
+    def _write(self, state):
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".run_state_", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f, indent=2, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self):
+        with self._locked():
+            return self._read()
+
+    def get_repo(self, repo_url):
+        return self.load().get('repos', {}).get(repo_url, {})
+
+    def update_repo(self, repo_url, **fields):
+        with self._locked():
+            state = self._read()
+            entry = state.setdefault('repos', {}).setdefault(repo_url, {})
+            entry.update(fields)
+            entry['updated_at'] = time.time()
+            self._write(state)
+        return entry
+
+    def record_phase(self, repo_url, phase, status, duration_sec=None, **extra):
+        with self._locked():
+            state = self._read()
+            entry = state.setdefault('repos', {}).setdefault(repo_url, {})
+            entry.setdefault('phases', {})[phase] = dict(
+                extra, status=status, finished_at=time.time(),
+                duration_sec=round(duration_sec, 3) if duration_sec is not None else None)
+            entry['updated_at'] = time.time()
+            self._write(state)
+
+    @contextmanager
+    def phase(self, repo_url, phase):
+        """Time a phase and record it as 'ok', or 'failed' with the error when it raises."""
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record_phase(repo_url, phase, 'failed', time.monotonic() - start, error=str(e))
+            raise
+        self.record_phase(repo_url, phase, 'ok', time.monotonic() - start)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_run_state(path):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = RunStateStore(path)
+        return _stores[path]